@@ -2,4 +2,6 @@ from .data_controller import DataController
 from .project_controller import ProjectController
 from.process_controller import ProcessController
 from .base_controller import BaseController
-from .nlp_controller import NLPController
\ No newline at end of file
+from .nlp_controller import NLPController
+from .upload_controller import UploadController
+from .snapshot_controller import SnapshotController
@@ -22,6 +22,26 @@ class BaseController():
             "database"
         )
 
+        # node local: resumable upload parts and the read-through cache of remote asset files
+        self.uploads_dir_path = os.path.join(
+            self.src_dir_path,
+            "assets",
+            "uploads"
+        )
+
+        self.cache_dir_path = os.path.join(
+            self.src_dir_path,
+            "assets",
+            "cache"
+        )
+
+        # node local staging of the index snapshot bundles (built / restored here)
+        self.snapshots_dir_path = os.path.join(
+            self.src_dir_path,
+            "assets",
+            "snapshots"
+        )
+
     def get_database_path(self, db_name: str):
         # to prevent classic concurrency bug known as a Race Condition,
         # specifically a "Time-of-Check to Time-of-Use" (TOCTOU) issue.
@@ -35,6 +55,16 @@ class BaseController():
         os.makedirs(database_path, exist_ok=True)
 
         return database_path
+
+    def get_cache_path(self, cache_name: str):
+        cache_path = os.path.join(
+            self.cache_dir_path,
+            cache_name
+        )
+
+        os.makedirs(cache_path, exist_ok=True)
+
+        return cache_path
         
     def generate_random_string(self, length: int=12):
             return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
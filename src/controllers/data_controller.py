@@ -1,13 +1,19 @@
-from .project_controller import ProjectController
 from .base_controller import BaseController
 from fastapi import UploadFile
 from enums import ResponseSignal
+from stores.storage.StorageInterface import StorageInterface
+from typing import BinaryIO
+import mimetypes
 import os
 import re
+import shutil
+import tempfile
+import zipfile
 class DataController(BaseController):
-    def __init__(self):
+    def __init__(self, storage_client: StorageInterface = None):
         super().__init__()
         self.size_scale = 1048576 # convert MB to bytes
+        self.storage_client = storage_client
 
 
     def validate_uploaded_file(self, file:UploadFile):
@@ -18,29 +24,98 @@ class DataController(BaseController):
             return False, ResponseSignal.FILE_SIZE_EXCEEDED.value
         
         return True, ResponseSignal.FILE_UPLOAD_SUCCESS.value
+
+    def is_archive_file(self, file: UploadFile):
+        return file.content_type in self.app_settings.BULK_UPLOAD_ARCHIVE_TYPES or \
+            (file.filename or "").lower().endswith(".zip")
+
+    def open_archive(self, file_obj: BinaryIO):
+        """
+        Open an uploaded zip archive (blocking), only its central directory is read.
+        The upload is copied to a plain temporary file first: the members are read concurrently,
+        which needs a seekable file, and an upload's SpooledTemporaryFile isn't one on python 3.10.
+        Returns (archive, archive_file), both to be closed. Raises zipfile.BadZipFile.
+        """
+        archive_file = tempfile.TemporaryFile()
+        try:
+            file_obj.seek(0)
+            shutil.copyfileobj(file_obj, archive_file)
+            return zipfile.ZipFile(archive_file), archive_file
+        except BaseException:
+            archive_file.close()
+            raise
+
+    def get_archive_members(self, archive: zipfile.ZipFile):
+        # regular files only: no directories, no OS metadata entries (__MACOSX/, .DS_Store ...)
+        return [
+            member for member in archive.infolist()
+            if not member.is_dir()
+            and not member.filename.startswith("__MACOSX/")
+            and not os.path.basename(member.filename).startswith(".")
+        ]
+
+    def validate_archive_member(self, member: zipfile.ZipInfo):
+        # archive members have no content type, it's guessed from their extension
+        content_type, _ = mimetypes.guess_type(member.filename)
+        if content_type not in self.app_settings.FILE_VALIDE_TYPES:
+            return False, ResponseSignal.FILE_TYPE_NOT_SUPPORTED.value
+
+        if member.file_size > self.app_settings.FILE_MAX_SIZE * self.size_scale:
+            return False, ResponseSignal.FILE_SIZE_EXCEEDED.value
+
+        return True, ResponseSignal.FILE_VALIDATED_SUCCESS.value
+
+    def save_file(self, file_obj: BinaryIO, orig_file_name: str, project_id: str, max_size: int):
+        """
+        Stream a file-like object into the asset storage (blocking, run it in a worker thread).
+        The real size is checked while streaming (declared sizes can't be trusted, e.g. zip bombs),
+        nothing is stored for a file going past `max_size` bytes.
+
+        Returns (is_saved, signal, file_id, file_size).
+        """
+        file_key, file_id = self.generate_unique_file_id(
+            orig_file_name=orig_file_name,
+            project_id=project_id
+        )
+
+        file_size = self.storage_client.write_fileobj(key=file_key, file_obj=file_obj, max_size=max_size)
+        if file_size is None:
+            return False, ResponseSignal.FILE_SIZE_EXCEEDED.value, None, None
+
+        return True, ResponseSignal.FILE_UPLOAD_SUCCESS.value, file_id, file_size
+
+    def save_archive_member(self, archive: zipfile.ZipFile, member: zipfile.ZipInfo,
+                            project_id: str, max_size: int):
+        # the member is decompressed while it's streamed, never fully in memory
+        with archive.open(member) as member_file:
+            return self.save_file(
+                file_obj=member_file,
+                orig_file_name=os.path.basename(member.filename),
+                project_id=project_id,
+                max_size=max_size,
+            )
     
-    def generate_unique_filepath(self, orig_file_name: str, project_id: str):
+    def generate_unique_file_id(self, orig_file_name: str, project_id: str):
 
         random_key = self.generate_random_string()
-        project_path = ProjectController().get_project_path(project_id=project_id)
 
         cleaned_file_name = self.get_clean_file_name(
             orig_file_name=orig_file_name
         )
 
-        new_file_path = os.path.join(
-            project_path,
-            random_key + "_" + cleaned_file_name
+        new_file_key = self.storage_client.get_object_key(
+            project_id=project_id,
+            file_id=random_key + "_" + cleaned_file_name
         )
 
-        while os.path.exists(new_file_path):
+        while self.storage_client.exists(new_file_key):
             random_key = self.generate_random_string()
-            new_file_path = os.path.join(
-                project_path,
-                random_key + "_" + cleaned_file_name
+            new_file_key = self.storage_client.get_object_key(
+                project_id=project_id,
+                file_id=random_key + "_" + cleaned_file_name
             )
 
-        return new_file_path, random_key + "_" + cleaned_file_name
+        return new_file_key, random_key + "_" + cleaned_file_name
 
     def get_clean_file_name(self, orig_file_name: str):
 
@@ -1,153 +1,458 @@
 from stores.llm.templates.template_parser import TemplateParser
+from stores.llm.templates.prompt_builder import PromptBuilder
 from .base_controller import BaseController
-from schemas import ProjectSchema, ChunkSchema
+from schemas import ProjectSchema, ChunkSchema, RetrievedDocumentSchema
 from stores.llm.LLMEnums import DocumentTypeEnum
+from stores.llm.EmbeddingBatcher import EmbeddingBatcher
+from stores.llm.EmbeddingClientPool import EmbeddingClientPool
+from utils import track_stage, observe_chunks, traced, SingleFlight, wait_for_deadline, get_call_timeout
+from utils import run_provider_call
 from typing import List
+from bson.objectid import ObjectId
+import asyncio
+import functools
+import logging
 import json
+import uuid
 
 class NLPController(BaseController):
 
     def __init__(self, vectordb_client, generation_client, 
-                 embedding_client, template_parser:TemplateParser):
+                 embedding_client, template_parser:TemplateParser,
+                 single_flight: SingleFlight = None,
+                 embedding_batcher: EmbeddingBatcher = None,
+                 embedding_clients: EmbeddingClientPool = None):
         super().__init__()
 
         self.vectordb_client = vectordb_client
         self.generation_client = generation_client
         self.embedding_client = embedding_client
         self.template_parser = template_parser
+        self.single_flight = single_flight
+        self.embedding_batcher = embedding_batcher
+        self.embedding_clients = embedding_clients
+
+        self.logger = logging.getLogger(__name__)
 
     def create_collection_name(self, project_id: str):
+        # alias of the project's live index version (or an unversioned collection built before them)
         return f"collection_{project_id}".strip()
+
+    def create_version_collection_name(self, project_id: str, version: int):
+        return f"{self.create_collection_name(project_id=project_id)}_v{version}"
+
+    def get_index_versions(self, project: ProjectSchema):
+        # [(version, collection name)] of the project's index versions, oldest first
+        prefix = f"{self.create_collection_name(project_id=project.project_id)}_v"
+        return sorted(
+            (int(collection.name[len(prefix):]), collection.name)
+            for collection in self.vectordb_client.list_all_collections().collections
+            if collection.name.startswith(prefix) and collection.name[len(prefix):].isdigit()
+        )
+
+    def get_collection_name(self, project: ProjectSchema):
+        # the live index version recorded on the project, read with its embedding model: a request
+        # that started before a swap keeps using the version (and model) it started with
+        project_index = project.project_index or {}
+        return project_index.get("collection_name") or self.create_collection_name(project_id=project.project_id)
+
+    def get_embedding_client(self, project: ProjectSchema):
+        # the live index is queried (and updated) with the model it was built with
+        project_index = project.project_index or {}
+        if self.embedding_clients is None or not project_index.get("embedding_model_id"):
+            return self.embedding_client
+
+        return self.embedding_clients.get(
+            backend=project_index.get("embedding_backend"),
+            model_id=project_index["embedding_model_id"],
+            embedding_size=project_index.get("embedding_size"),
+        ) or self.embedding_client
+
+    async def run_coalesced(self, operation: str, key_parts: tuple, func, **kwargs):
+        """
+        Await `func(**kwargs)` (a coroutine function) within the request deadline; when a single-flight
+        layer is set, identical concurrent calls (same `operation` and `key_parts`) share one execution.
+        """
+        if self.single_flight is None:
+            return await wait_for_deadline(func(**kwargs), operation=operation)
+
+        key = SingleFlight.make_key(operation, *key_parts)
+        # each caller waits within its own deadline: on expiry only this caller gives up,
+        # the shared call keeps going for the others
+        return await self.single_flight.do(key, operation, func, **kwargs)
+
+    async def embed_query(self, text: str, embedding_client=None):
+        embedding_client = embedding_client or self.embedding_client
+
+        # concurrent queries are sent to the provider together when a batcher is set (configured model only)
+        if self.embedding_batcher is not None and embedding_client is self.embedding_client:
+            embed = self.embedding_batcher.embed
+        else:
+            embed = functools.partial(run_provider_call, embedding_client.embed_text)
+
+        return await self.run_coalesced(
+            "query_embedding",
+            (embedding_client.embedding_model_id, SingleFlight.normalize_text(text)),
+            embed,
+            text=text,
+            document_type=DocumentTypeEnum.QUERY.value,
+        )
     
     def reset_vector_db_collection(self, project: ProjectSchema):
-        collection_name = self.create_collection_name(project_id=project.project_id)
+        collection_name = self.get_collection_name(project)
         return self.vectordb_client.delete_collection(collection_name=collection_name)
     
     def get_vector_db_collection_info(self, project: ProjectSchema):
-        collection_name = self.create_collection_name(project_id=project.project_id)
+        collection_name = self.get_collection_name(project)
         collection_info = self.vectordb_client.get_collection_info(collection_name=collection_name)
                 
         return json.loads(
             json.dumps(collection_info, default=lambda x: x.__dict__)
         )
     
+    def get_point_id(self, chunk_id: ObjectId):
+        # stable point id of a chunk (its ObjectId as a uuid), so an asset can be re-indexed on its own
+        return str(uuid.UUID(bytes=chunk_id.binary + bytes(4)))
+
+    def delete_asset_vectors(self, project: ProjectSchema, asset_id: ObjectId):
+        return self.delete_assets_vectors(project=project, asset_ids=[ asset_id ])
+
+    def delete_assets_vectors(self, project: ProjectSchema, asset_ids: List[ObjectId]):
+        collection_name = self.get_collection_name(project)
+        return self.vectordb_client.delete_by_filter(
+            collection_name=collection_name,
+            filters={ "asset_ids": [ str(asset_id) for asset_id in asset_ids ] },
+        )
+
+    def get_point_metadata(self, chunk: ChunkSchema):
+        point_metadata = dict(chunk.chunk_metadata or {})
+        if chunk.chunk_asset_id is not None:
+            point_metadata["asset_id"] = str(chunk.chunk_asset_id)
+        return point_metadata
+
+    def get_results_asset_ids(self, results: List[RetrievedDocumentSchema]):
+        return list({
+            result.metadata["asset_id"]
+            for result in results
+            if result.metadata and result.metadata.get("asset_id")
+        })
+
+    def hydrate_results_metadata(self, results: List[RetrievedDocumentSchema], documents_metadata: dict):
+        """
+        Search results as dicts, with their chunk metadata and the document metadata of their asset
+        (`documents_metadata`: {asset id: metadata}) under "document".
+        New dicts are built, the results may be shared with coalesced requests.
+        """
+        hydrated_results = []
+        for result in results:
+            metadata = dict(result.metadata or {})
+            if metadata.get("asset_id") in documents_metadata:
+                metadata["document"] = documents_metadata[metadata["asset_id"]]
+
+            hydrated_results.append({ **result.dict(exclude={"metadata"}), "metadata": metadata })
+
+        return hydrated_results
+
     def index_into_vector_db(self, project: ProjectSchema, chunks: List[ChunkSchema],
-                                   chunks_ids: List[int], 
-                                   do_reset: bool = False):
+                                   chunks_ids: List[str], 
+                                   do_reset: bool = False,
+                                   collection_name: str = None,
+                                   embedding_client=None):
         
-        # step1: get collection name
-        collection_name = self.create_collection_name(project_id=project.project_id)
+        # step1: get collection name (the live index, unless an index version is being built)
+        collection_name = collection_name or self.get_collection_name(project)
+        embedding_client = embedding_client or self.get_embedding_client(project)
 
         # step2: manage items
         texts = [ c.chunk_text for c in chunks ]
-        metadata = [ c.chunk_metadata for c in  chunks]
-        vectors = [
-            self.embedding_client.embed_text(text=text, 
-                                             document_type=DocumentTypeEnum.DOCUMENT.value)
-            for text in texts
-        ]
+        # points only carry the chunk's own fields, the document metadata is on its asset (see hydrate_results_metadata)
+        metadata = [ self.get_point_metadata(c) for c in chunks ]
+        observe_chunks(pipeline="index", count=len(texts))
+
+        with track_stage(pipeline="index", stage="document_embedding"), traced("rag.index.document_embedding"):
+            vectors = [
+                embedding_client.embed_text(text=text, 
+                                            document_type=DocumentTypeEnum.DOCUMENT.value)
+                for text in texts
+            ]
 
         # step3: create collection if not exists
-        _ = self.vectordb_client.create_collection(
-            collection_name=collection_name,
-            embedding_size=self.embedding_client.embedding_size,
-            do_reset=do_reset,
-        )
+        with track_stage(pipeline="index", stage="create_collection"), traced("rag.index.create_collection"):
+            _ = self.vectordb_client.create_collection(
+                collection_name=collection_name,
+                embedding_size=embedding_client.embedding_size,
+                do_reset=do_reset,
+            )
 
         # step4: insert into vector db
-        _ = self.vectordb_client.insert_many(
-            collection_name=collection_name,
-            texts=texts,
-            metadata=metadata,
-            vectors=vectors,
-            record_ids=chunks_ids,
-        )
+        with track_stage(pipeline="index", stage="vector_insert"), traced("rag.index.vector_insert"):
+            _ = self.vectordb_client.insert_many(
+                collection_name=collection_name,
+                texts=texts,
+                metadata=metadata,
+                vectors=vectors,
+                record_ids=chunks_ids,
+            )
 
         return True
 
-    def search_vector_db_collection(self, project: ProjectSchema, text: str, limit: int = 5):
+    def matches_nothing(self, filters: dict = None):
+        # the asset conditions matched no asset of the project, no need to search
+        return bool(filters) and filters.get("asset_ids") is not None and len(filters["asset_ids"]) == 0
+
+    def get_filters_key(self, filters: dict = None):
+        # canonical form of the search filters, part of the coalescing key
+        return json.dumps(filters, sort_keys=True) if filters else None
+
+    async def search_vector_db_collection(self, project: ProjectSchema, text: str, limit: int = 5,
+                                          pipeline: str = "search", filters: dict = None):
+
+        if self.matches_nothing(filters):
+            return False
 
         # step1: get collection name
-        collection_name = self.create_collection_name(project_id=project.project_id)
+        collection_name = self.get_collection_name(project)
+        embedding_client = self.get_embedding_client(project)
 
         # step2: get text embedding vector
-        vector = self.embedding_client.embed_text(text=text, 
-                                                 document_type=DocumentTypeEnum.QUERY.value)
+        with track_stage(pipeline=pipeline, stage="query_embedding"), traced(f"rag.{pipeline}.query_embedding"):
+            vector = await self.embed_query(text=text, embedding_client=embedding_client)
 
         if not vector or len(vector) == 0:
             return False
 
         # step3: do semantic search
-        results = self.vectordb_client.search_by_vector(
-            collection_name=collection_name,
-            vector=vector,
-            limit=limit
-        )
+        # (the vector only depends on the query text, so the text identifies the search)
+        with track_stage(pipeline=pipeline, stage="vector_search"), traced(f"rag.{pipeline}.vector_search"):
+            results = await self.run_coalesced(
+                "vector_search",
+                (collection_name, embedding_client.embedding_model_id, SingleFlight.normalize_text(text), limit,
+                 self.get_filters_key(filters)),
+                functools.partial(asyncio.to_thread, self.vectordb_client.search_by_vector),
+                collection_name=collection_name,
+                vector=vector,
+                limit=limit,
+                filters=filters,
+            )
 
         if not results or len(results) == 0:
             return False
 
+        observe_chunks(pipeline=pipeline, count=len(results))
+
         return results
 
-    def answer_rag_question(self, project: ProjectSchema, query: str, limit: int = 5, chat_history: list = None):
+    async def search_many_vector_db_collection(self, project: ProjectSchema, texts: List[str], limits: List[int],
+                                         pipeline: str = "batch_search", filters: dict = None):
+        """
+        Search several queries with one embedding call and one vector DB round trip.
+        Returns one list of documents per query (empty when nothing matched), in the request order.
+        """
+
+        if self.matches_nothing(filters):
+            return [ [] for _ in texts ]
+
+        # step1: get collection name
+        collection_name = self.get_collection_name(project)
+        embedding_client = self.get_embedding_client(project)
+
+        # step2: embed every distinct query text once
+        unique_texts = list(dict.fromkeys(texts))
+        with track_stage(pipeline=pipeline, stage="query_embedding"), traced(f"rag.{pipeline}.query_embedding"):
+            unique_vectors = await wait_for_deadline(
+                run_provider_call(embedding_client.embed_many, texts=unique_texts,
+                                  document_type=DocumentTypeEnum.QUERY.value),
+                operation="query_embedding",
+            )
+
+        if not unique_vectors or len(unique_vectors) != len(unique_texts):
+            return False
+
+        text_vectors = dict(zip(unique_texts, unique_vectors))
+
+        # step3: do all the semantic searches in a single batch
+        with track_stage(pipeline=pipeline, stage="vector_search"), traced(f"rag.{pipeline}.vector_search"):
+            batch_results = await wait_for_deadline(
+                asyncio.to_thread(self.vectordb_client.search_many,
+                                  collection_name=collection_name,
+                                  vectors=[ text_vectors[text] for text in texts ],
+                                  limits=limits,
+                                  filters=filters),
+                operation="vector_search",
+            )
+
+        if batch_results is None:
+            return False
+
+        for results in batch_results:
+            observe_chunks(pipeline=pipeline, count=len(results))
+
+        return batch_results
+
+    def normalize_scores(self, results: List[RetrievedDocumentSchema]) -> List[float]:
+        """
+        Min-max normalise one collection's scores to [0, 1], so results coming from
+        collections with different score ranges can be ranked together.
+        """
+        if not results:
+            return []
+
+        scores = [ result.score for result in results ]
+        min_score, max_score = min(scores), max(scores)
+        if max_score == min_score:
+            return [ 1.0 for _ in scores ]
+
+        return [ (score - min_score) / (max_score - min_score) for score in scores ]
+
+    async def federated_search_vector_db_collections(self, projects: List[ProjectSchema], text: str,
+                                                     limit: int = 5, per_project_limit: int = None,
+                                                     timeout_seconds: float = 2.0,
+                                                     pipeline: str = "federated_search"):
+        """
+        Embed the query once (per embedding model of the projects' indexes) and search every project
+        collection concurrently.
+        A project that doesn't answer within `timeout_seconds` is reported as timed out
+        instead of delaying the whole response.
+
+        Returns the global top-`limit` results (merged by normalised score) and a status per project.
+        """
+        per_project_limit = per_project_limit or limit
+
+        # step1: get text embedding vector (once for all the projects sharing an embedding model)
+        projects_clients = { project.project_id: self.get_embedding_client(project) for project in projects }
+        embedding_clients = { id(client): client for client in projects_clients.values() }
+
+        with track_stage(pipeline=pipeline, stage="query_embedding"), traced(f"rag.{pipeline}.query_embedding"):
+            client_vectors = await asyncio.gather(*[
+                self.embed_query(text=text, embedding_client=client)
+                for client in embedding_clients.values()
+            ])
+
+        if any(not vector or len(vector) == 0 for vector in client_vectors):
+            return False
+
+        vectors = dict(zip(embedding_clients.keys(), client_vectors))
+
+        # step2: fan out, the vector db client is blocking so each search runs in a worker thread
+        async def search_project(project: ProjectSchema):
+            collection_name = self.get_collection_name(project)
+            search_call = asyncio.to_thread(
+                self.vectordb_client.search_by_vector,
+                collection_name=collection_name,
+                vector=vectors[id(projects_clients[project.project_id])],
+                limit=per_project_limit,
+            )
+
+            try:
+                # the per project timeout never goes past the request deadline
+                results = await asyncio.wait_for(search_call, timeout=get_call_timeout(default=timeout_seconds))
+            except asyncio.TimeoutError:
+                self.logger.warning(f"Federated search timed out for collection: {collection_name}")
+                return project, "timeout", []
+            except Exception as e:
+                self.logger.error(f"Federated search failed for collection: {collection_name}: {e}")
+                return project, "error", []
+
+            return project, "ok", results or []
+
+        with track_stage(pipeline=pipeline, stage="vector_search"), traced(f"rag.{pipeline}.vector_search",
+                                                                           {"rag.projects_count": len(projects)}):
+            projects_results = await asyncio.gather(*[ search_project(project) for project in projects ])
+
+        # step3: merge by normalised score and keep the global top-k
+        merged_results, projects_status = [], []
+        for project, search_status, results in projects_results:
+            projects_status.append({
+                "project_id": project.project_id,
+                "status": search_status,
+                "results_count": len(results),
+            })
+
+            for result, normalized_score in zip(results, self.normalize_scores(results)):
+                merged_results.append({
+                    "project_id": project.project_id,
+                    "text": result.text,
+                    "score": result.score,
+                    "normalized_score": normalized_score,
+                })
+
+        merged_results.sort(key=lambda result: (result["normalized_score"], result["score"]), reverse=True)
+        merged_results = merged_results[:limit]
+
+        observe_chunks(pipeline=pipeline, count=len(merged_results))
+
+        return merged_results, projects_status
+
+    async def answer_rag_question(self, project: ProjectSchema, query: str, limit: int = 5, chat_history: list = None,
+                                  filters: dict = None):
         
         answer, full_prompt, final_chat_history = None, None, None
 
         # step1: retrieve related documents 
-        retrieved_documents = self.search_vector_db_collection(
+        retrieved_documents = await self.search_vector_db_collection(
             project=project,
             text=query,
-            limit=limit
+            limit=limit,
+            pipeline="answer",
+            filters=filters,
         )
 
         # validation
         if not retrieved_documents or len(retrieved_documents) == 0:
             return answer, full_prompt, final_chat_history
         
-        # step2: construct the LLM Prompt 
-        system_prompt = self.template_parser.get(
-            group="rag",
-            key="system_prompt",
-            vars={
-                # empty
-            }
-        )
-        
-        documents_prompt = "\n".join([ # to enventually get all chunks in the list "be joined".
-            self.template_parser.get(
-                group="rag",
-                key="document_prompt",
-                vars={
-                    "doc_num": indx + 1, # to start from 1
-                    "chunk_text": doc.text,
-                }
+        # step2: construct the LLM Prompt within the token budget
+        # (system prompt + trimmed chat history + best scoring documents + footer)
+        with track_stage(pipeline="answer", stage="prompt_construction"), traced("rag.answer.prompt_construction"):
+            prompt_builder = PromptBuilder(
+                template_parser=self.template_parser,
+                generation_client=self.generation_client,
+                max_prompt_tokens=self.app_settings.PROMPT_MAX_TOKENS,
+                max_history_tokens=self.app_settings.PROMPT_HISTORY_MAX_TOKENS,
+                min_document_tokens=self.app_settings.PROMPT_MIN_DOCUMENT_TOKENS,
             )
 
-            for indx, doc in enumerate(retrieved_documents)
-        ])
-        
-        footer_prompt = self.template_parser.get("rag", "footer_prompt", vars={"query": query})
-
-        
-        # step3: Construct Generation Client Prompts
-        # Use provided chat_history or create new one with system prompt
-        if chat_history is None or len(chat_history) == 0:
-            final_chat_history = [
-                self.generation_client.construct_prompt(
-                    prompt=system_prompt,
-                    role=self.generation_client.enums.SYSTEM.value,
+            try:
+                final_chat_history, full_prompt = prompt_builder.build(
+                    query=query,
+                    retrieved_documents=retrieved_documents,
+                    chat_history=chat_history,
                 )
-            ]
-        else:
-            # Use the chat history provided by the client
-            final_chat_history = chat_history
+            except ValueError as e:
+                self.logger.warning(f"Could not build the answer prompt: {e}")
+                return None, None, None
 
-        full_prompt = "\n\n".join([documents_prompt, footer_prompt])
+        # step3: Retrieve the Answer
+        # the prompt and history fully determine the generation, so identical concurrent
+        # questions share one provider call (each caller gets its own copy of the history)
+        with track_stage(pipeline="answer", stage="generation"), traced("rag.answer.generation"):
+            answer, generation_chat_history = await self.run_coalesced(
+                "generation",
+                (self.generation_client.generation_model_id, full_prompt, final_chat_history),
+                functools.partial(run_provider_call, self.generate_answer),
+                prompt=full_prompt,
+                chat_history=final_chat_history,
+            )
+            final_chat_history = list(generation_chat_history)
 
-        # step4: Retrieve the Answer
-        answer = self.generation_client.generate_text(
-            prompt=full_prompt,
-            chat_history=final_chat_history
-        )
+        return answer, full_prompt, final_chat_history
+
+    def generate_answer(self, prompt: str, chat_history: list):
+        # the provider appends the prompt to the history it's given, work on a copy
+        chat_history = list(chat_history)
+        answer = self.generation_client.generate_text(prompt=prompt, chat_history=chat_history)
+        return answer, chat_history
 
-        return answer, full_prompt, final_chat_history
\ No newline at end of file
+    def construct_session_turn(self, query: str, answer: str):
+        # only the user's query and the answer are kept in the session, the retrieved
+        # documents are re-fetched (and re-packed) for every new turn
+        return [
+            self.generation_client.construct_prompt(
+                prompt=query,
+                role=self.generation_client.enums.USER.value,
+            ),
+            self.generation_client.construct_prompt(
+                prompt=answer,
+                role=self.generation_client.enums.ASSISTANT.value,
+            ),
+        ]
\ No newline at end of file
@@ -1,17 +1,32 @@
 import os
 from .base_controller import BaseController
-from .project_controller import ProjectController
+from stores.storage.StorageInterface import StorageInterface
 from langchain_community.document_loaders import TextLoader # type: ignore
 from langchain_community.document_loaders import PyMuPDFLoader # type: ignore
 from enums import ProcessingEnum
 from langchain_text_splitters import RecursiveCharacterTextSplitter # type: ignore
+from bson.objectid import ObjectId
+import numpy as np # type: ignore
+import re
+import zlib
 
 class ProcessController(BaseController):
 
-    def __init__(self, project_id:str):
+    FINGERPRINT_BITS = 64
+    FINGERPRINT_MASK = (1 << FINGERPRINT_BITS) - 1
+    SHINGLE_SIZE = 3 # words
+    WORD_PATTERN = re.compile(r"\w+")
+
+    # metadata kept on every chunk (and vector db point), the rest describes the document
+    # and is stored once on its asset
+    CHUNK_METADATA_KEYS = ("page", "start_index")
+    # the loaders' local paths (storage or cache paths) mean nothing outside the worker, they're dropped
+    DROPPED_METADATA_KEYS = ("source", "file_path")
+
+    def __init__(self, project_id:str, storage_client: StorageInterface):
         super().__init__()
         self.project_id= project_id
-        self.project_path = ProjectController().get_project_path(project_id=project_id)
+        self.storage_client = storage_client
 
     
     def get_file_extension(self, file_id:str):
@@ -19,18 +34,10 @@ class ProcessController(BaseController):
 
 
     # 1. Instantiate the loader with the file path
-    def get_file_loader(self, file_id:str):
+    def get_file_loader(self, file_id:str, file_path:str):
 
         file_ext = self.get_file_extension(file_id=file_id)
         
-        file_path = os.path.join(
-            self.project_path,
-            file_id
-        )
-
-        if not os.path.exists(file_path):
-            return None
-        
         if file_ext == ProcessingEnum.TXT.value:
             return TextLoader(file_path, encoding="utf-8")
 
@@ -42,12 +49,24 @@ class ProcessController(BaseController):
     # 2. "Load" the data (Fetch -> Parse -> Standardize)
     def get_file_content(self,file_id:str):
 
-        loader = self.get_file_loader(file_id=file_id)
-       
-        if loader is None:
+        # the loaders need a local file: the storage's own path, or its read-through cache copy
+        # (kept from eviction until loaded)
+        file_key = self.storage_client.get_object_key(project_id=self.project_id, file_id=file_id)
+        file_path = self.storage_client.get_local_path(file_key)
+
+        if file_path is None:
             return None
-        
-        docs = loader.load()
+
+        try:
+            loader = self.get_file_loader(file_id=file_id, file_path=file_path)
+
+            if loader is None:
+                return None
+
+            docs = loader.load()
+        finally:
+            self.storage_client.release_local_path(file_key)
+
         return docs # Result: docs is a list of Document objects
     
     
@@ -60,6 +79,7 @@ class ProcessController(BaseController):
             chunk_size=chunk_size,
             chunk_overlap=overlap_size,
             length_function=len,
+            add_start_index=True, # chunk offset in its page (or text file)
         )
 
         file_content_texts = [ # list compreh.
@@ -81,4 +101,150 @@ class ProcessController(BaseController):
         # The splitter is smart enough to handle the list of Documents directly.
         # chunks = text_splitter.split_documents(docs)
         
-        return chunks
\ No newline at end of file
+        return chunks
+
+    def split_document_metadata(self, chunks: list):
+        """
+        Split the chunks' metadata into the document metadata (stored once on the asset) and
+        the per chunk metadata (CHUNK_METADATA_KEYS, plus any other field whose value changes
+        from a chunk to another).
+
+        Returns (document metadata, [chunk metadata]).
+        """
+        chunks_metadata = [ dict(chunk.metadata or {}) for chunk in chunks ]
+
+        document_metadata = {}
+        if chunks_metadata:
+            shared_keys = set(chunks_metadata[0]).difference(self.CHUNK_METADATA_KEYS, self.DROPPED_METADATA_KEYS)
+            for key in sorted(shared_keys):
+                value = chunks_metadata[0][key]
+                if all(key in metadata and metadata[key] == value for metadata in chunks_metadata):
+                    document_metadata[key] = value
+
+        for metadata in chunks_metadata:
+            for key in list(metadata):
+                if key in document_metadata or key in self.DROPPED_METADATA_KEYS:
+                    del metadata[key]
+
+        # the loaders fill the missing document fields with empty strings
+        document_metadata = { key: value for key, value in document_metadata.items() if value not in ("", None) }
+
+        return document_metadata, chunks_metadata
+
+    # near-duplicate detection (SimHash): chunks whose 64 bit fingerprints differ by at most
+    # CHUNK_DEDUP_MAX_DISTANCE bits are the same text up to small edits (numbering, names, dates ...)
+
+    def get_shingles(self, text: str):
+        words = self.WORD_PATTERN.findall(text.lower())
+        if len(words) <= self.SHINGLE_SIZE:
+            return [ " ".join(words) ] if words else []
+
+        return [
+            " ".join(words[idx:idx + self.SHINGLE_SIZE])
+            for idx in range(len(words) - self.SHINGLE_SIZE + 1)
+        ]
+
+    def get_fingerprint(self, text: str):
+        """
+        SimHash of the text's word shingles, as a signed 64 bit int (mongo's int64), None without words.
+        The shingle hashes are stable across processes (crc32 based), fingerprints are persisted.
+        """
+        shingles = self.get_shingles(text)
+        if not shingles:
+            return None
+
+        shingle_hashes = np.array([
+            (zlib.crc32(encoded) << 32) | zlib.crc32(encoded, 0x9E3779B9)
+            for encoded in ( shingle.encode("utf-8") for shingle in shingles )
+        ], dtype=np.uint64)
+
+        # a bit is set when it's set in most of the shingle hashes
+        bits = (shingle_hashes[:, None] >> np.arange(self.FINGERPRINT_BITS, dtype=np.uint64)) & np.uint64(1)
+        majority_bits = bits.sum(axis=0) * 2 > len(shingles)
+
+        fingerprint = 0
+        for bit in np.flatnonzero(majority_bits):
+            fingerprint |= 1 << int(bit)
+
+        return fingerprint - (1 << self.FINGERPRINT_BITS) if fingerprint >> (self.FINGERPRINT_BITS - 1) else fingerprint
+
+    def get_fingerprint_bands(self, fingerprint: int):
+        """
+        Split the fingerprint in max distance + 1 bands: two fingerprints within the max distance
+        always have a band in common, so the bands are enough to look the candidates up.
+        (changing CHUNK_DEDUP_MAX_DISTANCE changes the bands, reprocess the projects with do_reset)
+        """
+        bands_count = min(max(self.app_settings.CHUNK_DEDUP_MAX_DISTANCE, 0) + 1, self.FINGERPRINT_BITS)
+        band_width = self.FINGERPRINT_BITS // bands_count
+
+        fingerprint &= self.FINGERPRINT_MASK
+        bands = []
+        for band_idx in range(bands_count):
+            # the last band takes the remaining bits
+            width = band_width if band_idx < bands_count - 1 else self.FINGERPRINT_BITS - band_width * band_idx
+            band_bits = (fingerprint >> (band_idx * band_width)) & ((1 << width) - 1)
+            bands.append(f"{band_idx}:{band_bits:x}")
+
+        return bands
+
+    def get_fingerprint_distance(self, fingerprint: int, other_fingerprint: int):
+        return bin((fingerprint ^ other_fingerprint) & self.FINGERPRINT_MASK).count("1")
+
+    def fingerprint_chunk_records(self, records: list):
+        """
+        Add the fingerprint and its bands to the chunk records (CPU bound, run it in a worker thread).
+        Returns the bands of all the records, to look the project's known chunks up.
+        """
+        all_bands = set()
+        for record in records:
+            fingerprint = self.get_fingerprint(record["chunk_text"])
+            if fingerprint is None:
+                continue
+
+            record["chunk_fingerprint"] = fingerprint
+            record["chunk_fingerprint_bands"] = self.get_fingerprint_bands(fingerprint)
+            all_bands.update(record["chunk_fingerprint_bands"])
+
+        return list(all_bands)
+
+    def mark_near_duplicates(self, records: list, known_chunks: list):
+        """
+        Point every near-duplicate record to its canonical chunk (`chunk_duplicate_of`): one of the
+        project's `known_chunks` ([{_id, chunk_fingerprint, chunk_fingerprint_bands}]) or an earlier
+        record of the same batch. Canonical records get their _id here, so later ones can reference them.
+
+        Returns the number of duplicates.
+        """
+        max_distance = self.app_settings.CHUNK_DEDUP_MAX_DISTANCE
+
+        # {band: [(chunk id, fingerprint)]}
+        band_index = {}
+        def index_chunk(chunk_id, fingerprint: int, bands: list):
+            for band in bands:
+                band_index.setdefault(band, []).append((chunk_id, fingerprint))
+
+        for chunk in known_chunks:
+            index_chunk(chunk["_id"], chunk["chunk_fingerprint"], chunk["chunk_fingerprint_bands"])
+
+        duplicates_count = 0
+        for record in records:
+            fingerprint = record.get("chunk_fingerprint")
+            if fingerprint is None:
+                continue
+
+            canonical_id = next((
+                chunk_id
+                for band in record["chunk_fingerprint_bands"]
+                for chunk_id, other_fingerprint in band_index.get(band, [])
+                if self.get_fingerprint_distance(fingerprint, other_fingerprint) <= max_distance
+            ), None)
+
+            if canonical_id is not None:
+                record["chunk_duplicate_of"] = canonical_id
+                duplicates_count += 1
+                continue
+
+            record["_id"] = ObjectId()
+            index_chunk(record["_id"], fingerprint, record["chunk_fingerprint_bands"])
+
+        return duplicates_count
@@ -0,0 +1,176 @@
+from .base_controller import BaseController
+from stores.storage.StorageInterface import StorageInterface
+from datetime import datetime
+import bson # type: ignore
+import numpy as np # type: ignore
+import json
+import os
+import shutil
+import tarfile
+import uuid
+
+class SnapshotController(BaseController):
+    """
+    Index snapshot bundles: a project's asset and chunk documents plus the points of its live index,
+    in one uncompressed tar, so a node restores a project without parsing nor embedding anything
+    (the restore only reads the bundle sequentially):
+
+    - `manifest.json`: format version, source project, embedding model and counts
+    - `assets.bson`, `chunks.bson`: the raw documents (mongodump like, ObjectIds and dates are kept)
+    - `points.jsonl`: point id and payload, one point per line
+    - `vectors.f32`: the points' vectors in the same order, float32 (points count x embedding size)
+
+    Bundles are built in a node local staging directory and kept in the asset storage
+    (a shared bucket makes them available to every node).
+    """
+
+    FORMAT_VERSION = 1
+
+    MANIFEST_NAME = "manifest.json"
+    ASSETS_NAME = "assets.bson"
+    CHUNKS_NAME = "chunks.bson"
+    POINTS_NAME = "points.jsonl"
+    VECTORS_NAME = "vectors.f32"
+    BUNDLE_NAME = "snapshot.tar"
+
+    def __init__(self, project_id: str, storage_client: StorageInterface = None):
+        super().__init__()
+        self.project_id = project_id
+        self.storage_client = storage_client
+
+    def generate_snapshot_id(self):
+        return f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{self.generate_random_string(length=8)}"
+
+    def get_snapshot_key(self, snapshot_id: str):
+        # "_" can't start a project id, snapshots never mix with the project files
+        return f"_snapshots/{self.project_id}/{snapshot_id}.tar"
+
+    def create_staging_path(self):
+        staging_path = os.path.join(self.snapshots_dir_path, self.project_id, uuid.uuid4().hex)
+        os.makedirs(staging_path, exist_ok=True)
+        return staging_path
+
+    def remove_staging_path(self, staging_path: str):
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    # export
+
+    def append_documents(self, staging_path: str, member_name: str, documents: list):
+        with open(os.path.join(staging_path, member_name), "ab") as f:
+            for document in documents:
+                f.write(bson.encode(document))
+
+    def write_points(self, staging_path: str, vectordb_client, collection_name: str, batch_size: int):
+        """
+        Dump the collection's points (scrolled by batches) into the points / vectors members.
+        Returns (points count, embedding size).
+        """
+        points_count, embedding_size = 0, None
+
+        with open(os.path.join(staging_path, self.POINTS_NAME), "w", encoding="utf-8") as points_file, \
+             open(os.path.join(staging_path, self.VECTORS_NAME), "wb") as vectors_file:
+
+            for batch in vectordb_client.scroll_points(collection_name=collection_name, batch_size=batch_size):
+                for point_id, _, payload in batch:
+                    points_file.write(json.dumps({ "id": point_id, "payload": payload }, ensure_ascii=False) + "\n")
+
+                vectors = np.asarray([ vector for _, vector, _ in batch ], dtype=np.float32)
+                embedding_size = vectors.shape[1]
+                vectors_file.write(vectors.tobytes())
+                points_count += len(batch)
+
+        return points_count, embedding_size
+
+    def write_bundle(self, staging_path: str, manifest: dict):
+        # the manifest goes first: a restore checks it before reading anything else
+        with open(os.path.join(staging_path, self.MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, default=lambda value: value.isoformat())
+
+        bundle_path = os.path.join(staging_path, self.BUNDLE_NAME)
+        with tarfile.open(bundle_path, "w", format=tarfile.PAX_FORMAT) as bundle:
+            for member_name in (self.MANIFEST_NAME, self.ASSETS_NAME, self.CHUNKS_NAME,
+                                self.POINTS_NAME, self.VECTORS_NAME):
+                member_path = os.path.join(staging_path, member_name)
+                if not os.path.exists(member_path):
+                    open(member_path, "wb").close()
+                bundle.add(member_path, arcname=member_name)
+                os.remove(member_path)
+
+        return bundle_path
+
+    def store_bundle(self, bundle_path: str, snapshot_id: str):
+        return self.storage_client.put_file(key=self.get_snapshot_key(snapshot_id), local_path=bundle_path, move=True)
+
+    # restore
+
+    def get_bundle_path(self, snapshot_id: str):
+        # a local copy of a stored bundle (the file itself for a local storage), None when unknown
+        return self.storage_client.get_local_path(self.get_snapshot_key(snapshot_id))
+
+    def release_bundle_path(self, snapshot_id: str):
+        # the bundle is read, its cache copy can be evicted
+        self.storage_client.release_local_path(self.get_snapshot_key(snapshot_id))
+
+    def read_manifest(self, bundle_path: str):
+        """
+        Returns the bundle manifest, None when it isn't a snapshot bundle this version can restore.
+        """
+        try:
+            with tarfile.open(bundle_path, "r:") as bundle:
+                manifest_file = bundle.extractfile(self.MANIFEST_NAME)
+                manifest = json.load(manifest_file)
+        except (tarfile.TarError, KeyError, ValueError, OSError):
+            return None
+
+        if manifest.get("format_version") != self.FORMAT_VERSION:
+            return None
+
+        return manifest
+
+    def iter_batches(self, documents_file, batch_size: int):
+        batch = []
+        for document in bson.decode_file_iter(documents_file):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def iter_documents(self, bundle_path: str, member_name: str, batch_size: int):
+        with tarfile.open(bundle_path, "r:") as bundle:
+            yield from self.iter_batches(bundle.extractfile(member_name), batch_size)
+
+    def iter_staged_documents(self, staging_path: str, member_name: str, batch_size: int):
+        # documents appended to a staging directory (see append_documents), e.g. the ones a restore replaces
+        member_path = os.path.join(staging_path, member_name)
+        if not os.path.exists(member_path):
+            return
+
+        with open(member_path, "rb") as f:
+            yield from self.iter_batches(f, batch_size)
+
+    def iter_points(self, bundle_path: str, embedding_size: int, batch_size: int):
+        # batches of (point ids, payloads, vectors), read side by side from the points and vectors members
+        vector_bytes = embedding_size * np.dtype(np.float32).itemsize
+
+        with tarfile.open(bundle_path, "r:") as bundle:
+            points_file = bundle.extractfile(self.POINTS_NAME)
+            vectors_file = bundle.extractfile(self.VECTORS_NAME)
+
+            while True:
+                lines = [ line for line in (points_file.readline() for _ in range(batch_size)) if line ]
+                if not lines:
+                    break
+
+                points = [ json.loads(line) for line in lines ]
+                vectors = np.frombuffer(vectors_file.read(vector_bytes * len(points)), dtype=np.float32)
+                if vectors.size != embedding_size * len(points):
+                    raise ValueError("The snapshot vectors don't match its points")
+
+                yield (
+                    [ point["id"] for point in points ],
+                    [ point["payload"] for point in points ],
+                    vectors.reshape(len(points), embedding_size).tolist(),
+                )
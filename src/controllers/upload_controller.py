@@ -0,0 +1,247 @@
+from .base_controller import BaseController
+from enums import ResponseSignal
+from stores.storage.StorageInterface import StorageInterface
+import aiofiles # async file handling lib
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import time
+import uuid
+
+class UploadController(BaseController):
+    """
+    Resumable uploads on disk: every byte range (part) received for an upload is its own file,
+    `<uploads path>/<project_id>/<upload_id>/<start>-<end>.part` (end excluded), so parts can be sent
+    in parallel, re-sent after a dropped connection, and the received offsets are known from the
+    part names alone. The parts are staged on the node's disk (uploads of a session must reach the
+    same node, or a shared volume), the assembled file is then handed to the asset storage.
+    """
+
+    ASSEMBLED_FILE_NAME = "assembled"
+    PART_NAME_PATTERN = re.compile(r"^(\d+)-(\d+)\.part$")
+    CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+    def __init__(self, project_id: str, storage_client: StorageInterface = None):
+        super().__init__()
+        self.project_id = project_id
+        self.storage_client = storage_client
+        self.size_scale = 1048576 # convert MB to bytes
+
+    def get_upload_path(self, upload_id: str):
+        upload_path = os.path.join(self.uploads_dir_path, self.project_id, upload_id)
+        os.makedirs(upload_path, exist_ok=True)
+        return upload_path
+
+    def validate_upload(self, file_name: str, file_size: int):
+        # the file is never seen as a whole before completion, its type is guessed from its name
+        content_type, _ = mimetypes.guess_type(file_name)
+        if content_type not in self.app_settings.FILE_VALIDE_TYPES:
+            return False, ResponseSignal.FILE_TYPE_NOT_SUPPORTED.value
+
+        if file_size <= 0 or file_size > self.app_settings.RESUMABLE_UPLOAD_MAX_SIZE * self.size_scale:
+            return False, ResponseSignal.FILE_SIZE_EXCEEDED.value
+
+        return True, ResponseSignal.FILE_VALIDATED_SUCCESS.value
+
+    def parse_content_range(self, content_range: str, file_size: int):
+        """
+        Parse a `Content-Range: bytes <first>-<last>/<file size>` header (last byte included),
+        returns the part (start, end) with end excluded, None when it's not a valid range of the file.
+        """
+        match = self.CONTENT_RANGE_PATTERN.match((content_range or "").strip())
+        if match is None:
+            return None
+
+        first_byte, last_byte, total_size = ( int(value) for value in match.groups() )
+        if total_size != file_size or first_byte > last_byte or last_byte >= file_size:
+            return None
+
+        if last_byte - first_byte + 1 > self.app_settings.RESUMABLE_UPLOAD_MAX_PART_SIZE * self.size_scale:
+            return None
+
+        return first_byte, last_byte + 1
+
+    async def save_part(self, upload_id: str, start: int, end: int, stream, checksum: str = None):
+        """
+        Write a part from the request body `stream`, chunk by chunk.
+        It's written to a temporary file first and only renamed into place once complete
+        (and matching `checksum`, when given), so a dropped connection never leaves a partial part.
+
+        Returns (is_saved, signal).
+        """
+        upload_path = self.get_upload_path(upload_id=upload_id)
+        part_path = os.path.join(upload_path, f"{start}-{end}.part")
+        temp_path = f"{part_path}.{uuid.uuid4().hex}.tmp"
+
+        part_size = end - start
+        received_size = 0
+        part_hash = hashlib.sha256()
+
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                async for chunk in stream:
+                    received_size += len(chunk)
+                    if received_size > part_size:
+                        break
+                    part_hash.update(chunk)
+                    await f.write(chunk)
+
+            if received_size != part_size:
+                return False, ResponseSignal.UPLOAD_PART_INVALID.value
+
+            if checksum and part_hash.hexdigest() != checksum.lower():
+                return False, ResponseSignal.UPLOAD_PART_CHECKSUM_MISMATCH.value
+
+            os.replace(temp_path, part_path)
+
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return True, ResponseSignal.UPLOAD_PART_RECEIVED.value
+
+    def get_parts(self, upload_id: str):
+        # [(start, end, part path)] sorted by offset, the longest part first for the same start
+        upload_path = self.get_upload_path(upload_id=upload_id)
+
+        parts = []
+        for part_name in os.listdir(upload_path):
+            match = self.PART_NAME_PATTERN.match(part_name)
+            if match:
+                start, end = int(match.group(1)), int(match.group(2))
+                parts.append((start, end, os.path.join(upload_path, part_name)))
+
+        return sorted(parts, key=lambda part: (part[0], -part[1]))
+
+    def get_received_ranges(self, upload_id: str):
+        # merged [start, end) ranges of the received bytes
+        ranges = []
+        for start, end, _ in self.get_parts(upload_id=upload_id):
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+
+        return ranges
+
+    def get_missing_ranges(self, received_ranges: list, file_size: int):
+        missing_ranges, offset = [], 0
+        for start, end in received_ranges:
+            if start > offset:
+                missing_ranges.append([offset, start])
+            offset = max(offset, end)
+
+        if offset < file_size:
+            missing_ranges.append([offset, file_size])
+
+        return missing_ranges
+
+    def assemble_file(self, upload_id: str, file_size: int):
+        """
+        Assemble the parts into one staged file (blocking, run it in a worker thread).
+        The first part is renamed into the file and the next ones are appended to it
+        with copy_file_range (kernel side copy, no round trip through user space where supported).
+
+        Returns the assembled file path, None when bytes are missing.
+        """
+        parts = self.get_parts(upload_id=upload_id)
+        if not parts or parts[0][0] != 0:
+            return None
+
+        file_path = os.path.join(self.get_upload_path(upload_id=upload_id), self.ASSEMBLED_FILE_NAME)
+
+        # a single part upload is just moved, without any copy
+        _, offset, first_part_path = parts[0]
+        first_part_size = offset
+        os.replace(first_part_path, file_path)
+
+        try:
+            with open(file_path, "r+b") as target_file:
+                for start, end, part_path in parts[1:]:
+                    if end <= offset:
+                        continue # re-sent or overlapping range, already written
+                    if start > offset:
+                        raise ValueError(f"Missing bytes {offset}-{start} in upload {upload_id}")
+
+                    with open(part_path, "rb") as part_file:
+                        self.copy_range(part_file, target_file, source_offset=offset - start,
+                                        target_offset=offset, count=end - offset)
+                    offset = end
+
+                target_file.truncate(offset)
+
+            if offset != file_size:
+                raise ValueError(f"Upload {upload_id} has {offset} bytes out of {file_size}")
+
+        except ValueError:
+            # give the first part back, the upload can still be completed
+            with open(file_path, "r+b") as target_file:
+                target_file.truncate(first_part_size)
+            os.replace(file_path, first_part_path)
+            return None
+
+        return file_path
+
+    def copy_range(self, source_file, target_file, source_offset: int, target_offset: int, count: int):
+        if hasattr(os, "copy_file_range"):
+            try:
+                while count > 0:
+                    copied = os.copy_file_range(source_file.fileno(), target_file.fileno(), count,
+                                                source_offset, target_offset)
+                    if copied == 0:
+                        raise ValueError("Unexpected end of upload part")
+                    source_offset, target_offset, count = source_offset + copied, target_offset + copied, count - copied
+                return
+            except OSError:
+                pass # not supported by this filesystem, fall back to a buffered copy
+
+        source_file.seek(source_offset)
+        target_file.seek(target_offset)
+        while count > 0:
+            chunk = source_file.read(min(self.app_settings.MAX_CHUNK_SIZE, count))
+            if not chunk:
+                raise ValueError("Unexpected end of upload part")
+            target_file.write(chunk)
+            count -= len(chunk)
+
+    def get_file_checksum(self, file_path: str):
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while chunk := f.read(self.app_settings.MAX_CHUNK_SIZE):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def store_file(self, file_path: str, file_key: str):
+        # the assembled file is consumed: renamed into a local storage, uploaded to a remote one
+        return self.storage_client.put_file(key=file_key, local_path=file_path, move=True)
+
+    def remove_upload(self, upload_id: str):
+        shutil.rmtree(os.path.join(self.uploads_dir_path, self.project_id, upload_id), ignore_errors=True)
+
+    @classmethod
+    def remove_expired_uploads(cls, ttl_seconds: int):
+        """
+        Remove the parts of abandoned uploads: no part received for `ttl_seconds`
+        (the upload session record itself is expired by mongo's TTL index).
+        """
+        uploads_dir_path = BaseController().uploads_dir_path
+        if not os.path.exists(uploads_dir_path):
+            return 0
+
+        removed_uploads = 0
+        expired_before = time.time() - ttl_seconds
+        for project_id in os.listdir(uploads_dir_path):
+            uploads_path = os.path.join(uploads_dir_path, project_id)
+            if not os.path.isdir(uploads_path):
+                continue
+
+            for upload_id in os.listdir(uploads_path):
+                upload_path = os.path.join(uploads_path, upload_id)
+                # a new part (renamed into the directory) updates its mtime
+                if os.path.getmtime(upload_path) < expired_before:
+                    shutil.rmtree(upload_path, ignore_errors=True)
+                    removed_uploads += 1
+
+        return removed_uploads
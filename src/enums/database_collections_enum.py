@@ -5,3 +5,5 @@ class DataBaseEnum(Enum):
     DB_COLLECTION_PROJECT_NAME = "projects"
     DB_COLLECTION_CHUNK_NAME = "chunks"
     DB_COLLECTION_ASSET_NAME = "assets"
+    DB_COLLECTION_SESSION_NAME = "sessions"
+    DB_COLLECTION_UPLOAD_SESSION_NAME = "upload_sessions"
@@ -7,6 +7,17 @@ class ResponseSignal(Enum):
     FILE_SIZE_EXCEEDED = "file_size_exceeded"
     FILE_UPLOAD_SUCCESS = "file_upload_success"
     FILE_UPLOAD_FAILED = "file_upload_failed"
+    BULK_UPLOAD_FILES_COUNT_EXCEEDED = "bulk_upload_files_count_exceeded"
+    BULK_UPLOAD_SIZE_EXCEEDED = "bulk_upload_size_exceeded"
+    UPLOAD_SESSION_CREATED = "upload_session_created"
+    UPLOAD_SESSION_RETRIEVED = "upload_session_retrieved"
+    UPLOAD_SESSION_NOT_FOUND = "upload_session_not_found"
+    UPLOAD_SESSION_DELETED = "upload_session_deleted"
+    UPLOAD_PART_RECEIVED = "upload_part_received"
+    UPLOAD_PART_INVALID = "upload_part_invalid"
+    UPLOAD_PART_CHECKSUM_MISMATCH = "upload_part_checksum_mismatch"
+    UPLOAD_INCOMPLETE = "upload_incomplete"
+    UPLOAD_CHECKSUM_MISMATCH = "upload_checksum_mismatch"
     
     PROCESSING_FAILED =     "processing_failed"
     PROCESSING_STARTED =    "processing_started"   
@@ -15,6 +26,8 @@ class ResponseSignal(Enum):
 
     NO_FILES_ERROR = "not_found_files"
     FILE_ID_ERROR = "no_file_found_with_this_id"
+    ASSET_DELETED = "asset_deleted_successfully"
+    ASSET_REPLACED = "asset_replaced_successfully"
     PROJECT_NOT_FOUND_ERROR = "project_not_found"
     INSERT_INTO_VECTORDB_ERROR = "insert_into_vectordb_error"
     INSERT_INTO_VECTORDB_SUCCESS = "inserted_into_vectordb_successfully"
@@ -28,8 +41,29 @@ class ResponseSignal(Enum):
     CHUNKING_SUCCESS = "chunking_successfully"
     EMBEDDING_ERROR = "embedding_error"
     VECTORDB_COLLECTION_RETRIEVED = "vectordb_collection_retrieved_successfully"
+    INDEX_REBUILD_STARTED = "index_rebuild_started"
+    INDEX_REBUILD_IN_PROGRESS = "index_rebuild_in_progress"
+    EMBEDDING_MODEL_NOT_SUPPORTED = "embedding_model_not_supported"
+    SNAPSHOT_CREATED = "snapshot_created_successfully"
+    SNAPSHOT_CREATE_ERROR = "snapshot_create_error"
+    SNAPSHOT_INDEX_NOT_FOUND = "snapshot_index_not_found"
+    SNAPSHOT_INDEX_OUT_OF_DATE = "snapshot_index_out_of_date"
+    SNAPSHOT_NOT_FOUND = "snapshot_not_found"
+    SNAPSHOT_INVALID = "snapshot_invalid"
+    SNAPSHOT_RESTORED = "snapshot_restored_successfully"
+    SNAPSHOT_RESTORE_ERROR = "snapshot_restore_error"
     VECTORDB_SEARCH_ERROR = "vectordb_search_error"
     VECTORDB_SEARCH_SUCCESS = "vectordb_search_successfully"
+    SEARCH_BATCH_EMPTY_ERROR = "search_batch_empty"
+    SEARCH_BATCH_SIZE_EXCEEDED = "search_batch_size_exceeded"
+    FEDERATED_SEARCH_PROJECTS_ERROR = "federated_search_invalid_projects"
     RAG_ANSWER_ERROR = "rag_answer_error"
     RAG_ANSWER_SUCCESS = "rag_answer_successfully"
+    LLM_PROVIDER_UNAVAILABLE = "llm_provider_unavailable"
+    REQUEST_TIMEOUT = "request_timeout"
+    SERVICE_OVERLOADED = "service_overloaded"
+    SERVICE_READY = "service_ready"
+    SERVICE_NOT_READY = "service_not_ready"
+    SESSION_NOT_FOUND_ERROR = "session_not_found"
+    SESSION_DELETED = "session_deleted_successfully"
     
\ No newline at end of file
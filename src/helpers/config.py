@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     
@@ -11,10 +11,41 @@ class Settings(BaseSettings):
     FILE_MAX_SIZE:int
     MAX_CHUNK_SIZE:int
 
+    # bulk upload (several files and / or zip archives per request)
+    BULK_UPLOAD_MAX_FILES: int = 500
+    BULK_UPLOAD_MAX_SIZE: int = 200 # MB, all the files of a request together
+    BULK_UPLOAD_CONCURRENCY: int = 8
+    BULK_UPLOAD_ARCHIVE_TYPES: List[str] = ["application/zip", "application/x-zip-compressed"]
+
+    # resumable uploads (byte ranges sent in separate requests, see /data/upload/resumable)
+    RESUMABLE_UPLOAD_MAX_SIZE: int = 2048 # MB
+    RESUMABLE_UPLOAD_MAX_PART_SIZE: int = 64 # MB
+    RESUMABLE_UPLOAD_TTL_SECONDS: int = 86400
+    RESUMABLE_UPLOAD_SWEEP_INTERVAL_SECONDS: int = 600
+
+    # asset storage: LOCAL (src/assets/files) or S3 (any S3-compatible object store)
+    STORAGE_BACKEND: str = "LOCAL"
+    STORAGE_S3_BUCKET: Optional[str] = None
+    STORAGE_S3_ENDPOINT_URL: Optional[str] = None # MinIO / other S3-compatible stores
+    STORAGE_S3_REGION: Optional[str] = None
+    STORAGE_S3_ACCESS_KEY_ID: Optional[str] = None
+    STORAGE_S3_SECRET_ACCESS_KEY: Optional[str] = None
+    STORAGE_S3_KEY_PREFIX: str = ""
+    STORAGE_CACHE_MAX_SIZE: int = 1024 # MB, local read-through cache of the remote files
+
     # database
     MONGODB_URL:str
     MONGODB_DATABASE:str
 
+    # chunk persistence: unordered bulk inserts, cut by count or size, a few batches in flight
+    CHUNK_INSERT_BATCH_SIZE: int = 1000
+    CHUNK_INSERT_BATCH_MAX_SIZE: int = 8 # MB
+    CHUNK_INSERT_MAX_IN_FLIGHT: int = 4
+
+    # near-duplicate chunks (SimHash, per project): stored but not embedded / indexed again
+    CHUNK_DEDUP_ENABLED: bool = True
+    CHUNK_DEDUP_MAX_DISTANCE: int = 3 # differing bits out of 64
+
     # llm  
     GENERATION_BACKEND: str
     EMBEDDING_BACKEND: str
@@ -23,22 +54,105 @@ class Settings(BaseSettings):
     OPENAI_API_URL: str = None
     COHERE_API_KEY: str = None
 
+    # provider call governor: per backend limits (0 = no limit), shared retry / circuit breaker policy
+    OPENAI_RPM_LIMIT: int = 0
+    OPENAI_TPM_LIMIT: int = 0
+    OPENAI_MAX_CONCURRENCY: int = 16
+    COHERE_RPM_LIMIT: int = 0
+    COHERE_TPM_LIMIT: int = 0
+    COHERE_MAX_CONCURRENCY: int = 16
+    PROVIDER_MAX_RETRIES: int = 3
+    PROVIDER_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    PROVIDER_RETRY_MAX_DELAY_SECONDS: float = 20
+    PROVIDER_QUEUE_TIMEOUT_SECONDS: float = 30
+    PROVIDER_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    PROVIDER_CIRCUIT_RESET_SECONDS: float = 30
+    # threads of the provider calls, waits included: above the backends' max concurrency
+    PROVIDER_MAX_THREADS: int = 64
+
     GENERATION_MODEL_ID: str = None
     EMBEDDING_MODEL_ID: str = None
     EMBEDDING_MODEL_SIZE: int = None
+
+    # optional extra generation backends (hedging / failover), e.g. ["COHERE"] with ["command-r7b-12-2024"]
+    GENERATION_FALLBACK_BACKENDS: List[str] = []
+    GENERATION_FALLBACK_MODEL_IDS: List[str] = []
+    GENERATION_HEDGE_ENABLED: bool = True
+    GENERATION_HEDGE_DELAY_SECONDS: float = 4.0
+    GENERATION_HEDGE_PERCENTILE: float = 90
     INPUT_DAFAULT_MAX_CHARACTERS: int = None
     GENERATION_DAFAULT_MAX_TOKENS: int = None
     GENERATION_DAFAULT_TEMPERATURE: float = None
+
+    # query embedding micro-batching across concurrent requests
+    EMBEDDING_BATCH_ENABLED: bool = True
+    EMBEDDING_BATCH_WAIT_MS: float = 5
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+
+    # prompt token budgets (counted with the generation model's tokenizer)
+    PROMPT_MAX_TOKENS: int = 3000
+    PROMPT_HISTORY_MAX_TOKENS: int = 1000
+    PROMPT_MIN_DOCUMENT_TOKENS: int = 50
     
     # vector db
     VECTOR_DB_BACKEND : str
     VECTOR_DB_PATH : str
     VECTOR_DB_DISTANCE_METHOD: str = None
+    SEARCH_BATCH_MAX_QUERIES: int = 32
+    FEDERATED_SEARCH_MAX_PROJECTS: int = 10
+    FEDERATED_SEARCH_TIMEOUT_SECONDS: float = 2.0
+    SINGLE_FLIGHT_ENABLED: bool = True
+    INDEX_PREVIOUS_VERSIONS_TO_KEEP: int = 0 # older index versions kept (for a rollback) after a swap
+    INDEX_GC_DELAY_SECONDS: float = 30.0
+    INDEX_REBUILD_STALE_SECONDS: int = 21600
+    SNAPSHOT_BATCH_SIZE: int = 1000 # points / documents per batch of a snapshot export or restore
 
     
     # default system propmt language
     PRIMARY_LANGUAGE:str = "en"
     DEFAULT_LANGUAGE:str = "en"
+    TEMPLATES_HOT_RELOAD: bool = False
+    TEMPLATES_RELOAD_INTERVAL_SECONDS: float = 5
+
+    # chat sessions
+    SESSION_TTL_SECONDS: int = 86400
+    SESSION_MAX_MESSAGES: int = 100
+    SESSION_CACHE_SIZE: int = 1024
+    SESSION_CACHE_TTL_SECONDS: int = 300
+
+    # request deadline in seconds, 60 by default (0 disables it, a client can still set one
+    # with X-Request-Timeout); long running ingestion endpoints are excluded
+    REQUEST_TIMEOUT_SECONDS: float = 60
+    REQUEST_TIMEOUT_EXCLUDED_PATHS: List[str] = ["/api/v1/data/", "/api/v1/nlp/index/push/", "/api/v1/snapshot/", "/metrics"]
+
+    # admission control (per worker): interactive requests go ahead of the bulk ingestion ones
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENCY: int = 32
+    ADMISSION_PROJECT_MAX_CONCURRENCY: int = 8
+    ADMISSION_INTERACTIVE_PATHS: List[str] = ["/api/v1/nlp/index/answer/", "/api/v1/nlp/index/search/"]
+    ADMISSION_INTERACTIVE_MAX_CONCURRENCY: int = 32
+    ADMISSION_INTERACTIVE_MAX_QUEUE_WAIT_SECONDS: float = 2.0
+    ADMISSION_BULK_PATHS: List[str] = ["/api/v1/data/", "/api/v1/nlp/index/push/", "/api/v1/nlp/index/rebuild/", "/api/v1/snapshot/"]
+    ADMISSION_BULK_MAX_CONCURRENCY: int = 4
+    ADMISSION_BULK_MAX_QUEUE_WAIT_SECONDS: float = 30.0
+
+    # health: dependencies checked in the background (the probes read the last results),
+    # readiness waits for the startup warm-up
+    HEALTH_CHECK_INTERVAL_SECONDS: float = 10.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 2.0
+    WARMUP_ENABLED: bool = True
+    WARMUP_HOT_PROJECTS: int = 20 # most recently indexed projects whose collections are opened at startup
+    WARMUP_STEP_TIMEOUT_SECONDS: float = 30.0
+
+    # monitoring
+    METRICS_ENABLED: bool = True
+
+    # tracing
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATIO: float = 1.0
+    TRACING_EXPORTER: str = "file" # file | otlp | console
+    TRACING_FILE_PATH: str = "assets/traces/spans.jsonl"
+    TRACING_OTLP_ENDPOINT: Optional[str] = None
 
 
     model_config = SettingsConfigDict(
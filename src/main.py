@@ -1,18 +1,127 @@
-from fastapi import FastAPI # type: ignore
-from routes import base_router, data_router, nlp_router 
+from fastapi import FastAPI, Request, status # type: ignore
+from fastapi.responses import JSONResponse # type: ignore
+from routes import base_router, data_router, nlp_router, snapshot_router 
 from contextlib import asynccontextmanager
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient # type: ignore
 from helpers.config import get_settings
 from stores.llm.LLMProviderFactory import LLMProviderFactory
 from stores.vectordb.VectorDBProviderFactory import VectorDBProviderFactory
+from stores.storage import StorageProviderFactory
 from stores.llm.templates import TemplateParser
+from stores.llm.EmbeddingBatcher import EmbeddingBatcher
+from stores.llm.EmbeddingClientPool import EmbeddingClientPool
+from stores.llm.GenerationRouter import GenerationRouter
+from stores.llm.ProviderGovernor import ProviderUnavailableError
+from stores.llm.LLMEnums import DocumentTypeEnum
+from controllers import UploadController
+from models import ProjectModel, ChunkModel, AssetModel, SessionModel
+from enums import ResponseSignal
+from utils.ttl_cache import TTLCache
+from utils.single_flight import SingleFlight
 # Set up logging
 import logging
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# Set up Prometheus metrics
-from utils import setup_metrics
+# Set up Prometheus metrics and tracing
+from utils import setup_metrics, mark_worker_dead, setup_tracing, setup_deadlines, DeadlineExceededError
+from utils import setup_admission, HealthChecker, setup_provider_threads, shutdown_provider_threads, run_provider_call
+from pymongo.errors import ExecutionTimeout, NetworkTimeout # type: ignore
+
+async def watch_templates(template_parser: TemplateParser, interval: float):
+    # poll the locale files' mtimes and reload the template registry when one changes
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            template_parser.reload_if_changed()
+        except Exception as e:
+            logger.error(f"ERROR:    prompt templates reload failed: {e}")
+
+async def sweep_expired_uploads(ttl_seconds: int, interval: float):
+    # remove the parts of abandoned resumable uploads
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed_uploads = await asyncio.to_thread(UploadController.remove_expired_uploads, ttl_seconds)
+            if removed_uploads:
+                logger.info(f"INFO:     {removed_uploads} expired resumable upload(s) removed")
+        except Exception as e:
+            logger.error(f"ERROR:    expired uploads sweep failed: {e}")
+
+def get_health_checks(app: FastAPI):
+    # {dependency: check}, run in the background by the health checker (never by a probe)
+    async def check_mongodb():
+        await app.db_client.command("ping")
+
+    async def check_vectordb():
+        await asyncio.to_thread(app.vectordb_client.list_all_collections)
+
+    async def check_storage():
+        # a missing key is a successful round trip
+        await asyncio.to_thread(app.storage_client.exists, "_health/probe")
+
+    async def check_embedding_provider():
+        # no provider call (it's billed), the circuit breaker already knows when the provider is failing
+        governor = getattr(app.embedding_client, "governor", None)
+        if governor is not None and governor.circuit_breaker.is_open():
+            raise RuntimeError("provider circuit open")
+
+    return {
+        "mongodb": check_mongodb,
+        "vectordb": check_vectordb,
+        "storage": check_storage,
+        "embedding_provider": check_embedding_provider,
+    }
+
+def get_warmup_steps(app: FastAPI, hot_projects: int):
+    # {step: warm-up}, run in order before the worker is ready, each one returns what it warmed up
+    async def open_mongodb_pool():
+        await app.db_client.command("ping")
+        # collections and their indexes are checked once here instead of by the first requests
+        models = (ProjectModel, ChunkModel, AssetModel, SessionModel)
+        for model in models:
+            await model.create_instance(db_client=app.db_client)
+        return { "collections": len(models) }
+
+    async def load_templates():
+        # the locale groups are imported and validated by the TemplateParser constructor
+        return { "templates": len(app.template_parser.templates) }
+
+    async def open_hot_collections():
+        project_model = await ProjectModel.create_instance(db_client=app.db_client)
+        projects = await project_model.get_recently_indexed_projects_from_db(limit=hot_projects)
+
+        opened_collections = 0
+        for project in projects:
+            project_index = project.project_index
+            # the embedding clients of the hot projects' models are created now as well
+            app.embedding_clients.get(
+                backend=project_index.get("embedding_backend"),
+                model_id=project_index.get("embedding_model_id"),
+                embedding_size=project_index.get("embedding_size"),
+            )
+            try:
+                await asyncio.to_thread(app.vectordb_client.get_collection_info, project_index["collection_name"])
+                opened_collections += 1
+            except Exception as e:
+                logger.warning(f"WARNING:  collection of project {project.project_id} not opened: {e}")
+
+        return { "projects": len(projects), "collections": opened_collections }
+
+    async def embed_test_query():
+        # opens the provider's HTTP connection pool (TLS handshake included)
+        vector = await run_provider_call(app.embedding_client.embed_text, "warm up", DocumentTypeEnum.QUERY.value)
+        if not vector:
+            raise RuntimeError("the test embedding failed")
+        return { "embedding_size": len(vector) }
+
+    return {
+        "mongodb_pool": open_mongodb_pool,
+        "templates": load_templates,
+        "hot_collections": open_hot_collections,
+        "test_embedding": embed_test_query,
+    }
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -32,6 +141,15 @@ async def lifespan(app: FastAPI):
     app.vectordb_client.connect()
     logger.info(f"INFO:     VectorDB client for {settings.VECTOR_DB_BACKEND} initialized")
 
+    # asset storage (uploaded files)
+    storage_provider_factory = StorageProviderFactory(settings)
+    app.storage_client = storage_provider_factory.create(provider=settings.STORAGE_BACKEND)
+    app.storage_client.connect()
+    logger.info(f"INFO:     Storage client for {settings.STORAGE_BACKEND} initialized")
+
+    # provider calls (and their slot / rate limit waits) don't take the default executor's threads
+    setup_provider_threads(max_workers=settings.PROVIDER_MAX_THREADS)
+
     # Transformers' (clients) 
     llm_provider_factory = LLMProviderFactory(settings)
     # llm generation client
@@ -39,32 +157,180 @@ async def lifespan(app: FastAPI):
     app.generation_client.set_generation_model(model_id = settings.GENERATION_MODEL_ID)
     logger.info(f"INFO:     LLM generation client for {settings.GENERATION_BACKEND} initialized")
 
+    # extra generation backends: hedged / failover generation through a router
+    if settings.GENERATION_FALLBACK_BACKENDS:
+        generation_backends = [ app.generation_client ]
+        for backend, model_id in zip(settings.GENERATION_FALLBACK_BACKENDS, settings.GENERATION_FALLBACK_MODEL_IDS):
+            fallback_client = llm_provider_factory.create(provider=backend)
+            fallback_client.set_generation_model(model_id=model_id)
+            generation_backends.append(fallback_client)
+
+        app.generation_client = GenerationRouter(
+            backends=generation_backends,
+            hedge_enabled=settings.GENERATION_HEDGE_ENABLED,
+            hedge_delay_seconds=settings.GENERATION_HEDGE_DELAY_SECONDS,
+            hedge_percentile=settings.GENERATION_HEDGE_PERCENTILE,
+        )
+        logger.info(f"INFO:     LLM generation router over {settings.GENERATION_FALLBACK_BACKENDS} initialized")
+
 
     # llm embedding client
     app.embedding_client = llm_provider_factory.create(provider=settings.EMBEDDING_BACKEND)
     app.embedding_client.set_embedding_model(model_id=settings.EMBEDDING_MODEL_ID,
                                              embedding_size=settings.EMBEDDING_MODEL_SIZE)
     logger.info(f"INFO:     LLM embedding client for {settings.EMBEDDING_BACKEND} initialized")
+
+    # clients of the other embedding models the projects' live indexes were built with (created on first use)
+    app.embedding_clients = EmbeddingClientPool(
+        llm_provider_factory=llm_provider_factory,
+        default_client=app.embedding_client,
+        default_backend=settings.EMBEDDING_BACKEND,
+    )
+
+    # query embeddings of concurrent requests are sent as one multi-input call
+    app.embedding_batcher = None
+    if settings.EMBEDDING_BATCH_ENABLED:
+        app.embedding_batcher = EmbeddingBatcher(
+            embedding_client=app.embedding_client,
+            max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        )
     
-    # template parser
+    # template parser (all locale groups are loaded and validated here, once)
     app.template_parser = TemplateParser(
         language=settings.PRIMARY_LANGUAGE,
         default_language=settings.DEFAULT_LANGUAGE,
     )
 
+    template_reloader = None
+    if settings.TEMPLATES_HOT_RELOAD:
+        template_reloader = asyncio.create_task(
+            watch_templates(app.template_parser, interval=settings.TEMPLATES_RELOAD_INTERVAL_SECONDS)
+        )
+
+    # the parts of abandoned resumable uploads are swept from disk
+    upload_sweeper = asyncio.create_task(
+        sweep_expired_uploads(ttl_seconds=settings.RESUMABLE_UPLOAD_TTL_SECONDS,
+                              interval=settings.RESUMABLE_UPLOAD_SWEEP_INTERVAL_SECONDS)
+    )
+
+    # hot chat sessions (per worker, mongo remains the source of truth)
+    app.session_cache = TTLCache(
+        max_size=settings.SESSION_CACHE_SIZE,
+        ttl_seconds=settings.SESSION_CACHE_TTL_SECONDS,
+    )
+
+    # coalesce identical concurrent embedding / search / generation calls (per worker)
+    app.single_flight = SingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None
+
+    # index rebuilds / old index versions collection running after their request returned
+    app.index_tasks = set()
+
+    # startup warm-up then dependency checks, in the background: the worker is live right away,
+    # ready once warmed up with its critical dependencies up
+    app.health_checker = HealthChecker(
+        checks=get_health_checks(app),
+        interval_seconds=settings.HEALTH_CHECK_INTERVAL_SECONDS,
+        timeout_seconds=settings.HEALTH_CHECK_TIMEOUT_SECONDS,
+        critical=["mongodb", "vectordb", "storage"],
+    )
+    app.health_checker.start(
+        warmup_steps=get_warmup_steps(app, hot_projects=settings.WARMUP_HOT_PROJECTS) if settings.WARMUP_ENABLED else {},
+        warmup_timeout_seconds=settings.WARMUP_STEP_TIMEOUT_SECONDS,
+    )
+
     yield # Application runs here
 
+    await app.health_checker.stop()
+
+    if template_reloader is not None:
+        template_reloader.cancel()
+    upload_sweeper.cancel()
+
+    # an interrupted rebuild records its failure before mongo is closed (its live index stays untouched)
+    for task in app.index_tasks:
+        task.cancel()
+    await asyncio.gather(*app.index_tasks, return_exceptions=True)
+
     app.mongo_conn.close()
     logger.info("INFO:     MongoDB connection closed")
 
     app.vectordb_client.disconnect()
     logger.info(f"INFO:     VectorDB client for {settings.VECTOR_DB_BACKEND} disconnected") 
 
+    app.storage_client.disconnect()
+    logger.info(f"INFO:     Storage client for {settings.STORAGE_BACKEND} disconnected")
+
+    shutdown_provider_threads()
+
+    mark_worker_dead()
+
 
 app = FastAPI(lifespan= lifespan, title="Legal RAG Chatbot API")
 
-setup_metrics(app) # Set up Prometheus metrics and endpoint
+# admission control (innermost: the queue wait counts in the request deadline, and the metrics /
+# tracing middlewares see the shed requests)
+setup_admission(
+    app,
+    enabled=settings.ADMISSION_CONTROL_ENABLED,
+    max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+    project_max_concurrency=settings.ADMISSION_PROJECT_MAX_CONCURRENCY,
+    interactive_paths=settings.ADMISSION_INTERACTIVE_PATHS,
+    interactive_max_concurrency=settings.ADMISSION_INTERACTIVE_MAX_CONCURRENCY,
+    interactive_max_queue_wait_seconds=settings.ADMISSION_INTERACTIVE_MAX_QUEUE_WAIT_SECONDS,
+    bulk_paths=settings.ADMISSION_BULK_PATHS,
+    bulk_max_concurrency=settings.ADMISSION_BULK_MAX_CONCURRENCY,
+    bulk_max_queue_wait_seconds=settings.ADMISSION_BULK_MAX_QUEUE_WAIT_SECONDS,
+)
+# per-request deadline (added early, so the metrics / tracing middlewares see the 504s)
+setup_deadlines(
+    app,
+    timeout_seconds=settings.REQUEST_TIMEOUT_SECONDS,
+    excluded_paths=settings.REQUEST_TIMEOUT_EXCLUDED_PATHS,
+)
+setup_metrics(app, enabled=settings.METRICS_ENABLED) # Set up Prometheus metrics and endpoint
+setup_tracing(
+    app,
+    enabled=settings.TRACING_ENABLED,
+    service_name=settings.APP_NAME,
+    sample_ratio=settings.TRACING_SAMPLE_RATIO,
+    exporter=settings.TRACING_EXPORTER,
+    file_path=settings.TRACING_FILE_PATH,
+    otlp_endpoint=settings.TRACING_OTLP_ENDPOINT,
+) # Set up request tracing (spans + trace id in logs)
+
+async def provider_unavailable_handler(request: Request, exc: ProviderUnavailableError):
+    # the provider circuit is open or its rate limits are saturated: fail fast, tell the client when to retry
+    headers = {}
+    if exc.retry_after:
+        headers["Retry-After"] = str(max(int(exc.retry_after + 0.999), 1))
+
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers=headers,
+        content={
+            "signal": ResponseSignal.LLM_PROVIDER_UNAVAILABLE.value,
+            "reason": exc.reason,
+        }
+    )
+
+app.add_exception_handler(ProviderUnavailableError, provider_unavailable_handler)
+
+async def deadline_exceeded_handler(request: Request, exc: Exception):
+    # the request deadline passed (or is too close for the next call): fail fast instead of queueing
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={
+            "signal": ResponseSignal.REQUEST_TIMEOUT.value,
+        }
+    )
+
+app.add_exception_handler(DeadlineExceededError, deadline_exceeded_handler)
+# pymongo client side timeouts (the request deadline is set as pymongo's timeout)
+app.add_exception_handler(ExecutionTimeout, deadline_exceeded_handler)
+app.add_exception_handler(NetworkTimeout, deadline_exceeded_handler)
 
 app.include_router(base_router)
 app.include_router(data_router)
 app.include_router(nlp_router)
+app.include_router(snapshot_router)
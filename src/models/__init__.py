@@ -1,3 +1,5 @@
 from .chunk_model import ChunkModel
 from .project_model import ProjectModel
-from .asset_model import AssetModel
\ No newline at end of file
+from .asset_model import AssetModel
+from .session_model import SessionModel
+from .upload_session_model import UploadSessionModel
@@ -1,7 +1,11 @@
 from .base_data_model import BaseDataModel
 from schemas import AssetSchema
 from enums import DataBaseEnum
+from utils import track_db_operation, traced
 from bson import ObjectId
+from pymongo import ReplaceOne
+from datetime import datetime
+import re
 
 class AssetModel(BaseDataModel):
 
@@ -16,24 +20,42 @@ class AssetModel(BaseDataModel):
         return instance
 
     async def init_collection(self):
-        all_collections = await self.db_client.list_collection_names()
-        if DataBaseEnum.DB_COLLECTION_ASSET_NAME.value not in all_collections:
-            self.db_collection = self.db_client[DataBaseEnum.DB_COLLECTION_ASSET_NAME.value]
-            indexes = AssetSchema.get_indexes()
-            for index in indexes:
-                await self.db_collection.create_index(
-                    index["key"],
-                    name=index["name"],
-                    unique=index["unique"]
-                )
+        await self.ensure_indexes(self.db_collection, AssetSchema.get_indexes())
 
+    def get_asset_record(self, asset: AssetSchema):
+        record = asset.model_dump(by_alias=True, exclude_unset=True)
+        # the upload date is a default value, kept (searches can filter on it)
+        record.setdefault("asset_pushed_at", asset.asset_pushed_at)
+        return record
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="insert_asset_in_db")
+    @traced("mongodb.insert_asset_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
     async def insert_asset_in_db(self, asset: AssetSchema):
 
-        result = await self.db_collection.insert_one(asset.model_dump(by_alias=True, exclude_unset=True))
+        result = await self.db_collection.insert_one(self.get_asset_record(asset))
         asset.id = result.inserted_id
  
         return asset
 
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="insert_many_assets_in_db")
+    @traced("mongodb.insert_many_assets_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def insert_many_assets_in_db(self, assets: list):
+        # one round trip for a whole bulk upload
+        if not assets:
+            return []
+
+        result = await self.db_collection.insert_many([
+            self.get_asset_record(asset)
+            for asset in assets
+        ])
+
+        for asset, inserted_id in zip(assets, result.inserted_ids):
+            asset.id = inserted_id
+
+        return assets
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="get_all_project_assets_from_db")
+    @traced("mongodb.get_all_project_assets_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
     async def get_all_project_assets_from_db(self, asset_project_id: str, asset_type: str):
 
         records = await self.db_collection.find({ # filters
@@ -46,6 +68,8 @@ class AssetModel(BaseDataModel):
             for record in records
         ]
 
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="get_asset_record_from_db")
+    @traced("mongodb.get_asset_record_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
     async def get_asset_record_from_db(self, asset_project_id: str, asset_name: str):
 
         record = await self.db_collection.find_one({
@@ -58,5 +82,132 @@ class AssetModel(BaseDataModel):
         
         return None
 
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="update_asset_file_in_db")
+    @traced("mongodb.update_asset_file_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def update_asset_file_in_db(self, asset_id: ObjectId, asset_name: str, asset_size: int):
+        # a replaced file keeps its asset (same id in the chunks and points), its metadata comes from the new file
+        result = await self.db_collection.update_one(
+            { "_id": asset_id },
+            {
+                "$set": {
+                    "asset_name": asset_name,
+                    "asset_size": asset_size,
+                    "asset_pushed_at": datetime.utcnow(),
+                },
+                "$unset": { "asset_metadata": "" },
+            }
+        )
+
+        return result.matched_count > 0
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="delete_asset_from_db")
+    @traced("mongodb.delete_asset_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def delete_asset_from_db(self, asset_id: ObjectId):
+        result = await self.db_collection.delete_one({
+            "_id": asset_id
+        })
+
+        return result.deleted_count > 0
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="get_project_asset_records_from_db")
+    @traced("mongodb.get_project_asset_records_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def get_project_asset_records_from_db(self, asset_project_id: ObjectId):
+        # the project's raw asset documents (a snapshot export)
+        return await self.db_collection.find({
+            "asset_project_id": asset_project_id
+        }).sort("_id", 1).to_list(length=None)
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="count_assets_of_other_projects")
+    @traced("mongodb.count_assets_of_other_projects", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def count_assets_of_other_projects(self, asset_project_id: ObjectId, asset_ids: list):
+        return await self.db_collection.count_documents({
+            "_id": { "$in": asset_ids },
+            "asset_project_id": { "$ne": asset_project_id },
+        })
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="replace_project_asset_records_in_db")
+    @traced("mongodb.replace_project_asset_records_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def replace_project_asset_records_in_db(self, asset_project_id: ObjectId, records: list):
+        """
+        Make the project's assets the raw asset documents `records` (ids kept, a snapshot restore):
+        they're written in place of the ones with the same ids, the other assets of the project are deleted.
+        """
+        # the other assets go first: one of them may hold the name (unique per project) of a restored one
+        await self.db_collection.delete_many({
+            "asset_project_id": asset_project_id,
+            "_id": { "$nin": [ record["_id"] for record in records ] },
+        })
+
+        if records:
+            await self.db_collection.bulk_write([
+                ReplaceOne({ "_id": record["_id"], "asset_project_id": asset_project_id },
+                           { **record, "asset_project_id": asset_project_id }, upsert=True)
+                for record in records
+            ], ordered=False)
+
+        return len(records)
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="update_asset_metadata_in_db")
+    @traced("mongodb.update_asset_metadata_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def update_asset_metadata_in_db(self, asset_id: ObjectId, asset_metadata: dict):
+        # document level metadata, stored once for all the asset's chunks
+        result = await self.db_collection.update_one(
+            { "_id": asset_id },
+            { "$set": { "asset_metadata": asset_metadata } }
+        )
+
+        return result.matched_count > 0
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="get_assets_metadata_from_db")
+    @traced("mongodb.get_assets_metadata_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def get_assets_metadata_from_db(self, asset_project_id: ObjectId, asset_ids: list):
+        """
+        Document metadata of the given assets of a project: {asset id (str): {"file_id": ..., **asset_metadata}}.
+        """
+        asset_object_ids = [ ObjectId(asset_id) for asset_id in asset_ids if ObjectId.is_valid(asset_id) ]
+        if not asset_object_ids:
+            return {}
+
+        records = await self.db_collection.find(
+            {
+                "_id": { "$in": asset_object_ids },
+                "asset_project_id": asset_project_id,
+            },
+            { "_id": 1, "asset_name": 1, "asset_metadata": 1 },
+        ).to_list(length=None)
+
+        return {
+            str(record["_id"]): { "file_id": record["asset_name"], **(record.get("asset_metadata") or {}) }
+            for record in records
+        }
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_ASSET_NAME.value, operation="get_assets_ids_by_filter")
+    @traced("mongodb.get_assets_ids_by_filter", {"db.collection": DataBaseEnum.DB_COLLECTION_ASSET_NAME.value})
+    async def get_assets_ids_by_filter(self, asset_project_id: ObjectId, asset_ids: list = None,
+                                       asset_names: list = None, extensions: list = None,
+                                       pushed_after: datetime = None, pushed_before: datetime = None):
+        # ids (str) of the project's assets matching all the given conditions
+        query = { "asset_project_id": asset_project_id }
+
+        if asset_ids is not None:
+            query["_id"] = { "$in": [ ObjectId(asset_id) for asset_id in asset_ids if ObjectId.is_valid(asset_id) ] }
+
+        if asset_names is not None:
+            query["asset_name"] = { "$in": list(asset_names) }
+
+        if extensions:
+            extensions_pattern = "|".join(re.escape(extension.lstrip(".")) for extension in extensions)
+            query.setdefault("asset_name", {})["$regex"] = f"\\.({extensions_pattern})$"
+            query["asset_name"]["$options"] = "i"
+
+        if pushed_after is not None or pushed_before is not None:
+            query["asset_pushed_at"] = {}
+            if pushed_after is not None:
+                query["asset_pushed_at"]["$gte"] = pushed_after
+            if pushed_before is not None:
+                query["asset_pushed_at"]["$lte"] = pushed_before
+
+        records = await self.db_collection.find(query, { "_id": 1 }).to_list(length=None)
+
+        return [ str(record["_id"]) for record in records ]
 
-    
\ No newline at end of file
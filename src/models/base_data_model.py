@@ -1,7 +1,39 @@
 from helpers.config import get_settings, Settings
+from pymongo.errors import OperationFailure
+import logging
 
 class BaseDataModel:
 
+    # (database client, collection) pairs whose indexes were already ensured by this process
+    ensured_collections = set()
+
     def __init__(self, db_client: object):
         self.db_client = db_client
-        self.app_settings:Settings = get_settings()
\ No newline at end of file
+        self.app_settings:Settings = get_settings()
+
+    async def ensure_indexes(self, db_collection, indexes: list):
+        """
+        Create the collection's indexes, once per process (creating an existing index is a no-op):
+        an index added to a schema also reaches a collection created before it, on the next start.
+        """
+        ensured_key = (id(self.db_client), db_collection.name)
+        if ensured_key in BaseDataModel.ensured_collections:
+            return
+
+        for index in indexes:
+            options = {}
+            if "expire_after_seconds" in index:
+                options["expireAfterSeconds"] = index["expire_after_seconds"]
+
+            try:
+                await db_collection.create_index(
+                    index["key"],
+                    name=index["name"],
+                    unique=index["unique"],
+                    **options
+                )
+            except OperationFailure as e:
+                # e.g. an existing index with the same name but other options, it's left as it is
+                logging.getLogger(__name__).error(f"Index {index['name']} of {db_collection.name} not created: {e}")
+
+        BaseDataModel.ensured_collections.add(ensured_key)
@@ -1,15 +1,19 @@
 from .base_data_model import BaseDataModel
 from schemas import ChunkSchema
 from enums import DataBaseEnum
+from utils import track_db_operation, traced, observe_chunks_persisted
 from bson.objectid import ObjectId
-from pymongo import InsertOne
+from pymongo import UpdateOne, UpdateMany, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+import asyncio
+import logging
 
 class ChunkModel(BaseDataModel):
 
     def __init__(self, db_client: object):
         super().__init__(db_client=db_client)
         self.db_collection = self.db_client[DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value]
-
+        self.logger = logging.getLogger(__name__)
 
     @classmethod
     async def create_instance(cls, db_client: object):
@@ -18,25 +22,20 @@ class ChunkModel(BaseDataModel):
         return instance
 
     async def init_collection(self):
-        all_collections = await self.db_client.list_collection_names()
-        if DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value not in all_collections:
-            self.db_collection = self.db_client[DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value]
-            indexes = ChunkSchema.get_indexes()
-            for index in indexes:
-                await self.db_collection.create_index(
-                    index["key"],
-                    name=index["name"],
-                    unique=index["unique"]
-                )
+        await self.ensure_indexes(self.db_collection, ChunkSchema.get_indexes())
 
 
 
 
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="insert_chunk_in_db")
+    @traced("mongodb.insert_chunk_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
     async def insert_chunk_in_db(self, chunk: ChunkSchema):
         result = await self.db_collection.insert_one(chunk.model_dump(by_alias=True, exclude_unset=True))
         chunk.id = result.inserted_id
         return chunk
 
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="get_chunk_from_db")
+    @traced("mongodb.get_chunk_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
     async def get_chunk_from_db(self, chunk_id: str):
         result = await self.db_collection.find_one({
             "_id": ObjectId(chunk_id)
@@ -47,20 +46,106 @@ class ChunkModel(BaseDataModel):
         
         return ChunkSchema(**result)
 
-    async def insert_many_chunks_in_db(self, chunks: list, batch_size: int=100):
+    def get_record_size(self, record: dict):
+        # rough BSON size of a chunk document (utf-8 text + metadata + ids / field names)
+        metadata_size = sum(len(str(key)) + len(str(value)) for key, value in record["chunk_metadata"].items())
+        return len(record["chunk_text"].encode("utf-8")) + metadata_size + 128
 
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i+batch_size]
+    def get_record_batches(self, records: list, batch_size: int, batch_max_bytes: int):
+        # cut on count or on size, whichever comes first (a batch always holds at least one record)
+        batch, batch_bytes = [], 0
+        for record in records:
+            record_size = self.get_record_size(record)
+            if batch and (len(batch) >= batch_size or batch_bytes + record_size > batch_max_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
 
-            operations = [ # ready for bulk_write
-                InsertOne(chunk.model_dump(by_alias=True, exclude_unset=True))
-                for chunk in batch
-            ]
+            batch.append(record)
+            batch_bytes += record_size
 
-            await self.db_collection.bulk_write(operations) 
-        
-        return len(chunks)
+        if batch:
+            yield batch
+
+    async def insert_records_batch(self, batch: list):
+        # unordered: a rejected document doesn't stop the rest of the batch
+        try:
+            result = await self.db_collection.insert_many(batch, ordered=False)
+            return len(result.inserted_ids), 0
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+            write_errors = e.details.get("writeErrors", [])
+            self.logger.error(f"{len(batch) - inserted} chunk(s) rejected by a bulk insert"
+                              f"{': ' + write_errors[0].get('errmsg', '') if write_errors else ''}")
+            return inserted, len(batch) - inserted
+        except PyMongoError as e:
+            self.logger.error(f"Bulk insert of {len(batch)} chunk(s) failed: {e}")
+            return 0, len(batch)
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="insert_many_chunk_records_in_db")
+    @traced("mongodb.insert_many_chunk_records_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def insert_many_chunk_records_in_db(self, records: list):
+        """
+        Fast path for large ingestions: raw chunk documents (see ChunkSchema.get_records) are written
+        with unordered insert_many batches (CHUNK_INSERT_BATCH_SIZE documents or CHUNK_INSERT_BATCH_MAX_SIZE MB),
+        up to CHUNK_INSERT_MAX_IN_FLIGHT batches at once.
+
+        Returns (inserted, failed) chunks counts.
+        """
+        if not records:
+            return 0, 0
+
+        batch_slots = asyncio.Semaphore(max(self.app_settings.CHUNK_INSERT_MAX_IN_FLIGHT, 1))
+
+        async def insert_batch(batch: list):
+            async with batch_slots:
+                return await self.insert_records_batch(batch)
+
+        batches_counts = await asyncio.gather(*[
+            insert_batch(batch)
+            for batch in self.get_record_batches(
+                records,
+                batch_size=self.app_settings.CHUNK_INSERT_BATCH_SIZE,
+                batch_max_bytes=self.app_settings.CHUNK_INSERT_BATCH_MAX_SIZE * 1048576,
+            )
+        ])
+
+        inserted = sum(batch_inserted for batch_inserted, _ in batches_counts)
+        failed = sum(batch_failed for _, batch_failed in batches_counts)
+        observe_chunks_persisted(inserted=inserted, failed=failed)
+
+        return inserted, failed
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="get_canonical_chunks_by_bands")
+    @traced("mongodb.get_canonical_chunks_by_bands", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def get_canonical_chunks_by_bands(self, project_id: ObjectId, bands: list, batch_size: int=1000):
+        # near-duplicate candidates of a batch: the project's canonical chunks sharing a fingerprint band
+        chunks = {}
+        for i in range(0, len(bands), batch_size):
+            records = await self.db_collection.find(
+                {
+                    "chunk_project_id": project_id,
+                    "chunk_duplicate_of": None,
+                    "chunk_fingerprint_bands": { "$in": bands[i:i+batch_size] },
+                },
+                { "_id": 1, "chunk_fingerprint": 1, "chunk_fingerprint_bands": 1 },
+            ).to_list(length=None)
+
+            chunks.update({ record["_id"]: record for record in records })
 
+        return list(chunks.values())
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="get_canonical_ids_of_duplicates")
+    @traced("mongodb.get_canonical_ids_of_duplicates", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def get_canonical_ids_of_duplicates(self, project_id: ObjectId, asset_ids: list):
+        # the canonical chunks (indexed under another asset) of the assets' near-duplicate chunks
+        return await self.db_collection.distinct("chunk_duplicate_of", {
+            "chunk_project_id": project_id,
+            "chunk_asset_id": { "$in": asset_ids },
+            "chunk_duplicate_of": { "$ne": None },
+        })
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="delete_chunks_from_db_by_project_id")
+    @traced("mongodb.delete_chunks_from_db_by_project_id", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
     async def delete_chunks_from_db_by_project_id(self, project_id: ObjectId):
         result = await self.db_collection.delete_many({
             "chunk_project_id": project_id
@@ -69,10 +154,143 @@ class ChunkModel(BaseDataModel):
         return result.deleted_count
     
 
-    async def get_poject_chunks(self, project_id: ObjectId, page_no: int=1, page_size: int=50):
-        records = await self.db_collection.find({
-                    "chunk_project_id": project_id
-                }).skip(
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="delete_chunks_from_db_by_asset_id")
+    @traced("mongodb.delete_chunks_from_db_by_asset_id", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def delete_chunks_from_db_by_asset_id(self, project_id: ObjectId, asset_id: ObjectId):
+        result = await self.db_collection.delete_many({
+            "chunk_project_id": project_id,
+            "chunk_asset_id": asset_id,
+        })
+
+        return result.deleted_count
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="promote_duplicates_of_asset")
+    @traced("mongodb.promote_duplicates_of_asset", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def promote_duplicates_of_asset(self, project_id: ObjectId, asset_id: ObjectId, batch_size: int=1000):
+        """
+        Before an asset's chunks are deleted: the near-duplicates other assets hold of its canonical chunks
+        lose their canonical chunk. For each of them, the oldest duplicate becomes canonical and the other
+        ones now reference it.
+
+        Returns the promoted chunks (they have no point in the vector db yet, they have to be indexed).
+        """
+        canonical_ids = await self.db_collection.distinct("_id", {
+            "chunk_project_id": project_id,
+            "chunk_asset_id": asset_id,
+            "chunk_duplicate_of": None,
+        })
+
+        promoted_records = []
+        for i in range(0, len(canonical_ids), batch_size):
+            duplicates = await self.db_collection.find({
+                "chunk_project_id": project_id,
+                "chunk_duplicate_of": { "$in": canonical_ids[i:i+batch_size] },
+                "chunk_asset_id": { "$ne": asset_id },
+            }).sort("_id", 1).to_list(length=None)
+
+            # {deleted canonical id: oldest duplicate}
+            promoted = {}
+            for record in duplicates:
+                promoted.setdefault(record["chunk_duplicate_of"], record)
+
+            if not promoted:
+                continue
+
+            operations = []
+            for canonical_id, record in promoted.items():
+                operations.append(UpdateOne({ "_id": record["_id"] }, { "$unset": { "chunk_duplicate_of": "" } }))
+                operations.append(UpdateMany(
+                    { "chunk_project_id": project_id, "chunk_duplicate_of": canonical_id },
+                    { "$set": { "chunk_duplicate_of": record["_id"] } },
+                ))
+
+            # ordered: a promoted chunk is unset before the other duplicates are pointed to it
+            await self.db_collection.bulk_write(operations, ordered=True)
+
+            for record in promoted.values():
+                record.pop("chunk_duplicate_of", None)
+                promoted_records.append(record)
+
+        return [
+            ChunkSchema(**record)
+            for record in promoted_records
+        ]
+
+    async def get_project_chunk_records(self, project_id: ObjectId, batch_size: int=1000):
+        # the project's raw chunk documents by batches (keyset paging on _id, a snapshot export reads them all)
+        last_id = None
+        while True:
+            query = { "chunk_project_id": project_id }
+            if last_id is not None:
+                query["_id"] = { "$gt": last_id }
+
+            records = await self.db_collection.find(query).sort("_id", 1).limit(batch_size).to_list(length=None)
+            if not records:
+                break
+
+            last_id = records[-1]["_id"]
+            yield records
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="count_chunks_of_other_projects")
+    @traced("mongodb.count_chunks_of_other_projects", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def count_chunks_of_other_projects(self, project_id: ObjectId, chunk_ids: list):
+        return await self.db_collection.count_documents({
+            "_id": { "$in": chunk_ids },
+            "chunk_project_id": { "$ne": project_id },
+        })
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="replace_chunk_records_in_db")
+    @traced("mongodb.replace_chunk_records_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def replace_chunk_records_in_db(self, project_id: ObjectId, records: list):
+        """
+        Write raw chunk documents (ids kept) into the project, in place of the ones with the same ids.
+        A document id held by another project fails the write.
+        """
+        if not records:
+            return 0
+
+        await self.db_collection.bulk_write([
+            ReplaceOne({ "_id": record["_id"], "chunk_project_id": project_id },
+                       { **record, "chunk_project_id": project_id }, upsert=True)
+            for record in records
+        ], ordered=False)
+
+        return len(records)
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="delete_chunks_from_db_excluding")
+    @traced("mongodb.delete_chunks_from_db_excluding", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def delete_chunks_from_db_excluding(self, project_id: ObjectId, kept_ids: set, batch_size: int=1000):
+        # the project's chunks but `kept_ids` (the ones a restored snapshot doesn't have)
+        deleted_count = 0
+        async for records in self.get_project_chunk_records(project_id=project_id, batch_size=batch_size):
+            deleted_ids = [ record["_id"] for record in records if record["_id"] not in kept_ids ]
+            if deleted_ids:
+                result = await self.db_collection.delete_many({ "_id": { "$in": deleted_ids } })
+                deleted_count += result.deleted_count
+
+        return deleted_count
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="count_project_chunks")
+    @traced("mongodb.count_project_chunks", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def count_project_chunks(self, project_id: ObjectId, canonical_only: bool=False):
+        query = { "chunk_project_id": project_id }
+        if canonical_only:
+            query["chunk_duplicate_of"] = None
+
+        return await self.db_collection.count_documents(query)
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value, operation="get_poject_chunks")
+    @traced("mongodb.get_poject_chunks", {"db.collection": DataBaseEnum.DB_COLLECTION_CHUNK_NAME.value})
+    async def get_poject_chunks(self, project_id: ObjectId, page_no: int=1, page_size: int=50,
+                                canonical_only: bool=False, asset_id: ObjectId=None):
+        query = { "chunk_project_id": project_id }
+        if asset_id is not None:
+            query["chunk_asset_id"] = asset_id
+        if canonical_only:
+            # near-duplicates are represented by their canonical chunk
+            query["chunk_duplicate_of"] = None
+
+        records = await self.db_collection.find(query).skip(
                     (page_no-1) * page_size
                 ).limit(page_size).to_list(length=None)
 
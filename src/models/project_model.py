@@ -1,6 +1,9 @@
 from .base_data_model import BaseDataModel
 from schemas import ProjectSchema
 from enums import DataBaseEnum
+from utils import track_db_operation, traced
+from bson import ObjectId
+from datetime import datetime
 
 class ProjectModel(BaseDataModel):
 
@@ -17,21 +20,14 @@ class ProjectModel(BaseDataModel):
         return instance
 
     async def init_collection(self):
-        all_collections = await self.db_client.list_collection_names()
-        if DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value not in all_collections:
-            self.db_collection = self.db_client[DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value]
-            indexes = ProjectSchema.get_indexes()
-            for index in indexes:
-                await self.db_collection.create_index(
-                    index["key"],
-                    name=index["name"],
-                    unique=index["unique"]
-                )
+        await self.ensure_indexes(self.db_collection, ProjectSchema.get_indexes())
 
 
 
 
     # create
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value, operation="insert_project_in_db")
+    @traced("mongodb.insert_project_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value})
     async def insert_project_in_db(self, project: ProjectSchema)-> ProjectSchema:
 
         result = await self.db_collection.insert_one(project.model_dump(by_alias=True, exclude_unset=True))
@@ -40,6 +36,8 @@ class ProjectModel(BaseDataModel):
         return project
 
     # read
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value, operation="get_project_from_db_or_insert_one")
+    @traced("mongodb.get_project_from_db_or_insert_one", {"db.collection": DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value})
     async def get_project_from_db_or_insert_one(self, project_id: str)-> ProjectSchema:
 
         record = await self.db_collection.find_one({ # filter
@@ -55,6 +53,18 @@ class ProjectModel(BaseDataModel):
         
         return ProjectSchema(**record)
 
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value, operation="get_projects_from_db")
+    @traced("mongodb.get_projects_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value})
+    async def get_projects_from_db(self, project_ids: list):
+        # existing projects only (no insert), in one query
+        cursor = self.db_collection.find({
+            "project_id": { "$in": project_ids }
+        })
+
+        return [ ProjectSchema(**record) async for record in cursor ]
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value, operation="get_all_projects_from_db")
+    @traced("mongodb.get_all_projects_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value})
     async def get_all_projects_from_db(self, page: int=1, page_size: int=10): # pagination
 
         # count total number of documents
@@ -72,4 +82,50 @@ class ProjectModel(BaseDataModel):
                 ProjectSchema(**document)
             )
 
-        return projects, total_pages
\ No newline at end of file
+        return projects, total_pages
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value, operation="get_recently_indexed_projects_from_db")
+    @traced("mongodb.get_recently_indexed_projects_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value})
+    async def get_recently_indexed_projects_from_db(self, limit: int):
+        # the projects whose index was swapped in last first (the warm-up opens their collections)
+        cursor = self.db_collection.find({
+            "project_index": { "$ne": None }
+        }).sort("project_index.swapped_at", -1).limit(limit)
+
+        return [ ProjectSchema(**record) async for record in cursor ]
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value, operation="claim_index_build")
+    @traced("mongodb.claim_index_build", {"db.collection": DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value})
+    async def claim_index_build(self, project_id: ObjectId, build: dict, stale_before: datetime):
+        """
+        Record `build` as the project's running index rebuild, unless another one is running
+        (started after `stale_before`, an older one is considered dead). Returns True when claimed.
+        """
+        result = await self.db_collection.update_one(
+            {
+                "_id": project_id,
+                "$or": [
+                    { "project_index_build.status": { "$ne": "building" } },
+                    { "project_index_build.started_at": { "$lt": stale_before } },
+                ],
+            },
+            { "$set": { "project_index_build": build } }
+        )
+
+        return result.modified_count > 0
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value, operation="update_index_build")
+    @traced("mongodb.update_index_build", {"db.collection": DataBaseEnum.DB_COLLECTION_PROJECT_NAME.value})
+    async def update_index_build(self, project_id: ObjectId, version: int, build_fields: dict,
+                                 project_index: dict = None):
+        # only the build that claimed `version` updates it; the live index is switched with it (swap)
+        update = { f"project_index_build.{key}": value for key, value in build_fields.items() }
+        if project_index is not None:
+            update["project_index"] = project_index
+
+        result = await self.db_collection.update_one(
+            { "_id": project_id, "project_index_build.version": version },
+            { "$set": update }
+        )
+
+        return result.matched_count > 0
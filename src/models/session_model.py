@@ -0,0 +1,133 @@
+from .base_data_model import BaseDataModel
+from schemas import SessionSchema
+from enums import DataBaseEnum
+from utils import track_db_operation, traced
+from utils.ttl_cache import TTLCache
+from bson import ObjectId
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+import uuid
+
+class SessionModel(BaseDataModel):
+
+    def __init__(self, db_client: object, session_cache: TTLCache = None):
+        super().__init__(db_client=db_client)
+        self.db_collection = self.db_client[DataBaseEnum.DB_COLLECTION_SESSION_NAME.value]
+
+        # hot sessions are served from the worker's memory, mongo stays the source of truth
+        self.session_cache = session_cache
+
+    @classmethod
+    async def create_instance(cls, db_client: object, session_cache: TTLCache = None):
+        instance = cls(db_client, session_cache=session_cache)
+        await instance.init_collection()
+        return instance
+
+    async def init_collection(self):
+        await self.ensure_indexes(self.db_collection, SessionSchema.get_indexes())
+
+    def get_expiry_date(self):
+        # at mongo's (millisecond) precision: the expiry is compared with the stored one to validate a cached session
+        expires_at = datetime.utcnow() + timedelta(seconds=self.app_settings.SESSION_TTL_SECONDS)
+        return expires_at.replace(microsecond=expires_at.microsecond // 1000 * 1000)
+
+    def cache_session(self, session: SessionSchema):
+        if self.session_cache is not None:
+            self.session_cache.set(session.session_id, session)
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_SESSION_NAME.value, operation="insert_session_in_db")
+    @traced("mongodb.insert_session_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_SESSION_NAME.value})
+    async def insert_session_in_db(self, project_id: ObjectId, messages: list = None) -> SessionSchema:
+        # a new session is saved with its first turn, once it's answered
+        session = SessionSchema(
+            session_id=uuid.uuid4().hex,
+            session_project_id=project_id,
+            session_messages=(messages or [])[-self.app_settings.SESSION_MAX_MESSAGES:],
+            session_expires_at=self.get_expiry_date(),
+        )
+
+        result = await self.db_collection.insert_one(session.model_dump(by_alias=True, exclude={"id"}))
+        session.id = result.inserted_id
+
+        self.cache_session(session)
+        return session
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_SESSION_NAME.value, operation="get_session_from_db")
+    @traced("mongodb.get_session_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_SESSION_NAME.value})
+    async def get_session_from_db(self, session_id: str, project_id: ObjectId) -> SessionSchema:
+
+        session = self.session_cache.get(session_id) if self.session_cache is not None else None
+
+        if session is not None:
+            # every worker has its own cache: another one may have appended a turn or deleted the session.
+            # Every write slides the expiry, so the cached copy is used only while its expiry is still the stored one
+            record = await self.db_collection.find_one(
+                { "session_id": session_id },
+                projection={ "_id": 0, "session_expires_at": 1 },
+            )
+
+            if record is None:
+                self.session_cache.delete(session_id)
+                return None
+
+            if record["session_expires_at"] != session.session_expires_at:
+                session = None
+
+        if session is None:
+            record = await self.db_collection.find_one({
+                "session_id": session_id,
+            })
+
+            if record is None:
+                return None
+
+            session = SessionSchema(**record)
+            self.cache_session(session)
+
+        # mongo's TTL monitor only runs every minute, so expiry is checked here as well
+        if session.session_project_id != project_id or session.session_expires_at < datetime.utcnow():
+            return None
+
+        return session
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_SESSION_NAME.value, operation="append_session_messages")
+    @traced("mongodb.append_session_messages", {"db.collection": DataBaseEnum.DB_COLLECTION_SESSION_NAME.value})
+    async def append_session_messages(self, session_id: str, messages: list) -> SessionSchema:
+        """
+        Append the new turn(s) only (no rewrite of the whole conversation) and slide the expiry.
+        """
+        record = await self.db_collection.find_one_and_update(
+            { "session_id": session_id },
+            {
+                "$push": {
+                    "session_messages": {
+                        "$each": messages,
+                        "$slice": -self.app_settings.SESSION_MAX_MESSAGES,
+                    }
+                },
+                "$set": { "session_expires_at": self.get_expiry_date() },
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if record is None:
+            if self.session_cache is not None:
+                self.session_cache.delete(session_id)
+            return None
+
+        session = SessionSchema(**record)
+        self.cache_session(session)
+        return session
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_SESSION_NAME.value, operation="delete_session_from_db")
+    @traced("mongodb.delete_session_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_SESSION_NAME.value})
+    async def delete_session_from_db(self, session_id: str):
+
+        if self.session_cache is not None:
+            self.session_cache.delete(session_id)
+
+        result = await self.db_collection.delete_one({
+            "session_id": session_id
+        })
+
+        return result.deleted_count
@@ -0,0 +1,98 @@
+from .base_data_model import BaseDataModel
+from schemas import UploadSessionSchema
+from enums import DataBaseEnum
+from utils import track_db_operation, traced
+from bson import ObjectId
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+import uuid
+
+class UploadSessionModel(BaseDataModel):
+
+    def __init__(self, db_client: object):
+        super().__init__(db_client=db_client)
+        self.db_collection = self.db_client[DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value]
+
+    @classmethod
+    async def create_instance(cls, db_client: object):
+        instance = cls(db_client)
+        await instance.init_collection()
+        return instance
+
+    async def init_collection(self):
+        await self.ensure_indexes(self.db_collection, UploadSessionSchema.get_indexes())
+
+    def get_expiry_date(self):
+        return datetime.utcnow() + timedelta(seconds=self.app_settings.RESUMABLE_UPLOAD_TTL_SECONDS)
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value, operation="insert_upload_session_in_db")
+    @traced("mongodb.insert_upload_session_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value})
+    async def insert_upload_session_in_db(self, project_id: ObjectId, file_name: str, file_size: int,
+                                          checksum: str = None) -> UploadSessionSchema:
+
+        upload_session = UploadSessionSchema(
+            upload_id=uuid.uuid4().hex,
+            upload_project_id=project_id,
+            upload_file_name=file_name,
+            upload_file_size=file_size,
+            upload_checksum=checksum,
+            upload_expires_at=self.get_expiry_date(),
+        )
+
+        result = await self.db_collection.insert_one(upload_session.model_dump(by_alias=True, exclude={"id"}))
+        upload_session.id = result.inserted_id
+
+        return upload_session
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value, operation="get_upload_session_from_db")
+    @traced("mongodb.get_upload_session_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value})
+    async def get_upload_session_from_db(self, upload_id: str, project_id: ObjectId,
+                                         extend_expiry: bool = False) -> UploadSessionSchema:
+        """
+        Get a live upload session of the project; with `extend_expiry` its expiry slides
+        (an upload still receiving parts is never expired).
+        """
+        if extend_expiry:
+            record = await self.db_collection.find_one_and_update(
+                { "upload_id": upload_id },
+                { "$set": { "upload_expires_at": self.get_expiry_date() } },
+                return_document=ReturnDocument.BEFORE,
+            )
+        else:
+            record = await self.db_collection.find_one({
+                "upload_id": upload_id,
+            })
+
+        if record is None:
+            return None
+
+        upload_session = UploadSessionSchema(**record)
+
+        # mongo's TTL monitor only runs every minute, so expiry is checked here as well
+        if upload_session.upload_project_id != project_id or upload_session.upload_expires_at < datetime.utcnow():
+            return None
+
+        return upload_session
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value, operation="restore_upload_session_in_db")
+    @traced("mongodb.restore_upload_session_in_db", {"db.collection": DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value})
+    async def restore_upload_session_in_db(self, upload_session: UploadSessionSchema):
+        # give back a session claimed by a /complete that failed, with a fresh expiry
+        upload_session.upload_expires_at = self.get_expiry_date()
+        await self.db_collection.replace_one(
+            { "upload_id": upload_session.upload_id },
+            upload_session.model_dump(by_alias=True, exclude={"id"}),
+            upsert=True,
+        )
+
+        return upload_session
+
+    @track_db_operation(collection=DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value, operation="delete_upload_session_from_db")
+    @traced("mongodb.delete_upload_session_from_db", {"db.collection": DataBaseEnum.DB_COLLECTION_UPLOAD_SESSION_NAME.value})
+    async def delete_upload_session_from_db(self, upload_id: str):
+
+        result = await self.db_collection.delete_one({
+            "upload_id": upload_id
+        })
+
+        return result.deleted_count
@@ -1,3 +1,4 @@
 from .base import base_router 
 from .data import data_router 
 from .nlp import nlp_router
+from .snapshot import snapshot_router
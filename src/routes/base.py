@@ -1,46 +1,67 @@
-from fastapi import APIRouter, Depends, Request
-from controllers.base_controller import BaseController
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import JSONResponse
 from helpers import get_settings, Settings
+from enums import ResponseSignal
 base_router = APIRouter(
     prefix="/api/v1",
     tags=["api_v1"],
 )
 
 # the default route for health checking;
+# the dependencies status is the last background check (see HealthChecker), nothing is checked per request
 @base_router.get("/")
 async def read_root(request:Request, app_settings: Settings =Depends(get_settings)):
-    # app_settings = get_settings()
-    
-    
-    base_controller = BaseController()
-    if base_controller.get_database_path(app_settings.VECTOR_DB_PATH):
-        vectore_db_path_check = "Qdrant vector database connection successful"
+
+    health_checker = request.app.health_checker
+
+    mongo_db = health_checker.dependencies["mongodb"]
+    if mongo_db["healthy"]:
+        mongo_db_health_check = "MongoDB connection successful"
     else:
-        vectore_db_path_check = "Qdrant vector database connection failed"
-
-    
-    mongo_db_health_check = ""
-    try:
-        if request.app.db_client is None:
-            mongo_db_health_check = "MongoDB connection failed: Client is None"
-        else:
-            # Run command directly on the database object
-            await request.app.db_client.command('ping')
-            mongo_db_health_check = "MongoDB connection successful"
-            
-    except Exception as e:
-        mongo_db_health_check = f"MongoDB connection failed: {str(e)}"
+        mongo_db_health_check = f"MongoDB connection failed: {mongo_db['error']}"
+
+    vector_db = health_checker.dependencies["vectordb"]
+    if vector_db["healthy"]:
+        vectore_db_health_check = "Qdrant vector database connection successful"
+    else:
+        vectore_db_health_check = f"Qdrant vector database connection failed: {vector_db['error']}"
 
     app_version = app_settings.APP_VERSION
     app_name = app_settings.APP_NAME
     return{
         "app name": app_name,
         "app version": app_version,
-        "application status": "running",
+        "application status": "running" if health_checker.is_ready() else "not ready",
 
         "transformer model in embedding backend": app_settings.EMBEDDING_BACKEND,
         "transformer model in generation backend": app_settings.GENERATION_BACKEND,
-        
+
         "mongo_db_health_check": mongo_db_health_check,
-        "vector_db_health_check_dir": vectore_db_path_check,
-    }
\ No newline at end of file
+        "vector_db_health_check_dir": vectore_db_health_check,
+    }
+
+# liveness: the worker's event loop answers (restart it otherwise), no dependency involved
+@base_router.get("/health/live")
+async def liveness():
+    return { "status": "alive" }
+
+# readiness: warmed up and its critical dependencies up (send it traffic), 503 otherwise
+@base_router.get("/health/ready")
+async def readiness(request: Request):
+
+    health_status = request.app.health_checker.get_status()
+    if not health_status["ready"]:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={
+                "signal": ResponseSignal.SERVICE_NOT_READY.value,
+                **health_status,
+            }
+        )
+
+    return JSONResponse(
+        content={
+            "signal": ResponseSignal.SERVICE_READY.value,
+            **health_status,
+        }
+    )
@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, UploadFile, status, Request
+from fastapi import APIRouter, Depends, UploadFile, File, Form, status, Request
 from fastapi.responses import JSONResponse
 from controllers import ProcessController
 from helpers import get_settings, Settings
-from controllers import DataController, ProjectController
+from controllers import DataController, ProjectController, UploadController, NLPController
 from enums import ResponseSignal, AssetTypeEnum
-import aiofiles # async file handling lib
+import asyncio
 import logging
-import os
+import time
+import zipfile
 logger = logging.getLogger("UVicorn.errors")
-from schemas import ProcessRequest
-from models import ChunkModel, ProjectModel, AssetModel
+from schemas import ProcessRequest, ResumableUploadRequest
+from models import ChunkModel, ProjectModel, AssetModel, UploadSessionModel
 from schemas import ChunkSchema, ProjectSchema, AssetSchema
 from bson.objectid import ObjectId
+from typing import List
+from utils import observe_chunks_deduplicated, run_provider_call
 
 data_router = APIRouter(
     prefix="/api/v1/data",
@@ -28,7 +31,7 @@ async def upload_data(request:Request, project_id:str, file:UploadFile,
     project: ProjectSchema = await project_model.get_project_from_db_or_insert_one(project_id=project_id)
 
     # validate file properties
-    data_controller = DataController()
+    data_controller = DataController(storage_client=request.app.storage_client)
     is_valid, result_signal = data_controller.validate_uploaded_file(file=file)
 
     if not is_valid:
@@ -40,17 +43,15 @@ async def upload_data(request:Request, project_id:str, file:UploadFile,
             }
         )
     
-    # handle file storage step 1:
-    file_path, file_id = data_controller.generate_unique_filepath(
-        orig_file_name=file.filename,
-        project_id=project_id
-    )
-    
-    # handle file storage step 2:
+    # handle file storage: streamed to the storage backend (in a worker thread, its client is blocking)
     try:
-        async with aiofiles.open(file_path, "wb") as f:
-            while chunk := await file.read(app_settings.MAX_CHUNK_SIZE) :
-                await f.write(chunk)
+        is_saved, result_signal, file_id, file_size = await asyncio.to_thread(
+            data_controller.save_file,
+            file_obj=file.file,
+            orig_file_name=file.filename,
+            project_id=project_id,
+            max_size=app_settings.FILE_MAX_SIZE * data_controller.size_scale,
+        )
 
     except Exception as e:
         # logging the error message for me 
@@ -64,6 +65,14 @@ async def upload_data(request:Request, project_id:str, file:UploadFile,
             }
         )
 
+    if not is_saved:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": result_signal
+            }
+        )
+
     asset_model = await AssetModel.create_instance(
         db_client=db_client
     )
@@ -72,7 +81,7 @@ async def upload_data(request:Request, project_id:str, file:UploadFile,
         asset_project_id = project.id,
         asset_type = AssetTypeEnum.FILE.value,
         asset_name = file_id,
-        asset_size = os.path.getsize(file_path)
+        asset_size = file_size
     )
     
     asset_resource = await asset_model.insert_asset_in_db(asset_resource)
@@ -87,6 +96,700 @@ async def upload_data(request:Request, project_id:str, file:UploadFile,
             }
         )
 
+@data_router.post("/upload/bulk/{project_id}")
+async def upload_data_bulk(request: Request, project_id: str, files: List[UploadFile] = File(...),
+                           do_process: int = Form(0), chunk_size: int = Form(100), overlap_size: int = Form(20),
+                           app_settings: Settings = Depends(get_settings)):
+    """
+    Upload many files and / or zip archives at once (archives are expanded into their members),
+    the assets are recorded with one bulk write and optionally processed right away.
+    """
+
+    db_client = request.app.db_client
+    project_model = await ProjectModel.create_instance(db_client=db_client)
+
+    project: ProjectSchema = await project_model.get_project_from_db_or_insert_one(project_id=project_id)
+
+    data_controller = DataController(storage_client=request.app.storage_client)
+    max_file_size = app_settings.FILE_MAX_SIZE * data_controller.size_scale
+
+    # step1: list the files to store, validated (with their declared size)
+    uploads, rejected_files, archives, archive_files = [], [], [], []
+
+    try:
+        for file in files:
+
+            if not data_controller.is_archive_file(file):
+                is_valid, result_signal = data_controller.validate_uploaded_file(file=file)
+                if not is_valid:
+                    rejected_files.append({ "file_name": file.filename, "signal": result_signal })
+                    continue
+
+                uploads.append((file.filename, file.size, file))
+                continue
+
+            # only the archive's central directory is read here
+            try:
+                archive, archive_file = await asyncio.to_thread(data_controller.open_archive, file.file)
+            except zipfile.BadZipFile:
+                rejected_files.append({ "file_name": file.filename, "signal": ResponseSignal.FILE_UPLOAD_FAILED.value })
+                continue
+
+            archives.append(archive)
+            archive_files.append(archive_file)
+            for member in data_controller.get_archive_members(archive):
+                is_valid, result_signal = data_controller.validate_archive_member(member)
+                if not is_valid:
+                    rejected_files.append({ "file_name": member.filename, "signal": result_signal })
+                    continue
+
+                uploads.append((member.filename, member.file_size, (archive, member)))
+
+        # step2: request limits (a zip member is never decompressed past its declared size)
+        if len(uploads) > app_settings.BULK_UPLOAD_MAX_FILES:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.BULK_UPLOAD_FILES_COUNT_EXCEEDED.value
+                }
+            )
+
+        if sum(file_size or 0 for _, file_size, _ in uploads) > app_settings.BULK_UPLOAD_MAX_SIZE * data_controller.size_scale:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.BULK_UPLOAD_SIZE_EXCEEDED.value
+                }
+            )
+
+        # step3: write the files concurrently
+        write_slots = asyncio.Semaphore(app_settings.BULK_UPLOAD_CONCURRENCY)
+
+        async def save_upload(source):
+            async with write_slots:
+                if isinstance(source, tuple):
+                    archive, member = source
+                    return await asyncio.to_thread(
+                        data_controller.save_archive_member,
+                        archive=archive, member=member, project_id=project_id, max_size=max_file_size
+                    )
+
+                return await asyncio.to_thread(
+                    data_controller.save_file,
+                    file_obj=source.file, orig_file_name=source.filename, project_id=project_id, max_size=max_file_size
+                )
+
+        saved_files = await asyncio.gather(
+            *[ save_upload(source) for _, _, source in uploads ],
+            return_exceptions=True,
+        )
+
+    finally:
+        for archive in archives:
+            archive.close()
+        for archive_file in archive_files:
+            archive_file.close()
+
+    uploaded_assets = []
+    for (file_name, _, _), saved_file in zip(uploads, saved_files):
+        if isinstance(saved_file, Exception):
+            logger.error(f"error while uploading {file_name}: {saved_file}")
+            rejected_files.append({ "file_name": file_name, "signal": ResponseSignal.FILE_UPLOAD_FAILED.value })
+            continue
+
+        is_saved, result_signal, file_id, file_size = saved_file
+        if not is_saved:
+            rejected_files.append({ "file_name": file_name, "signal": result_signal })
+            continue
+
+        uploaded_assets.append(AssetSchema(
+            asset_project_id = project.id,
+            asset_type = AssetTypeEnum.FILE.value,
+            asset_name = file_id,
+            asset_size = file_size
+        ))
+
+    if not uploaded_assets:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.FILE_UPLOAD_FAILED.value,
+                "rejected_files": rejected_files,
+            }
+        )
+
+    # step4: record all the assets in one bulk write
+    asset_model = await AssetModel.create_instance(
+        db_client=db_client
+    )
+    uploaded_assets = await asset_model.insert_many_assets_in_db(uploaded_assets)
+
+    response_content = {
+        "signal": ResponseSignal.FILE_UPLOAD_SUCCESS.value,
+        "uploaded_files": [
+            { "file_id": asset.asset_name, "asset_size": asset.asset_size }
+            for asset in uploaded_assets
+        ],
+        "rejected_files": rejected_files,
+    }
+
+    # step5 (optional): chunk the new files right away
+    if do_process == 1:
+        chunk_model = await ChunkModel.create_instance(
+            db_client=db_client
+        )
+
+        processing_result = await process_project_files(
+            project=project,
+            project_files_ids={ asset.id: asset.asset_name for asset in uploaded_assets },
+            chunk_size=chunk_size,
+            overlap_size=overlap_size,
+            chunk_model=chunk_model,
+            asset_model=asset_model,
+            storage_client=request.app.storage_client,
+        )
+
+        if processing_result is None:
+            response_content["processing_signal"] = ResponseSignal.PROCESSING_FAILED.value
+        else:
+            response_content["processing_signal"] = ResponseSignal.PROCESSING_COMPLETED.value
+            response_content.update(processing_result)
+
+    return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=response_content
+        )
+
+@data_router.post("/upload/resumable/{project_id}")
+async def create_resumable_upload(request: Request, project_id: str, upload_request: ResumableUploadRequest):
+    """
+    Open a resumable upload session: the file is then sent in byte ranges (PUT, in any order,
+    possibly in parallel), the received ranges can be queried to resume, and it's completed with
+    /complete. A session without a new part for RESUMABLE_UPLOAD_TTL_SECONDS expires.
+    """
+
+    db_client = request.app.db_client
+    project_model = await ProjectModel.create_instance(db_client=db_client)
+
+    project: ProjectSchema = await project_model.get_project_from_db_or_insert_one(project_id=project_id)
+
+    upload_controller = UploadController(project_id=project_id, storage_client=request.app.storage_client)
+    is_valid, result_signal = upload_controller.validate_upload(
+        file_name=upload_request.file_name,
+        file_size=upload_request.file_size
+    )
+
+    if not is_valid:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": result_signal
+            }
+        )
+
+    upload_session_model = await UploadSessionModel.create_instance(db_client=db_client)
+    upload_session = await upload_session_model.insert_upload_session_in_db(
+        project_id=project.id,
+        file_name=upload_request.file_name,
+        file_size=upload_request.file_size,
+        checksum=upload_request.checksum_sha256,
+    )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "signal": ResponseSignal.UPLOAD_SESSION_CREATED.value,
+            "upload_id": upload_session.upload_id,
+            "max_part_size": upload_controller.app_settings.RESUMABLE_UPLOAD_MAX_PART_SIZE * upload_controller.size_scale,
+            "expires_at": upload_session.upload_expires_at.isoformat(),
+        }
+    )
+
+async def get_upload_session(request: Request, project_id: str, upload_id: str, extend_expiry: bool = False):
+    db_client = request.app.db_client
+    project_model = await ProjectModel.create_instance(db_client=db_client)
+    project: ProjectSchema = await project_model.get_project_from_db_or_insert_one(project_id=project_id)
+
+    upload_session_model = await UploadSessionModel.create_instance(db_client=db_client)
+    upload_session = await upload_session_model.get_upload_session_from_db(
+        upload_id=upload_id,
+        project_id=project.id,
+        extend_expiry=extend_expiry,
+    )
+
+    return project, upload_session_model, upload_session
+
+async def get_upload_ranges_content(upload_controller: UploadController, upload_id: str, file_size: int):
+    # byte ranges are reported like in Content-Range: first and last byte included
+    received_ranges = await asyncio.to_thread(upload_controller.get_received_ranges, upload_id=upload_id)
+    missing_ranges = upload_controller.get_missing_ranges(received_ranges=received_ranges, file_size=file_size)
+
+    return {
+        "file_size": file_size,
+        "received_bytes": sum(end - start for start, end in received_ranges),
+        "received_ranges": [ [start, end - 1] for start, end in received_ranges ],
+        "missing_ranges": [ [start, end - 1] for start, end in missing_ranges ],
+    }
+
+@data_router.put("/upload/resumable/{project_id}/{upload_id}")
+async def upload_resumable_part(request: Request, project_id: str, upload_id: str):
+    """
+    Send one byte range of the file: raw bytes as the body, `Content-Range: bytes <first>-<last>/<size>`,
+    and optionally `X-Part-Checksum-SHA256` (hex digest of the part).
+    """
+
+    _, _, upload_session = await get_upload_session(request, project_id, upload_id, extend_expiry=True)
+    if upload_session is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.UPLOAD_SESSION_NOT_FOUND.value
+            }
+        )
+
+    upload_controller = UploadController(project_id=project_id, storage_client=request.app.storage_client)
+    part_range = upload_controller.parse_content_range(
+        content_range=request.headers.get("content-range"),
+        file_size=upload_session.upload_file_size
+    )
+
+    if part_range is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.UPLOAD_PART_INVALID.value
+            }
+        )
+
+    start, end = part_range
+    is_saved, result_signal = await upload_controller.save_part(
+        upload_id=upload_id,
+        start=start,
+        end=end,
+        stream=request.stream(),
+        checksum=request.headers.get("x-part-checksum-sha256"),
+    )
+
+    if not is_saved:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": result_signal
+            }
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "signal": result_signal,
+            **(await get_upload_ranges_content(upload_controller, upload_id, upload_session.upload_file_size)),
+        }
+    )
+
+@data_router.get("/upload/resumable/{project_id}/{upload_id}")
+async def get_resumable_upload(request: Request, project_id: str, upload_id: str):
+    # where to resume from: the received and the missing byte ranges
+
+    _, _, upload_session = await get_upload_session(request, project_id, upload_id)
+    if upload_session is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.UPLOAD_SESSION_NOT_FOUND.value
+            }
+        )
+
+    upload_controller = UploadController(project_id=project_id, storage_client=request.app.storage_client)
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "signal": ResponseSignal.UPLOAD_SESSION_RETRIEVED.value,
+            "upload_id": upload_id,
+            "file_name": upload_session.upload_file_name,
+            "expires_at": upload_session.upload_expires_at.isoformat(),
+            **(await get_upload_ranges_content(upload_controller, upload_id, upload_session.upload_file_size)),
+        }
+    )
+
+@data_router.post("/upload/resumable/{project_id}/{upload_id}/complete")
+async def complete_resumable_upload(request: Request, project_id: str, upload_id: str):
+    # assemble the parts into the project file, verify its checksum and record the asset
+
+    project, upload_session_model, upload_session = await get_upload_session(request, project_id, upload_id)
+    if upload_session is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.UPLOAD_SESSION_NOT_FOUND.value
+            }
+        )
+
+    upload_controller = UploadController(project_id=project_id, storage_client=request.app.storage_client)
+    file_size = upload_session.upload_file_size
+
+    received_ranges = await asyncio.to_thread(upload_controller.get_received_ranges, upload_id=upload_id)
+    if upload_controller.get_missing_ranges(received_ranges=received_ranges, file_size=file_size):
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.UPLOAD_INCOMPLETE.value,
+                **(await get_upload_ranges_content(upload_controller, upload_id, file_size)),
+            }
+        )
+
+    # the session is claimed first, so a concurrent /complete can't assemble the same parts
+    if not await upload_session_model.delete_upload_session_from_db(upload_id=upload_id):
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.UPLOAD_SESSION_NOT_FOUND.value
+            }
+        )
+
+    file_path = await asyncio.to_thread(
+        upload_controller.assemble_file,
+        upload_id=upload_id,
+        file_size=file_size,
+    )
+
+    if file_path is None:
+        # the parts are kept (assemble_file gives them back): the session is restored so the
+        # missing bytes can be re-sent and the upload completed again
+        await upload_session_model.restore_upload_session_in_db(upload_session)
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.UPLOAD_INCOMPLETE.value,
+                **(await get_upload_ranges_content(upload_controller, upload_id, file_size)),
+            }
+        )
+
+    if upload_session.upload_checksum:
+        file_checksum = await asyncio.to_thread(upload_controller.get_file_checksum, file_path)
+        if file_checksum != upload_session.upload_checksum.lower():
+            await asyncio.to_thread(upload_controller.remove_upload, upload_id=upload_id)
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.UPLOAD_CHECKSUM_MISMATCH.value
+                }
+            )
+
+    # hand the assembled file over to the storage backend
+    data_controller = DataController(storage_client=request.app.storage_client)
+    file_key, file_id = data_controller.generate_unique_file_id(
+        orig_file_name=upload_session.upload_file_name,
+        project_id=project_id
+    )
+
+    try:
+        await asyncio.to_thread(upload_controller.store_file, file_path=file_path, file_key=file_key)
+    except Exception as e:
+        logger.error(f"error while storing upload {upload_id}: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.FILE_UPLOAD_FAILED.value
+            }
+        )
+    finally:
+        await asyncio.to_thread(upload_controller.remove_upload, upload_id=upload_id)
+
+    asset_model = await AssetModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    asset_resource = await asset_model.insert_asset_in_db(AssetSchema(
+        asset_project_id = project.id,
+        asset_type = AssetTypeEnum.FILE.value,
+        asset_name = file_id,
+        asset_size = file_size
+    ))
+
+    return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "signal": ResponseSignal.FILE_UPLOAD_SUCCESS.value,
+                "file_id": file_id,
+                "asset_size": asset_resource.asset_size,
+            }
+        )
+
+@data_router.delete("/upload/resumable/{project_id}/{upload_id}")
+async def delete_resumable_upload(request: Request, project_id: str, upload_id: str):
+    # abort an upload: its session and received parts are removed
+
+    _, upload_session_model, upload_session = await get_upload_session(request, project_id, upload_id)
+    if upload_session is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.UPLOAD_SESSION_NOT_FOUND.value
+            }
+        )
+
+    await upload_session_model.delete_upload_session_from_db(upload_id=upload_id)
+    upload_controller = UploadController(project_id=project_id, storage_client=request.app.storage_client)
+    await asyncio.to_thread(upload_controller.remove_upload, upload_id=upload_id)
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "signal": ResponseSignal.UPLOAD_SESSION_DELETED.value
+        }
+    )
+
+@data_router.delete("/asset/{project_id}/{file_id}")
+async def delete_asset(request: Request, project_id: str, file_id: str):
+    """
+    Remove one file from the project: its chunks, its vectors, its asset record and the stored file,
+    without re-indexing the rest of the project.
+    """
+    db_client = request.app.db_client
+
+    project_model = await ProjectModel.create_instance(db_client=db_client)
+    project: ProjectSchema = await project_model.get_project_from_db_or_insert_one(project_id=project_id)
+
+    asset_model = await AssetModel.create_instance(db_client=db_client)
+    asset_record = await asset_model.get_asset_record_from_db(asset_project_id=project.id, asset_name=file_id)
+
+    if asset_record is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.FILE_ID_ERROR.value
+            }
+        )
+
+    chunk_model = await ChunkModel.create_instance(db_client=db_client)
+    nlp_controller = NLPController(
+        vectordb_client=request.app.vectordb_client,
+        generation_client=request.app.generation_client,
+        embedding_client=request.app.embedding_client,
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
+    )
+
+    removal_result = await remove_asset_content(project=project, asset_id=asset_record.id,
+                                                chunk_model=chunk_model, nlp_controller=nlp_controller)
+    if removal_result is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.INSERT_INTO_VECTORDB_ERROR.value
+            }
+        )
+
+    _ = await asset_model.delete_asset_from_db(asset_id=asset_record.id)
+
+    storage_client = request.app.storage_client
+    await asyncio.to_thread(storage_client.delete, storage_client.get_object_key(project_id, file_id))
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "signal": ResponseSignal.ASSET_DELETED.value,
+            "file_id": file_id,
+            **removal_result,
+        }
+    )
+
+@data_router.put("/asset/{project_id}/{file_id}")
+async def replace_asset(request: Request, project_id: str, file_id: str, file: UploadFile,
+                        chunk_size: int = Form(100), overlap_size: int = Form(20),
+                        app_settings: Settings = Depends(get_settings)):
+    """
+    Replace one file of the project: the new file keeps the asset, the old file's chunks and vectors
+    are removed and only the new file is processed (and indexed, when the project already is).
+    """
+    db_client = request.app.db_client
+
+    project_model = await ProjectModel.create_instance(db_client=db_client)
+    project: ProjectSchema = await project_model.get_project_from_db_or_insert_one(project_id=project_id)
+
+    asset_model = await AssetModel.create_instance(db_client=db_client)
+    asset_record = await asset_model.get_asset_record_from_db(asset_project_id=project.id, asset_name=file_id)
+
+    if asset_record is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.FILE_ID_ERROR.value
+            }
+        )
+
+    storage_client = request.app.storage_client
+    data_controller = DataController(storage_client=storage_client)
+    is_valid, result_signal = data_controller.validate_uploaded_file(file=file)
+
+    if not is_valid:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": result_signal
+            }
+        )
+
+    # the new file is stored under a new file id, the old one stays until the asset is switched over
+    try:
+        is_saved, result_signal, new_file_id, file_size = await asyncio.to_thread(
+            data_controller.save_file,
+            file_obj=file.file,
+            orig_file_name=file.filename,
+            project_id=project_id,
+            max_size=app_settings.FILE_MAX_SIZE * data_controller.size_scale,
+        )
+
+    except Exception as e:
+        logger.error(f"error while uploading: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.FILE_UPLOAD_FAILED.value
+            }
+        )
+
+    if not is_saved:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": result_signal
+            }
+        )
+
+    chunk_model = await ChunkModel.create_instance(db_client=db_client)
+    nlp_controller = NLPController(
+        vectordb_client=request.app.vectordb_client,
+        generation_client=request.app.generation_client,
+        embedding_client=request.app.embedding_client,
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
+    )
+
+    removal_result = await remove_asset_content(project=project, asset_id=asset_record.id,
+                                                chunk_model=chunk_model, nlp_controller=nlp_controller)
+    if removal_result is None:
+        await asyncio.to_thread(storage_client.delete, storage_client.get_object_key(project_id, new_file_id))
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.INSERT_INTO_VECTORDB_ERROR.value
+            }
+        )
+
+    _ = await asset_model.update_asset_file_in_db(asset_id=asset_record.id, asset_name=new_file_id,
+                                                  asset_size=file_size)
+    await asyncio.to_thread(storage_client.delete, storage_client.get_object_key(project_id, file_id))
+
+    processing_result = await process_project_files(
+        project=project,
+        project_files_ids={ asset_record.id: new_file_id },
+        chunk_size=chunk_size,
+        overlap_size=overlap_size,
+        chunk_model=chunk_model,
+        asset_model=asset_model,
+        storage_client=storage_client,
+    )
+
+    if processing_result is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.PROCESSING_FAILED.value,
+                "file_id": new_file_id,
+            }
+        )
+
+    # a project that isn't indexed yet gets the new file with its next push
+    indexed_chunks = 0
+    if removal_result["is_indexed"]:
+        indexed_chunks = await index_asset_chunks(project=project, asset_id=asset_record.id,
+                                                  chunk_model=chunk_model, nlp_controller=nlp_controller)
+        if indexed_chunks is None:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.INSERT_INTO_VECTORDB_ERROR.value,
+                    "file_id": new_file_id,
+                }
+            )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "signal": ResponseSignal.ASSET_REPLACED.value,
+            "file_id": new_file_id,
+            "replaced_file_id": file_id,
+            **removal_result,
+            **processing_result,
+            "indexed_chunks": indexed_chunks,
+        }
+    )
+
+
+async def remove_asset_content(project: ProjectSchema, asset_id: ObjectId,
+                               chunk_model: ChunkModel, nlp_controller: NLPController):
+    """
+    Remove an asset's chunks and their points (deleted by the asset_id payload filter).
+    Near-duplicates other assets hold of its chunks get a new canonical chunk, indexed right away.
+
+    Returns the removal report, None when the promoted chunks can't be indexed.
+    """
+    promoted_chunks = await chunk_model.promote_duplicates_of_asset(project_id=project.id, asset_id=asset_id)
+
+    # False when the project has no collection yet (never pushed): nothing to delete nor to index
+    is_indexed = await asyncio.to_thread(nlp_controller.delete_asset_vectors, project=project, asset_id=asset_id)
+
+    deleted_count = await chunk_model.delete_chunks_from_db_by_asset_id(project_id=project.id, asset_id=asset_id)
+
+    if is_indexed and promoted_chunks:
+        is_inserted = await run_provider_call(
+            nlp_controller.index_into_vector_db,
+            project=project,
+            chunks=promoted_chunks,
+            chunks_ids=[ nlp_controller.get_point_id(chunk.id) for chunk in promoted_chunks ],
+        )
+        if not is_inserted:
+            return None
+
+    return {
+        "deleted_chunks": deleted_count,
+        "promoted_chunks": len(promoted_chunks),
+        "is_indexed": bool(is_indexed),
+    }
+
+
+async def index_asset_chunks(project: ProjectSchema, asset_id: ObjectId,
+                             chunk_model: ChunkModel, nlp_controller: NLPController):
+    # index (upsert) the canonical chunks of one asset, page by page like a project push
+    indexed_count = 0
+    page_no = 1
+
+    while True:
+        page_chunks = await chunk_model.get_poject_chunks(project_id=project.id, page_no=page_no,
+                                                          canonical_only=True, asset_id=asset_id)
+        if not page_chunks:
+            break
+        page_no += 1
+
+        is_inserted = await run_provider_call(
+            nlp_controller.index_into_vector_db,
+            project=project,
+            chunks=page_chunks,
+            chunks_ids=[ nlp_controller.get_point_id(chunk.id) for chunk in page_chunks ],
+        )
+        if not is_inserted:
+            return None
+
+        indexed_count += len(page_chunks)
+
+    return indexed_count
+
 @data_router.post("/process/{project_id}")
 async def process_endpoint(request: Request, project_id:str, process_request:ProcessRequest):
     
@@ -152,63 +855,133 @@ async def process_endpoint(request: Request, project_id:str, process_request:Pro
             }
         )
     
-    process_controller = ProcessController(project_id=project_id)
-
-    number_of_inserted_records = 0
-    number_of_processed_files = 0
-
-    
     chunk_model = await ChunkModel.create_instance(
     db_client=db_client
     )
 
     if do_reset == 1:
+            # the points of the deleted chunks leave the live index first: a later push without reset
+            # only upserts the new chunks' points (their ids come from the chunk ids)
+            project_assets = await asset_model.get_all_project_assets_from_db(
+                asset_project_id=project.id,
+                asset_type=AssetTypeEnum.FILE.value,
+            )
+            if project_assets:
+                nlp_controller = NLPController(
+                    vectordb_client=request.app.vectordb_client,
+                    generation_client=request.app.generation_client,
+                    embedding_client=request.app.embedding_client,
+                    template_parser=request.app.template_parser,
+                    embedding_clients=request.app.embedding_clients,
+                )
+                _ = await asyncio.to_thread(nlp_controller.delete_assets_vectors, project=project,
+                                            asset_ids=[ asset.id for asset in project_assets ])
+
             _ = await chunk_model.delete_chunks_from_db_by_project_id(
                 project_id=project.id
             )
     
+    processing_result = await process_project_files(
+        project=project,
+        project_files_ids=project_files_ids,
+        chunk_size=chunk_size,
+        overlap_size=overlap_size,
+        chunk_model=chunk_model,
+        asset_model=asset_model,
+        storage_client=request.app.storage_client,
+    )
+
+    if processing_result is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.PROCESSING_FAILED.value
+            }
+        )
+
+    # return file_chunks # to see the chunks for single file_processed in postman
+    
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "signal": ResponseSignal.PROCESSING_COMPLETED.value,
+            **processing_result,
+        }
+    )
+
+
+async def process_project_files(project: ProjectSchema, project_files_ids: dict,
+                                chunk_size: int, overlap_size: int, chunk_model: ChunkModel,
+                                asset_model: AssetModel, storage_client):
+    """
+    Chunk the given project files ({asset_id: file_id}) and store their chunks.
+    Returns the processing report (inserted / failed chunks, processed files, insert throughput),
+    None when a file gives no chunks.
+    """
+    process_controller = ProcessController(project_id=project.project_id, storage_client=storage_client)
+
+    number_of_inserted_records = 0
+    number_of_failed_records = 0
+    number_of_duplicate_records = 0
+    number_of_checked_records = 0
+    number_of_processed_files = 0
+    insert_seconds = 0.0
+
     for asset_id, file_id in project_files_ids.items():
         
-        file_content = process_controller.get_file_content(file_id=file_id)
+        # loading and splitting are blocking (CPU / disk), keep them off the event loop
+        # so a processing request doesn't stall the interactive ones
+        file_content = await asyncio.to_thread(process_controller.get_file_content, file_id=file_id)
         if file_content is None:
             logger.error(f"Failed to load content for file_id: {file_id}")
             continue
         
-        file_chunks = process_controller.process_file_content(
+        file_chunks = await asyncio.to_thread(
+            process_controller.process_file_content,
             docs=file_content, 
             chunk_size=chunk_size,
             overlap_size=overlap_size
         )
 
         if file_chunks is None or len(file_chunks) == 0:
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "signal": ResponseSignal.PROCESSING_FAILED.value
-                }
-            )
+            return None
         
-        file_chunks_records = [ # to make a list of valid pydantic (obj) chunks for the file
-            ChunkSchema(
-                chunk_text=chunk.page_content,
-                chunk_metadata=chunk.metadata,
-                chunk_order=idx+1,
-                chunk_project_id=project.id,
-                chunk_asset_id=asset_id
-            )
-            for idx, chunk in enumerate(file_chunks)
-        ]
+        # the document metadata is stored once on the asset, chunks only keep their own fields
+        document_metadata, chunks_metadata = process_controller.split_document_metadata(file_chunks)
+        _ = await asset_model.update_asset_metadata_in_db(asset_id=asset_id, asset_metadata=document_metadata)
+
+        # raw chunk documents, validated per file instead of one pydantic model per chunk
+        file_chunks_records, invalid_count = ChunkSchema.get_records(
+            texts=[ chunk.page_content for chunk in file_chunks ],
+            metadata=chunks_metadata,
+            project_id=project.id,
+            asset_id=asset_id,
+        )
+
+        # near-duplicates of the project's chunks (or of this file's) only reference their canonical chunk
+        if process_controller.app_settings.CHUNK_DEDUP_ENABLED:
+            fingerprint_bands = await asyncio.to_thread(process_controller.fingerprint_chunk_records, file_chunks_records)
+            known_chunks = await chunk_model.get_canonical_chunks_by_bands(project_id=project.id, bands=fingerprint_bands)
+            duplicates_count = process_controller.mark_near_duplicates(file_chunks_records, known_chunks)
+
+            observe_chunks_deduplicated(checked=len(file_chunks_records), duplicates=duplicates_count)
+            number_of_duplicate_records += duplicates_count
+            number_of_checked_records += len(file_chunks_records)
 
-        number_of_inserted_records += await chunk_model.insert_many_chunks_in_db(chunks=file_chunks_records)
+        started_at = time.perf_counter()
+        inserted_count, failed_count = await chunk_model.insert_many_chunk_records_in_db(records=file_chunks_records)
+        insert_seconds += time.perf_counter() - started_at
+
+        number_of_inserted_records += inserted_count
+        number_of_failed_records += failed_count + invalid_count
         number_of_processed_files += 1
-    
-    # return file_chunks # to see the chunks for single file_processed in postman
-    
-    return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content={
-            "signal": ResponseSignal.PROCESSING_COMPLETED.value,
-            "inserted_chunks": number_of_inserted_records,
-            "processed_files": number_of_processed_files
-        }
-    )
+
+    return {
+        "inserted_chunks": number_of_inserted_records,
+        "failed_chunks": number_of_failed_records,
+        "duplicate_chunks": number_of_duplicate_records,
+        # share of the fingerprinted chunks found to be near-duplicates, in [0, 1]
+        "dedup_ratio": round(number_of_duplicate_records / number_of_checked_records, 4) if number_of_checked_records else 0.0,
+        "processed_files": number_of_processed_files,
+        "chunks_per_second": round(number_of_inserted_records / insert_seconds, 1) if insert_seconds > 0 else None,
+    }
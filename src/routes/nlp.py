@@ -1,12 +1,24 @@
-from fastapi import FastAPI, APIRouter, status, Request
+from fastapi import FastAPI, APIRouter, Depends, status, Request
 from fastapi.responses import JSONResponse
-from schemas import PushRequest, SearchRequest, RetrievedDocumentSchema
+from schemas import PushRequest, SearchRequest, BatchSearchRequest, FederatedSearchRequest, RetrievedDocumentSchema
+from schemas import ProjectSchema, SearchFilter, RebuildIndexRequest
 from models import ProjectModel
 from models import ChunkModel
+from models import SessionModel
+from models import AssetModel
 from controllers import NLPController
 from enums import ResponseSignal
+from helpers import get_settings, Settings
+from utils import observe_index_rebuild, run_provider_call
+from datetime import datetime, timedelta
+from bson import ObjectId
 
+import asyncio
+import contextvars
+import functools
+import json
 import logging
+import time
 
 logger = logging.getLogger('uvicorn.error')
 
@@ -42,17 +54,64 @@ async def index_project(request: Request, project_id: str, push_request: PushReq
         vectordb_client=request.app.vectordb_client,
         generation_client=request.app.generation_client,
         embedding_client=request.app.embedding_client,
-        template_parser=request.app.template_parser
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
     )
 
+    collection_name = nlp_controller.create_collection_name(project_id=project.project_id)
+    is_indexed = await asyncio.to_thread(nlp_controller.vectordb_client.is_collection_existed, collection_name)
+
+    if push_request.do_reset or not is_indexed:
+        # blue-green: the new index version is built next to the live one (which keeps serving)
+        # and swapped in once complete, with the configured embedding model
+        build = await claim_index_build(
+            project=project, project_model=project_model, nlp_controller=nlp_controller,
+            embedding_info=nlp_controller.embedding_clients.get_model_info(nlp_controller.embedding_client),
+        )
+        if build is None:
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={
+                    "signal": ResponseSignal.INDEX_REBUILD_IN_PROGRESS.value
+                }
+            )
+
+        project_index = await run_index_build(
+            project=project, build=build, chunk_model=chunk_model, project_model=project_model,
+            nlp_controller=nlp_controller,
+            fill_collection=functools.partial(index_project_chunks, project=project, chunk_model=chunk_model,
+                                              nlp_controller=nlp_controller,
+                                              embedding_client=nlp_controller.embedding_client),
+        )
+        if project_index is None:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.INSERT_INTO_VECTORDB_ERROR.value
+                }
+            )
+
+        start_index_task(request.app, collect_index_versions(project=project, nlp_controller=nlp_controller,
+                                                             project_index=project_index))
+
+        return JSONResponse(
+            content={
+                "signal": ResponseSignal.INSERT_INTO_VECTORDB_SUCCESS.value,
+                "inserted_items_count": project_index["points_count"],
+                "index_version": project_index["version"],
+            }
+        )
+
     has_records = True
     page_no = 1
     inserted_items_count = 0
-    idx = 0
-    first_iteration = True  # Track first iteration for do_reset
 
     while has_records:
-        page_chunks = await chunk_model.get_poject_chunks(project_id=project.id, page_no=page_no)
+        # near-duplicate chunks aren't embedded again, their canonical chunk is indexed instead
+        page_chunks = await chunk_model.get_poject_chunks(project_id=project.id, page_no=page_no,
+                                                          canonical_only=True)
         if len(page_chunks):
             page_no += 1
         
@@ -60,20 +119,17 @@ async def index_project(request: Request, project_id: str, push_request: PushReq
             has_records = False
             break
 
-        chunks_ids =  list(range(idx, idx + len(page_chunks)))
-        idx += len(page_chunks)
-        
-        # Only apply do_reset on the first iteration to avoid deleting previously inserted vectors
-        should_reset = push_request.do_reset and first_iteration
+        # stable point ids (derived from the chunk ids): pushing again updates the points in place
+        chunks_ids = [ nlp_controller.get_point_id(chunk.id) for chunk in page_chunks ]
         
-        is_inserted = nlp_controller.index_into_vector_db(
+        # embedding + vector insert are blocking, run them in a provider thread so indexing
+        # doesn't stall the interactive requests served by this worker
+        is_inserted = await run_provider_call(
+            nlp_controller.index_into_vector_db,
             project=project,
             chunks=page_chunks,
-            do_reset=should_reset,
             chunks_ids=chunks_ids
         )
-        
-        first_iteration = False  # Set to False after first iteration
 
         if not is_inserted:
             return JSONResponse(
@@ -92,6 +148,81 @@ async def index_project(request: Request, project_id: str, push_request: PushReq
         }
     )
 
+@nlp_router.post("/index/rebuild/{project_id}")
+async def rebuild_index(request: Request, project_id: str, rebuild_request: RebuildIndexRequest):
+    """
+    Build a new index version in the background (re-embedding the project with another model when one
+    is given), verify it, then swap the project's alias to it. The live index serves until the swap.
+    """
+    project_model = await ProjectModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    chunk_model = await ChunkModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    project = await project_model.get_project_from_db_or_insert_one(
+        project_id=project_id
+    )
+
+    # another model comes with its embedding size, neither of them: the configured model
+    embedding_client = None
+    if (rebuild_request.embedding_model_id is None) == (rebuild_request.embedding_size is None):
+        embedding_client = request.app.embedding_clients.get(
+            backend=rebuild_request.embedding_backend,
+            model_id=rebuild_request.embedding_model_id,
+            embedding_size=rebuild_request.embedding_size,
+        )
+
+    if embedding_client is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.EMBEDDING_MODEL_NOT_SUPPORTED.value
+            }
+        )
+
+    nlp_controller = NLPController(
+        vectordb_client=request.app.vectordb_client,
+        generation_client=request.app.generation_client,
+        embedding_client=request.app.embedding_client,
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
+    )
+
+    build = await claim_index_build(project=project, project_model=project_model, nlp_controller=nlp_controller,
+                                    embedding_info=request.app.embedding_clients.get_model_info(embedding_client))
+    if build is None:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={
+                "signal": ResponseSignal.INDEX_REBUILD_IN_PROGRESS.value
+            }
+        )
+
+    async def rebuild():
+        project_index = await run_index_build(
+            project=project, build=build, chunk_model=chunk_model, project_model=project_model,
+            nlp_controller=nlp_controller,
+            fill_collection=functools.partial(index_project_chunks, project=project, chunk_model=chunk_model,
+                                              nlp_controller=nlp_controller, embedding_client=embedding_client),
+        )
+        if project_index is not None:
+            await collect_index_versions(project=project, nlp_controller=nlp_controller, project_index=project_index)
+
+    start_index_task(request.app, rebuild())
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "signal": ResponseSignal.INDEX_REBUILD_STARTED.value,
+            "index_build": get_index_content(build),
+        }
+    )
+
 @nlp_router.get("/index/info/{project_id}")
 async def get_project_index_info(request: Request, project_id: str):
     
@@ -107,7 +238,10 @@ async def get_project_index_info(request: Request, project_id: str):
         vectordb_client=request.app.vectordb_client,
         generation_client=request.app.generation_client,
         embedding_client=request.app.embedding_client,
-        template_parser=request.app.template_parser
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
     )
 
     collection_info = nlp_controller.get_vector_db_collection_info(project=project)
@@ -115,7 +249,83 @@ async def get_project_index_info(request: Request, project_id: str):
     return JSONResponse(
         content={
             "signal": ResponseSignal.VECTORDB_COLLECTION_RETRIEVED.value,
-            "collection_info": collection_info
+            "collection_info": collection_info,
+            "index": get_index_content(project.project_index),
+            "index_build": get_index_content(project.project_index_build),
+        }
+    )
+
+# registered before /index/search/{project_id}, which would otherwise match "federated" as a project_id
+@nlp_router.post("/index/search/federated")
+async def search_index_federated(request: Request, federated_search_request: FederatedSearchRequest,
+                                 app_settings: Settings = Depends(get_settings)):
+
+    project_ids = list(dict.fromkeys(federated_search_request.project_ids))
+    if len(project_ids) == 0 or len(project_ids) > app_settings.FEDERATED_SEARCH_MAX_PROJECTS:
+        return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.FEDERATED_SEARCH_PROJECTS_ERROR.value
+                }
+            )
+
+    project_model = await ProjectModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    projects = await project_model.get_projects_from_db(project_ids=project_ids)
+    if len(projects) == 0:
+        return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.PROJECT_NOT_FOUND_ERROR.value
+                }
+            )
+
+    nlp_controller = NLPController(
+        vectordb_client=request.app.vectordb_client,
+        generation_client=request.app.generation_client,
+        embedding_client=request.app.embedding_client,
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
+    )
+
+    timeout_seconds = app_settings.FEDERATED_SEARCH_TIMEOUT_SECONDS
+    if federated_search_request.timeout_seconds:
+        timeout_seconds = min(federated_search_request.timeout_seconds, timeout_seconds)
+
+    federated_results = await nlp_controller.federated_search_vector_db_collections(
+        projects=projects,
+        text=federated_search_request.text,
+        limit=federated_search_request.limit,
+        per_project_limit=federated_search_request.per_project_limit,
+        timeout_seconds=timeout_seconds,
+    )
+
+    if not federated_results:
+        return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.VECTORDB_SEARCH_ERROR.value
+                }
+            )
+
+    results, projects_status = federated_results
+
+    found_project_ids = { project.project_id for project in projects }
+    projects_status += [
+        { "project_id": project_id, "status": "not_found", "results_count": 0 }
+        for project_id in project_ids
+        if project_id not in found_project_ids
+    ]
+
+    return JSONResponse(
+        content={
+            "signal": ResponseSignal.VECTORDB_SEARCH_SUCCESS.value,
+            "results": results,
+            "projects": projects_status,
         }
     )
 
@@ -134,11 +344,15 @@ async def search_index(request: Request, project_id: str, search_request: Search
         vectordb_client=request.app.vectordb_client,
         generation_client=request.app.generation_client,
         embedding_client=request.app.embedding_client,
-        template_parser=request.app.template_parser
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
     )
 
-    results :RetrievedDocumentSchema = nlp_controller.search_vector_db_collection(
-        project=project, text=search_request.text, limit=search_request.limit
+    results :RetrievedDocumentSchema = await nlp_controller.search_vector_db_collection(
+        project=project, text=search_request.text, limit=search_request.limit,
+        filters=await get_search_filters(request, project, nlp_controller, search_request.filters),
     )
 
     if not results:
@@ -149,16 +363,94 @@ async def search_index(request: Request, project_id: str, search_request: Search
                 }
             )
     
+    if search_request.with_metadata:
+        results_content = await get_hydrated_results(request, project, nlp_controller, results)
+    else:
+        results_content = [ result.dict(exclude={"metadata"}) for result in results ]
+
     return JSONResponse(
         content={
             "signal": ResponseSignal.VECTORDB_SEARCH_SUCCESS.value,
-            "results": [ result.dict()  for result in results ]
+            "results": results_content
         }
     )
 
 
+@nlp_router.post("/index/search/batch/{project_id}")
+async def search_index_batch(request: Request, project_id: str, batch_search_request: BatchSearchRequest,
+                             app_settings: Settings = Depends(get_settings)):
+
+    queries = batch_search_request.queries
+    if len(queries) == 0:
+        return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.SEARCH_BATCH_EMPTY_ERROR.value
+                }
+            )
+
+    if len(queries) > app_settings.SEARCH_BATCH_MAX_QUERIES:
+        return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.SEARCH_BATCH_SIZE_EXCEEDED.value
+                }
+            )
+
+    project_model = await ProjectModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    project = await project_model.get_project_from_db_or_insert_one(
+        project_id=project_id
+    )
+
+    nlp_controller = NLPController(
+        vectordb_client=request.app.vectordb_client,
+        generation_client=request.app.generation_client,
+        embedding_client=request.app.embedding_client,
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
+    )
+
+    batch_results = await nlp_controller.search_many_vector_db_collection(
+        project=project,
+        texts=[ query.text for query in queries ],
+        limits=[ query.limit for query in queries ],
+        filters=await get_search_filters(request, project, nlp_controller, batch_search_request.filters),
+    )
+
+    if batch_results is False:
+        return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={
+                    "signal": ResponseSignal.VECTORDB_SEARCH_ERROR.value
+                }
+            )
+
+    if batch_search_request.with_metadata:
+        # one metadata lookup for all the queries' results
+        all_results = [ result for results in batch_results for result in results ]
+        hydrated_results = iter(await get_hydrated_results(request, project, nlp_controller, all_results))
+        results_content = [ [ next(hydrated_results) for _ in results ] for results in batch_results ]
+    else:
+        results_content = [
+            [ result.dict(exclude={"metadata"}) for result in results ]
+            for results in batch_results
+        ]
+
+    # one entry per query, in the request order (empty list when nothing matched)
+    return JSONResponse(
+        content={
+            "signal": ResponseSignal.VECTORDB_SEARCH_SUCCESS.value,
+            "results": results_content
+        }
+    )
+
 @nlp_router.post("/index/answer/{project_id}")
-async def search_index(request: Request, project_id: str, search_request: SearchRequest):
+async def answer_rag(request: Request, project_id: str, search_request: SearchRequest):
     
     project_model = await ProjectModel.create_instance(
         db_client=request.app.db_client
@@ -172,14 +464,40 @@ async def search_index(request: Request, project_id: str, search_request: Search
         vectordb_client=request.app.vectordb_client,
         generation_client=request.app.generation_client,
         embedding_client=request.app.embedding_client,
-        template_parser=request.app.template_parser
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
     )
 
-    answer, full_prompt, chat_history = nlp_controller.answer_rag_question(
+    session_model = await SessionModel.create_instance(
+        db_client=request.app.db_client,
+        session_cache=request.app.session_cache
+    )
+
+    # a new session is only saved once answered: a failed question leaves nothing behind
+    session = None
+    if search_request.session_id:
+        session = await session_model.get_session_from_db(
+            session_id=search_request.session_id,
+            project_id=project.id
+        )
+
+        if session is None:
+            return JSONResponse(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    content={
+                        "signal": ResponseSignal.SESSION_NOT_FOUND_ERROR.value
+                    }
+                )
+
+    answer, full_prompt, chat_history = await nlp_controller.answer_rag_question(
         project=project,
         query= search_request.text,
         limit= search_request.limit,
-        chat_history=search_request.chat_history  # Pass the chat_history from client
+        # server-side history first, the client-sent chat_history is kept for older clients
+        chat_history=(session.session_messages if session else None) or search_request.chat_history,
+        filters=await get_search_filters(request, project, nlp_controller, search_request.filters),
     )
 
     if not answer:
@@ -190,11 +508,329 @@ async def search_index(request: Request, project_id: str, search_request: Search
                 }
             )
 
+    session_turn = nlp_controller.construct_session_turn(query=search_request.text, answer=answer)
+    if session is None:
+        session = await session_model.insert_session_in_db(project_id=project.id, messages=session_turn)
+    else:
+        # append only the new turn to the session
+        _ = await session_model.append_session_messages(
+            session_id=session.session_id,
+            messages=session_turn
+        )
+
+    response_content = {
+        "signal": ResponseSignal.RAG_ANSWER_SUCCESS.value,
+        "answer": answer,
+        "session_id": session.session_id,
+    }
+
+    if search_request.debug:
+        response_content["full_prompt"] = full_prompt
+        response_content["chat_history"] = chat_history
+
+    return JSONResponse(
+        content=response_content
+    )
+
+
+@nlp_router.delete("/session/{project_id}/{session_id}")
+async def delete_session(request: Request, project_id: str, session_id: str):
+
+    project_model = await ProjectModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    project = await project_model.get_project_from_db_or_insert_one(
+        project_id=project_id
+    )
+
+    session_model = await SessionModel.create_instance(
+        db_client=request.app.db_client,
+        session_cache=request.app.session_cache
+    )
+
+    session = await session_model.get_session_from_db(session_id=session_id, project_id=project.id)
+    if session is None:
+        return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content={
+                    "signal": ResponseSignal.SESSION_NOT_FOUND_ERROR.value
+                }
+            )
+
+    _ = await session_model.delete_session_from_db(session_id=session_id)
+
     return JSONResponse(
         content={
-            "signal": ResponseSignal.RAG_ANSWER_SUCCESS.value,
-            "answer": answer,
-            "full_prompt" :full_prompt,
-            "chat_history" :chat_history,
+            "signal": ResponseSignal.SESSION_DELETED.value,
+            "session_id": session_id,
         }
     )
+
+
+async def get_hydrated_results(request: Request, project: ProjectSchema, nlp_controller: NLPController, results: list):
+    # search results with their chunk metadata + the document metadata stored on their assets
+    asset_model = await AssetModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    documents_metadata = await asset_model.get_assets_metadata_from_db(
+        asset_project_id=project.id,
+        asset_ids=nlp_controller.get_results_asset_ids(results),
+    )
+
+    return nlp_controller.hydrate_results_metadata(results, documents_metadata)
+
+
+async def get_search_filters(request: Request, project: ProjectSchema, nlp_controller: NLPController,
+                             search_filter: SearchFilter = None):
+    """
+    Compile the request filters for the vector db: the asset level conditions (ids, file ids,
+    extensions, upload dates) are resolved into asset ids through mongo, the points only carry
+    their asset_id and page. A near-duplicate chunk is only indexed under its canonical chunk's
+    asset, the canonical chunks of the matched assets' duplicates are matched by point id.
+    """
+    if search_filter is None:
+        return None
+
+    filters = {}
+    asset_conditions = {
+        "asset_ids": search_filter.asset_ids,
+        "asset_names": search_filter.file_ids,
+        "extensions": search_filter.file_extensions or None,
+        "pushed_after": search_filter.uploaded_after,
+        "pushed_before": search_filter.uploaded_before,
+    }
+
+    if any(condition is not None for condition in asset_conditions.values()):
+        asset_model = await AssetModel.create_instance(
+            db_client=request.app.db_client
+        )
+        filters["asset_ids"] = await asset_model.get_assets_ids_by_filter(
+            asset_project_id=project.id,
+            **asset_conditions,
+        )
+
+        if filters["asset_ids"]:
+            chunk_model = await ChunkModel.create_instance(
+                db_client=request.app.db_client
+            )
+            canonical_ids = await chunk_model.get_canonical_ids_of_duplicates(
+                project_id=project.id,
+                asset_ids=[ ObjectId(asset_id) for asset_id in filters["asset_ids"] ],
+            )
+            if canonical_ids:
+                filters["point_ids"] = sorted(nlp_controller.get_point_id(chunk_id) for chunk_id in canonical_ids)
+
+    if search_filter.page_from is not None:
+        filters["page_from"] = search_filter.page_from
+    if search_filter.page_to is not None:
+        filters["page_to"] = search_filter.page_to
+
+    return filters or None
+
+
+def get_index_content(index: dict = None):
+    # an index version / build record, JSON ready
+    if index is None:
+        return None
+
+    return json.loads(json.dumps(index, default=lambda value: value.isoformat()))
+
+
+def start_index_task(app, coroutine):
+    # detached from the request: the task outlives the response and gets no request deadline
+    # (created from an empty context, the task copies it instead of the request's one)
+    task = contextvars.Context().run(asyncio.create_task, coroutine)
+    app.index_tasks.add(task)
+    task.add_done_callback(app.index_tasks.discard)
+    return task
+
+
+async def claim_index_build(project: ProjectSchema, project_model: ProjectModel, nlp_controller: NLPController,
+                            embedding_info: dict):
+    """
+    Reserve the next index version of the project for a build with the embedding model `embedding_info`
+    (see EmbeddingClientPool.get_model_info).
+    Returns the build record, None when another build of the project is running.
+    """
+    app_settings = get_settings()
+
+    existing_versions = await asyncio.to_thread(nlp_controller.get_index_versions, project)
+    version = max(
+        [ (project.project_index or {}).get("version") or 0, (project.project_index_build or {}).get("version") or 0 ]
+        + [ existing_version for existing_version, _ in existing_versions ]
+    ) + 1
+
+    started_at = datetime.utcnow()
+    build = {
+        "version": version,
+        "status": "building",
+        "collection_name": nlp_controller.create_version_collection_name(project_id=project.project_id, version=version),
+        "embedding_backend": embedding_info["embedding_backend"],
+        "embedding_model_id": embedding_info["embedding_model_id"],
+        "embedding_size": embedding_info["embedding_size"],
+        "started_at": started_at,
+        "finished_at": None,
+        "indexed_chunks": 0,
+        "error": None,
+    }
+
+    is_claimed = await project_model.claim_index_build(
+        project_id=project.id,
+        build=build,
+        stale_before=started_at - timedelta(seconds=app_settings.INDEX_REBUILD_STALE_SECONDS),
+    )
+
+    return build if is_claimed else None
+
+
+async def run_index_build(project: ProjectSchema, build: dict, chunk_model: ChunkModel, project_model: ProjectModel,
+                          nlp_controller: NLPController, fill_collection,
+                          expected_count: int = None, swap_documents=None):
+    """
+    Build the claimed index version: `fill_collection(collection_name=...)` writes its points (embedding
+    the project's canonical chunks, see index_project_chunks, or restoring a snapshot) and returns their count.
+    The points count is checked against the chunks (or `expected_count`, the chunks the version is built for),
+    then the version is swapped in: the project's live index record first, then its alias.
+
+    When the project's documents change with the version (a snapshot restore), `swap_documents()` writes them
+    once the version is verified, right before the swap, and returns the coroutine function writing the
+    previous ones back.
+    A failed build is dropped, the live index (and its documents) untouched.
+
+    Returns the new live index record, None when the build failed.
+    """
+    vectordb_client = nlp_controller.vectordb_client
+    alias_name = nlp_controller.create_collection_name(project_id=project.project_id)
+    collection_name = build["collection_name"]
+    version = build["version"]
+
+    started_at = time.perf_counter()
+    is_swapped = False
+    restore_documents = None
+
+    try:
+        await asyncio.to_thread(vectordb_client.create_collection, collection_name=collection_name,
+                                embedding_size=build["embedding_size"], do_reset=True)
+
+        indexed_count = await fill_collection(collection_name=collection_name)
+
+        # the chunks may have changed during the build (re-processed, deleted asset ...): never swap in a partial index
+        if expected_count is None:
+            expected_count = await chunk_model.count_project_chunks(project_id=project.id, canonical_only=True)
+        points_count = await asyncio.to_thread(vectordb_client.count_points, collection_name)
+        if not (indexed_count == points_count == expected_count):
+            raise ValueError(f"count check failed: {indexed_count} indexed, {points_count} points, "
+                             f"{expected_count} chunks")
+
+        finished_at = datetime.utcnow()
+        project_index = {
+            "version": version,
+            "collection_name": collection_name,
+            "embedding_backend": build["embedding_backend"],
+            "embedding_model_id": build["embedding_model_id"],
+            "embedding_size": build["embedding_size"],
+            "points_count": points_count,
+            "swapped_at": finished_at,
+        }
+        if swap_documents is not None:
+            restore_documents = await swap_documents()
+
+        # the requests switch with the project record (version and embedding model at once),
+        # then the alias follows for the collection level operations
+        is_swapped = await project_model.update_index_build(
+            project_id=project.id,
+            version=version,
+            build_fields={ "status": "swapped", "finished_at": finished_at, "indexed_chunks": indexed_count },
+            project_index=project_index,
+        )
+        if not is_swapped:
+            raise ValueError("the build was taken over by another one")
+
+        await asyncio.to_thread(vectordb_client.swap_alias, alias_name=alias_name, collection_name=collection_name)
+
+        observe_index_rebuild(result="swapped", seconds=time.perf_counter() - started_at)
+        logger.info(f"Index version {version} of project {project.project_id} swapped in ({points_count} points)")
+
+        return project_index
+
+    except (Exception, asyncio.CancelledError) as e:
+        error = "cancelled" if isinstance(e, asyncio.CancelledError) else str(e)
+        logger.error(f"Index version {version} of project {project.project_id} failed: {error}")
+
+        if not is_swapped:
+            await asyncio.to_thread(vectordb_client.delete_collection, collection_name=collection_name)
+
+            if restore_documents is not None:
+                try:
+                    await restore_documents()
+                except Exception as restore_error:
+                    logger.error(f"Writing back the documents of project {project.project_id} failed: {restore_error}")
+
+        await project_model.update_index_build(
+            project_id=project.id,
+            version=version,
+            build_fields={ "status": "failed", "finished_at": datetime.utcnow(), "error": error },
+        )
+        observe_index_rebuild(result="failed", seconds=time.perf_counter() - started_at)
+
+        if isinstance(e, asyncio.CancelledError):
+            raise
+
+        return None
+
+
+async def index_project_chunks(collection_name: str, project: ProjectSchema, chunk_model: ChunkModel,
+                               nlp_controller: NLPController, embedding_client):
+    # embed the project's canonical chunks into `collection_name`, returns the indexed chunks count
+    indexed_count = 0
+    page_no = 1
+    while True:
+        page_chunks = await chunk_model.get_poject_chunks(project_id=project.id, page_no=page_no,
+                                                          canonical_only=True)
+        if not page_chunks:
+            break
+        page_no += 1
+
+        is_inserted = await run_provider_call(
+            nlp_controller.index_into_vector_db,
+            project=project,
+            chunks=page_chunks,
+            chunks_ids=[ nlp_controller.get_point_id(chunk.id) for chunk in page_chunks ],
+            collection_name=collection_name,
+            embedding_client=embedding_client,
+        )
+        if not is_inserted:
+            raise ValueError(f"indexing page {page_no - 1} failed")
+
+        indexed_count += len(page_chunks)
+
+    return indexed_count
+
+
+async def collect_index_versions(project: ProjectSchema, nlp_controller: NLPController, project_index: dict):
+    """
+    Drop the index versions replaced by `project_index` (but the INDEX_PREVIOUS_VERSIONS_TO_KEEP latest ones),
+    after INDEX_GC_DELAY_SECONDS so the searches still running on them can finish.
+    """
+    app_settings = get_settings()
+    await asyncio.sleep(app_settings.INDEX_GC_DELAY_SECONDS)
+
+    try:
+        index_versions = await asyncio.to_thread(nlp_controller.get_index_versions, project)
+        # newer versions are builds in progress
+        previous_versions = [
+            collection_name
+            for version, collection_name in index_versions
+            if version < project_index["version"]
+        ]
+
+        keep_count = max(app_settings.INDEX_PREVIOUS_VERSIONS_TO_KEEP, 0)
+        for collection_name in previous_versions[:max(len(previous_versions) - keep_count, 0)]:
+            await asyncio.to_thread(nlp_controller.vectordb_client.delete_collection, collection_name=collection_name)
+            logger.info(f"Index version {collection_name} collected")
+
+    except Exception as e:
+        logger.error(f"Collecting the old index versions of project {project.project_id} failed: {e}")
+
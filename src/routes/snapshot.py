@@ -0,0 +1,490 @@
+from fastapi import APIRouter, UploadFile, status, Request
+from fastapi.responses import JSONResponse, FileResponse
+from starlette.background import BackgroundTask
+from models import ProjectModel, ChunkModel, AssetModel
+from controllers import NLPController, SnapshotController
+from schemas import ProjectSchema
+from enums import ResponseSignal
+from helpers import get_settings
+from .nlp import claim_index_build, run_index_build, start_index_task, collect_index_versions
+from datetime import datetime
+
+import asyncio
+import functools
+import logging
+
+logger = logging.getLogger('uvicorn.error')
+
+snapshot_router = APIRouter(
+    prefix="/api/v1/snapshot",
+    tags=["api_v1", "snapshot"],
+)
+
+@snapshot_router.post("/{project_id}")
+async def create_snapshot(request: Request, project_id: str):
+    """
+    Export the project's assets and chunks (mongo) with the points of its live index (vectors + payloads)
+    as a snapshot bundle kept in the asset storage, another node restores it without embedding anything.
+    """
+    app_settings = get_settings()
+
+    project_model = await ProjectModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    chunk_model = await ChunkModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    asset_model = await AssetModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    project = await project_model.get_project_from_db_or_insert_one(
+        project_id=project_id
+    )
+
+    nlp_controller = get_nlp_controller(request)
+
+    collection_name = nlp_controller.get_collection_name(project=project)
+    is_indexed = await asyncio.to_thread(nlp_controller.vectordb_client.is_collection_existed, collection_name)
+    if not is_indexed:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_INDEX_NOT_FOUND.value
+            }
+        )
+
+    # the model the live index was built with (the configured one for an index older than the versions)
+    embedding_info = {
+        key: project.project_index[key]
+        for key in ("embedding_backend", "embedding_model_id", "embedding_size")
+    } if project.project_index else request.app.embedding_clients.get_model_info(nlp_controller.embedding_client)
+
+    snapshot_controller = SnapshotController(project_id=project_id, storage_client=request.app.storage_client)
+    snapshot_id = snapshot_controller.generate_snapshot_id()
+    staging_path = snapshot_controller.create_staging_path()
+
+    try:
+        asset_records = await asset_model.get_project_asset_records_from_db(asset_project_id=project.id)
+        await asyncio.to_thread(snapshot_controller.append_documents, staging_path,
+                                SnapshotController.ASSETS_NAME, asset_records)
+
+        chunks_count, canonical_chunks_count = 0, 0
+        async for chunk_records in chunk_model.get_project_chunk_records(project_id=project.id,
+                                                                         batch_size=app_settings.SNAPSHOT_BATCH_SIZE):
+            await asyncio.to_thread(snapshot_controller.append_documents, staging_path,
+                                    SnapshotController.CHUNKS_NAME, chunk_records)
+            chunks_count += len(chunk_records)
+            canonical_chunks_count += sum(1 for record in chunk_records if record.get("chunk_duplicate_of") is None)
+
+        points_count, embedding_size = await asyncio.to_thread(
+            snapshot_controller.write_points, staging_path, nlp_controller.vectordb_client,
+            collection_name, app_settings.SNAPSHOT_BATCH_SIZE,
+        )
+
+        # every canonical chunk has its point: a bundle out of sync with its chunks would restore a partial index
+        if points_count != canonical_chunks_count or (points_count and embedding_size != embedding_info["embedding_size"]):
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={
+                    "signal": ResponseSignal.SNAPSHOT_INDEX_OUT_OF_DATE.value,
+                    "points_count": points_count,
+                    "chunks_count": canonical_chunks_count,
+                }
+            )
+
+        manifest = {
+            "format_version": SnapshotController.FORMAT_VERSION,
+            "snapshot_id": snapshot_id,
+            "project_id": project_id,
+            "index_version": (project.project_index or {}).get("version"),
+            **embedding_info,
+            "assets_count": len(asset_records),
+            "chunks_count": chunks_count,
+            "canonical_chunks_count": canonical_chunks_count,
+            "points_count": points_count,
+            "created_at": datetime.utcnow(),
+        }
+
+        bundle_path = await asyncio.to_thread(snapshot_controller.write_bundle, staging_path, manifest)
+        snapshot_size = await asyncio.to_thread(snapshot_controller.store_bundle, bundle_path, snapshot_id)
+
+    except Exception as e:
+        logger.error(f"Snapshot of project {project_id} failed: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_CREATE_ERROR.value
+            }
+        )
+
+    finally:
+        await asyncio.to_thread(snapshot_controller.remove_staging_path, staging_path)
+
+    return JSONResponse(
+        content={
+            "signal": ResponseSignal.SNAPSHOT_CREATED.value,
+            "snapshot_id": snapshot_id,
+            "snapshot_size": snapshot_size,
+            "assets_count": manifest["assets_count"],
+            "chunks_count": manifest["chunks_count"],
+            "points_count": manifest["points_count"],
+        }
+    )
+
+@snapshot_router.get("/{project_id}/{snapshot_id}")
+async def download_snapshot(request: Request, project_id: str, snapshot_id: str):
+
+    snapshot_controller = SnapshotController(project_id=project_id, storage_client=request.app.storage_client)
+    bundle_path = await get_bundle_path(snapshot_controller, snapshot_id)
+    if bundle_path is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_NOT_FOUND.value
+            }
+        )
+
+    # the bundle's cache copy is released once sent
+    return FileResponse(bundle_path, media_type="application/x-tar", filename=f"{project_id}_{snapshot_id}.tar",
+                        background=BackgroundTask(release_bundle_path, snapshot_controller, snapshot_id))
+
+@snapshot_router.post("/{project_id}/{snapshot_id}/restore")
+async def restore_snapshot(request: Request, project_id: str, snapshot_id: str, source_project_id: str = None):
+    """
+    Restore a stored snapshot into the project (the snapshot of another project can be restored as well).
+    """
+    snapshot_controller = SnapshotController(project_id=project_id, storage_client=request.app.storage_client)
+
+    # a snapshot is looked up under its project, the one restored into by default
+    source_controller = snapshot_controller
+    if source_project_id:
+        source_controller = SnapshotController(project_id=source_project_id, storage_client=request.app.storage_client)
+
+    bundle_path = await get_bundle_path(source_controller, snapshot_id)
+    if bundle_path is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_NOT_FOUND.value
+            }
+        )
+
+    try:
+        return await restore_bundle(request, project_id=project_id, snapshot_controller=snapshot_controller,
+                                    bundle_path=bundle_path)
+    finally:
+        await release_bundle_path(source_controller, snapshot_id)
+
+@snapshot_router.post("/{project_id}/restore")
+async def restore_uploaded_snapshot(request: Request, project_id: str, file: UploadFile):
+    """
+    Restore an uploaded snapshot bundle into the project, it's kept in the asset storage first
+    (under a new snapshot id), so other nodes can restore it as well.
+    """
+    snapshot_controller = SnapshotController(project_id=project_id, storage_client=request.app.storage_client)
+    snapshot_id = snapshot_controller.generate_snapshot_id()
+
+    await asyncio.to_thread(
+        request.app.storage_client.write_fileobj,
+        key=snapshot_controller.get_snapshot_key(snapshot_id),
+        file_obj=file.file,
+    )
+
+    bundle_path = await get_bundle_path(snapshot_controller, snapshot_id)
+    manifest = None
+    if bundle_path is not None:
+        manifest = await asyncio.to_thread(snapshot_controller.read_manifest, bundle_path)
+        if manifest is None:
+            await release_bundle_path(snapshot_controller, snapshot_id)
+
+    if manifest is None:
+        await asyncio.to_thread(request.app.storage_client.delete, snapshot_controller.get_snapshot_key(snapshot_id))
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_INVALID.value
+            }
+        )
+
+    try:
+        return await restore_bundle(request, project_id=project_id, snapshot_controller=snapshot_controller,
+                                    bundle_path=bundle_path, snapshot_id=snapshot_id)
+    finally:
+        await release_bundle_path(snapshot_controller, snapshot_id)
+
+
+def get_nlp_controller(request: Request):
+    return NLPController(
+        vectordb_client=request.app.vectordb_client,
+        generation_client=request.app.generation_client,
+        embedding_client=request.app.embedding_client,
+        template_parser=request.app.template_parser,
+        single_flight=request.app.single_flight,
+        embedding_batcher=request.app.embedding_batcher,
+        embedding_clients=request.app.embedding_clients,
+    )
+
+
+async def get_bundle_path(snapshot_controller: SnapshotController, snapshot_id: str):
+    try:
+        return await asyncio.to_thread(snapshot_controller.get_bundle_path, snapshot_id)
+    except Exception as e:
+        # not a valid key, or not in the storage
+        logger.error(f"Snapshot {snapshot_id} not available: {e}")
+        return None
+
+
+async def release_bundle_path(snapshot_controller: SnapshotController, snapshot_id: str):
+    # a path returned by get_bundle_path is done with
+    await asyncio.to_thread(snapshot_controller.release_bundle_path, snapshot_id)
+
+
+async def restore_bundle(request: Request, project_id: str, snapshot_controller: SnapshotController,
+                         bundle_path: str, snapshot_id: str = None):
+    """
+    Restore a snapshot bundle as a new index version of the project (blue-green, see run_index_build).
+    Nothing is embedded:
+
+    - the bundle's documents are checked first (owned by no other project, as many canonical chunks as points)
+    - its points are written into the new version's collection as they are, and counted
+    - once the version is verified, the project's assets and chunks are replaced by the bundle's ones
+      (the replaced ones are staged), right before the version is swapped in
+
+    Until the swap, a failure leaves the project as it was: the new collection is dropped and the replaced
+    documents are written back.
+    """
+    manifest = await asyncio.to_thread(snapshot_controller.read_manifest, bundle_path)
+    if manifest is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_INVALID.value
+            }
+        )
+
+    # the project is queried with the model the bundle's vectors were computed with
+    embedding_client = request.app.embedding_clients.get(
+        backend=manifest["embedding_backend"],
+        model_id=manifest["embedding_model_id"],
+        embedding_size=manifest["embedding_size"],
+    )
+    if embedding_client is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.EMBEDDING_MODEL_NOT_SUPPORTED.value
+            }
+        )
+
+    project_model = await ProjectModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    chunk_model = await ChunkModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    asset_model = await AssetModel.create_instance(
+        db_client=request.app.db_client
+    )
+
+    project = await project_model.get_project_from_db_or_insert_one(
+        project_id=project_id
+    )
+
+    try:
+        canonical_chunks_count = await check_bundle_documents(project=project, manifest=manifest,
+                                                              bundle_path=bundle_path,
+                                                              snapshot_controller=snapshot_controller,
+                                                              chunk_model=chunk_model, asset_model=asset_model)
+    except ValueError as e:
+        logger.error(f"Snapshot of project {project_id} can't be restored: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_RESTORE_ERROR.value
+            }
+        )
+
+    nlp_controller = get_nlp_controller(request)
+
+    build = await claim_index_build(project=project, project_model=project_model, nlp_controller=nlp_controller,
+                                    embedding_info=request.app.embedding_clients.get_model_info(embedding_client))
+    if build is None:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={
+                "signal": ResponseSignal.INDEX_REBUILD_IN_PROGRESS.value
+            }
+        )
+
+    # the project's documents replaced by the bundle's ones, kept until the restore is over
+    staging_path = snapshot_controller.create_staging_path()
+    try:
+        project_index = await run_index_build(
+            project=project, build=build, chunk_model=chunk_model, project_model=project_model,
+            nlp_controller=nlp_controller,
+            fill_collection=functools.partial(restore_bundle_points, manifest=manifest, bundle_path=bundle_path,
+                                              snapshot_controller=snapshot_controller,
+                                              nlp_controller=nlp_controller),
+            expected_count=canonical_chunks_count,
+            swap_documents=functools.partial(swap_bundle_documents, project=project, bundle_path=bundle_path,
+                                             staging_path=staging_path, snapshot_controller=snapshot_controller,
+                                             chunk_model=chunk_model, asset_model=asset_model),
+        )
+    finally:
+        await asyncio.to_thread(snapshot_controller.remove_staging_path, staging_path)
+
+    if project_index is None:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "signal": ResponseSignal.SNAPSHOT_RESTORE_ERROR.value
+            }
+        )
+
+    start_index_task(request.app, collect_index_versions(project=project, nlp_controller=nlp_controller,
+                                                         project_index=project_index))
+
+    return JSONResponse(
+        content={
+            "signal": ResponseSignal.SNAPSHOT_RESTORED.value,
+            "snapshot_id": snapshot_id or manifest["snapshot_id"],
+            "assets_count": manifest["assets_count"],
+            "chunks_count": manifest["chunks_count"],
+            "points_count": project_index["points_count"],
+            "index_version": project_index["version"],
+        }
+    )
+
+
+async def check_bundle_documents(project: ProjectSchema, manifest: dict, bundle_path: str,
+                                 snapshot_controller: SnapshotController, chunk_model: ChunkModel,
+                                 asset_model: AssetModel):
+    """
+    Check the bundle's documents before anything is written: the documents keep their ids, so none of them
+    may belong to another project of the database, and every canonical chunk must have its point.
+    Returns the bundle's canonical chunks count, raises ValueError otherwise.
+    """
+    app_settings = get_settings()
+
+    asset_ids = []
+    for records in snapshot_controller.iter_documents(bundle_path, SnapshotController.ASSETS_NAME,
+                                                      batch_size=app_settings.SNAPSHOT_BATCH_SIZE):
+        asset_ids.extend(record["_id"] for record in records)
+
+    if await asset_model.count_assets_of_other_projects(asset_project_id=project.id, asset_ids=asset_ids):
+        raise ValueError("the snapshot's assets belong to another project of this database")
+
+    chunks_count, canonical_chunks_count = 0, 0
+    chunk_records = snapshot_controller.iter_documents(bundle_path, SnapshotController.CHUNKS_NAME,
+                                                       batch_size=app_settings.SNAPSHOT_BATCH_SIZE)
+    while (records := await asyncio.to_thread(next, chunk_records, None)) is not None:
+        if await chunk_model.count_chunks_of_other_projects(project_id=project.id,
+                                                            chunk_ids=[ record["_id"] for record in records ]):
+            raise ValueError("the snapshot's chunks belong to another project of this database")
+
+        chunks_count += len(records)
+        canonical_chunks_count += sum(1 for record in records if record.get("chunk_duplicate_of") is None)
+
+    # bundles written before the canonical count was recorded: every canonical chunk had its point
+    expected_count = manifest.get("canonical_chunks_count", manifest["points_count"])
+    if chunks_count != manifest["chunks_count"] or canonical_chunks_count != expected_count \
+            or manifest["points_count"] != expected_count:
+        raise ValueError(f"the snapshot has {canonical_chunks_count} canonical chunks out of {chunks_count}, "
+                         f"for {manifest['points_count']} points")
+
+    return canonical_chunks_count
+
+
+async def restore_bundle_points(collection_name: str, manifest: dict, bundle_path: str,
+                                snapshot_controller: SnapshotController, nlp_controller: NLPController):
+    """
+    Write the bundle's points into `collection_name` (the project's documents aren't touched).
+    Returns the restored points count.
+    """
+    app_settings = get_settings()
+
+    points_count = 0
+    points = snapshot_controller.iter_points(bundle_path, embedding_size=manifest["embedding_size"],
+                                             batch_size=app_settings.SNAPSHOT_BATCH_SIZE)
+    while (batch := await asyncio.to_thread(next, points, None)) is not None:
+        point_ids, payloads, vectors = batch
+        is_inserted = await asyncio.to_thread(
+            nlp_controller.vectordb_client.insert_many,
+            collection_name=collection_name,
+            texts=[ payload["text"] for payload in payloads ],
+            vectors=vectors,
+            metadata=[ payload["metadata"] for payload in payloads ],
+            record_ids=point_ids,
+            batch_size=app_settings.SNAPSHOT_BATCH_SIZE,
+        )
+        if not is_inserted:
+            raise ValueError(f"restoring points {points_count}-{points_count + len(point_ids)} failed")
+
+        points_count += len(point_ids)
+
+    return points_count
+
+
+async def swap_bundle_documents(project: ProjectSchema, bundle_path: str, staging_path: str,
+                                snapshot_controller: SnapshotController, chunk_model: ChunkModel,
+                                asset_model: AssetModel):
+    """
+    Make the bundle's assets and chunks the project's ones (ids kept, the point ids are derived from the
+    chunk ids). The replaced documents are staged first: a failed write puts them back before raising.
+    Returns the coroutine function writing them back (the version swap may still fail).
+    """
+    app_settings = get_settings()
+
+    previous_assets = await asset_model.get_project_asset_records_from_db(asset_project_id=project.id)
+    async for chunk_records in chunk_model.get_project_chunk_records(project_id=project.id,
+                                                                     batch_size=app_settings.SNAPSHOT_BATCH_SIZE):
+        await asyncio.to_thread(snapshot_controller.append_documents, staging_path,
+                                SnapshotController.CHUNKS_NAME, chunk_records)
+
+    async def restore_previous_documents():
+        logger.warning(f"Writing back the documents of project {project.project_id} replaced by the snapshot")
+        await write_project_documents(
+            project=project, asset_records=previous_assets,
+            chunk_batches=snapshot_controller.iter_staged_documents(staging_path, SnapshotController.CHUNKS_NAME,
+                                                                    batch_size=app_settings.SNAPSHOT_BATCH_SIZE),
+            chunk_model=chunk_model, asset_model=asset_model,
+        )
+
+    asset_records = []
+    for records in snapshot_controller.iter_documents(bundle_path, SnapshotController.ASSETS_NAME,
+                                                      batch_size=app_settings.SNAPSHOT_BATCH_SIZE):
+        asset_records.extend(records)
+
+    try:
+        await write_project_documents(
+            project=project, asset_records=asset_records,
+            chunk_batches=snapshot_controller.iter_documents(bundle_path, SnapshotController.CHUNKS_NAME,
+                                                             batch_size=app_settings.SNAPSHOT_BATCH_SIZE),
+            chunk_model=chunk_model, asset_model=asset_model,
+        )
+    except (Exception, asyncio.CancelledError):
+        await restore_previous_documents()
+        raise
+
+    return restore_previous_documents
+
+
+async def write_project_documents(project: ProjectSchema, asset_records: list, chunk_batches,
+                                  chunk_model: ChunkModel, asset_model: AssetModel):
+    # the project's assets and chunks become `asset_records` and the (blocking) iterator's chunk batches
+    app_settings = get_settings()
+
+    await asset_model.replace_project_asset_records_in_db(asset_project_id=project.id, records=asset_records)
+
+    chunk_ids = set()
+    while (records := await asyncio.to_thread(next, chunk_batches, None)) is not None:
+        await chunk_model.replace_chunk_records_in_db(project_id=project.id, records=records)
+        chunk_ids.update(record["_id"] for record in records)
+
+    await chunk_model.delete_chunks_from_db_excluding(project_id=project.id, kept_ids=chunk_ids,
+                                                      batch_size=app_settings.SNAPSHOT_BATCH_SIZE)
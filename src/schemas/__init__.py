@@ -1,6 +1,9 @@
-from .requests.data_schema import ProcessRequest
+from .requests.data_schema import ProcessRequest, ResumableUploadRequest
 from .database.chunk_shema import  ChunkSchema
 from .database.project_shema import ProjectSchema
 from .database.asset_shema import AssetSchema
-from .requests.nlp_schema import PushRequest, SearchRequest
+from .database.session_shema import SessionSchema
+from .database.upload_session_shema import UploadSessionSchema
+from .requests.nlp_schema import PushRequest, SearchRequest, BatchSearchQuery, BatchSearchRequest, FederatedSearchRequest
+from .requests.nlp_schema import SearchFilter, RebuildIndexRequest
 from .database.chunk_shema import RetrievedDocumentSchema
\ No newline at end of file
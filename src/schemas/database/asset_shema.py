@@ -10,7 +10,8 @@ class AssetSchema(BaseModel):
     asset_name: str = Field(..., min_length=1)
     asset_size: int = Field(ge=0, default=None)
     asset_config: dict = Field(default=None)
-    asset_pushed_at: datetime = Field(default=datetime.utcnow)
+    asset_metadata: dict = Field(default=None) # document level metadata (author, title, pages ...), shared by its chunks
+    asset_pushed_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Config:
         arbitrary_types_allowed = True
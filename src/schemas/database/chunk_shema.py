@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional
+from typing import Optional, List
 from bson import ObjectId
 
 class ChunkSchema(BaseModel):
@@ -9,6 +9,10 @@ class ChunkSchema(BaseModel):
     chunk_order: int = Field(..., gt=0)
     chunk_project_id: ObjectId
     chunk_asset_id: Optional[ObjectId] = None
+    # near-duplicate detection: SimHash fingerprint, its LSH bands, and the canonical chunk of a duplicate
+    chunk_fingerprint: Optional[int] = None
+    chunk_fingerprint_bands: Optional[List[str]] = None
+    chunk_duplicate_of: Optional[ObjectId] = None
     
     class Config:
         arbitrary_types_allowed = True
@@ -25,10 +29,66 @@ class ChunkSchema(BaseModel):
                 ],
                 "name": "chunk_project_id_index_1",
                 "unique": False
+            },
+            {
+                "key": [
+                    ("chunk_project_id", 1),
+                    ("chunk_fingerprint_bands", 1)
+                ],
+                "name": "chunk_project_id_fingerprint_bands_index_1",
+                "unique": False
+            },
+            {
+                "key": [
+                    ("chunk_asset_id", 1)
+                ],
+                "name": "chunk_asset_id_index_1",
+                "unique": False
+            },
+            {
+                "key": [
+                    ("chunk_duplicate_of", 1)
+                ],
+                "name": "chunk_duplicate_of_index_1",
+                "unique": False
             }
         ]
     
+    @classmethod
+    def get_records(cls, texts: list, metadata: list, project_id: ObjectId,
+                    asset_id: Optional[ObjectId] = None, first_order: int = 1):
+        """
+        Build the chunk documents of a file (ready for insert_many) without a model per chunk:
+        the fields shared by the batch are validated once, each chunk only gets the checks
+        ChunkSchema would do on its own fields (non empty text, dict metadata).
+
+        Returns (records, invalid chunks count), chunk_order keeps the position in `texts`.
+        """
+        if not isinstance(project_id, ObjectId):
+            raise ValueError("chunk_project_id must be an ObjectId")
+        if asset_id is not None and not isinstance(asset_id, ObjectId):
+            raise ValueError("chunk_asset_id must be an ObjectId")
+        if first_order <= 0:
+            raise ValueError("chunk_order must be greater than 0")
+
+        records, invalid_count = [], 0
+        for idx, (text, text_metadata) in enumerate(zip(texts, metadata)):
+            if not isinstance(text, str) or not text or not isinstance(text_metadata, dict):
+                invalid_count += 1
+                continue
+
+            records.append({
+                "chunk_text": text,
+                "chunk_metadata": text_metadata,
+                "chunk_order": first_order + idx,
+                "chunk_project_id": project_id,
+                "chunk_asset_id": asset_id,
+            })
+
+        return records, invalid_count
+
 
 class RetrievedDocumentSchema(BaseModel):
     score : float
-    text : str
\ No newline at end of file
+    text : str
+    metadata : Optional[dict] = None # per chunk fields (page, start_index, asset_id)
\ No newline at end of file
@@ -6,6 +6,11 @@ from typing import Optional
 class ProjectSchema(BaseModel):
     id : Optional[ObjectId] = Field(None, alias="_id")
     project_id: str = Field(..., min_length=1)  
+    # live vector index version: {"version", "collection_name", "embedding_backend", "embedding_model_id",
+    # "embedding_size", "points_count", "swapped_at"}, None for a collection built before index versions
+    project_index: Optional[dict] = None
+    # last (or running) index rebuild: {"version", "status", "started_at", "finished_at", "error", ...}
+    project_index_build: Optional[dict] = None
 
     # manual validator if the support of Field is not enough ( designed validation )
     @field_validator("project_id")
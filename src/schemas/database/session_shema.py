@@ -0,0 +1,37 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from bson.objectid import ObjectId
+from datetime import datetime
+
+class SessionSchema(BaseModel):
+    id: Optional[ObjectId] = Field(None, alias="_id")
+    session_id: str = Field(..., min_length=1)
+    session_project_id: ObjectId
+    session_messages: List[dict] = Field(default_factory=list) # user / assistant turns, in the generation client format
+    session_created_at: datetime = Field(default_factory=datetime.utcnow)
+    session_expires_at: datetime
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def get_indexes(cls):
+
+        return [
+            {
+                "key": [
+                    ("session_id", 1)
+                ],
+                "name": "session_id_index_1",
+                "unique": True
+            },
+            {
+                # TTL index: mongo removes the session once session_expires_at has passed
+                "key": [
+                    ("session_expires_at", 1)
+                ],
+                "name": "session_expires_at_ttl_index_1",
+                "unique": False,
+                "expire_after_seconds": 0
+            },
+        ]
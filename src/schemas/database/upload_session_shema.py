@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from bson.objectid import ObjectId
+from datetime import datetime
+
+class UploadSessionSchema(BaseModel):
+    id: Optional[ObjectId] = Field(None, alias="_id")
+    upload_id: str = Field(..., min_length=1)
+    upload_project_id: ObjectId
+    upload_file_name: str = Field(..., min_length=1)
+    upload_file_size: int = Field(..., gt=0)
+    upload_checksum: Optional[str] = None # sha256 (hex) of the whole file, verified on completion
+    upload_created_at: datetime = Field(default_factory=datetime.utcnow)
+    upload_expires_at: datetime
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def get_indexes(cls):
+
+        return [
+            {
+                "key": [
+                    ("upload_id", 1)
+                ],
+                "name": "upload_id_index_1",
+                "unique": True
+            },
+            {
+                # TTL index: mongo removes abandoned upload sessions (their parts are swept from disk)
+                "key": [
+                    ("upload_expires_at", 1)
+                ],
+                "name": "upload_expires_at_ttl_index_1",
+                "unique": False,
+                "expire_after_seconds": 0
+            },
+        ]
@@ -5,4 +5,9 @@ class ProcessRequest(BaseModel): # new schema for process endpoint request body
     file_id: str = None # make it optionally default is none
     chunk_size: Optional[int] = 100
     overlap_size: Optional[int] = 20
-    do_reset: Optional[int] = 0
\ No newline at end of file
+    do_reset: Optional[int] = 0
+
+class ResumableUploadRequest(BaseModel): # opens a resumable upload session, the file is then sent in byte ranges
+    file_name: str
+    file_size: int
+    checksum_sha256: Optional[str] = None # hex digest of the whole file, verified once it's assembled
@@ -1,10 +1,46 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
+from datetime import datetime
 
 class PushRequest(BaseModel):
     do_reset: Optional[int] = 0
 
+class RebuildIndexRequest(BaseModel): # builds a new index version next to the live one, then swaps it in
+    # another embedding model to re-embed the project with (the configured one by default)
+    embedding_backend: Optional[str] = None
+    embedding_model_id: Optional[str] = None
+    embedding_size: Optional[int] = None
+
+class SearchFilter(BaseModel): # restricts a search, all the given conditions must match
+    asset_ids: Optional[List[str]] = None
+    file_ids: Optional[List[str]] = None # file_id returned by the upload
+    file_extensions: Optional[List[str]] = None # e.g. [".pdf"]
+    page_from: Optional[int] = Field(None, ge=0) # page numbers as in the chunks' metadata (0 based for PDFs)
+    page_to: Optional[int] = Field(None, ge=0)
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
 class SearchRequest(BaseModel):
     text: str
     limit: Optional[int] = 5
-    chat_history: Optional[List[Dict[str, Any]]] = None  # Client can send previous chat history
\ No newline at end of file
+    chat_history: Optional[List[Dict[str, Any]]] = None  # deprecated: prefer session_id, the history is kept server-side
+    session_id: Optional[str] = None # continue a server-side chat session (a new one is started when missing)
+    debug: Optional[bool] = False # echo full_prompt and chat_history back in the response
+    with_metadata: Optional[bool] = False # search: return the chunks' metadata, with their document metadata
+    filters: Optional[SearchFilter] = None
+
+class BatchSearchQuery(BaseModel):
+    text: str
+    limit: Optional[int] = 5
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery]
+    with_metadata: Optional[bool] = False # return the chunks' metadata, with their document metadata
+    filters: Optional[SearchFilter] = None # applied to every query
+
+class FederatedSearchRequest(BaseModel):
+    project_ids: List[str]
+    text: str
+    limit: Optional[int] = 5 # global top-k over all the projects
+    per_project_limit: Optional[int] = None # candidates taken from each project (defaults to limit)
+    timeout_seconds: Optional[float] = None # per project, capped by FEDERATED_SEARCH_TIMEOUT_SECONDS
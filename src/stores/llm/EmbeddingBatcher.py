@@ -0,0 +1,99 @@
+from .LLMInterface import LLMInterface
+from utils import observe_embedding_batch, check_deadline, wait_for_deadline, get_deadline, deadline_scope
+from utils import run_provider_call
+import asyncio
+import contextvars
+import logging
+
+class EmbeddingBatcher:
+    """
+    Collect the query embeddings requested by concurrent requests and send them to the
+    provider as one multi-input `embed_many` call, then hand each caller its own vector.
+
+    A batch is sent once `max_batch_size` texts are pending, or `max_wait_ms` after its first
+    text arrived. While no batch is in flight the wait is skipped (texts arriving in the same
+    event loop tick are still grouped), so a lone request isn't delayed at low load.
+    Not thread-safe on purpose, it's meant to be used from the event loop only.
+
+    A batch serves several requests: it's sent outside of any of them, under the latest of their
+    deadlines, and each caller stops waiting for its vector at its own deadline.
+    """
+
+    def __init__(self, embedding_client: LLMInterface, max_wait_ms: float = 5, max_batch_size: int = 32):
+        self.embedding_client = embedding_client
+        self.max_wait_seconds = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        # {document_type: [(text, future, caller deadline)]}, each document type is embedded separately
+        self.pending = {}
+        # {document_type: asyncio.TimerHandle}
+        self.flush_handles = {}
+        self.in_flight_batches = 0
+
+        self.logger = logging.getLogger(__name__)
+
+    async def embed(self, text: str, document_type: str = None):
+        check_deadline("query_embedding")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        batch = self.pending.setdefault(document_type, [])
+        batch.append((text, future, get_deadline()))
+
+        if len(batch) >= self.max_batch_size:
+            self.flush(document_type)
+        elif document_type not in self.flush_handles:
+            wait_seconds = self.max_wait_seconds if self.in_flight_batches > 0 else 0
+            # not bound to the context of the caller that happened to open the batch
+            self.flush_handles[document_type] = loop.call_later(
+                wait_seconds, self.flush, document_type, context=contextvars.Context()
+            )
+
+        # on expiry the future is cancelled, the batch then skips it
+        return await wait_for_deadline(future, operation="query_embedding")
+
+    def flush(self, document_type: str = None):
+        flush_handle = self.flush_handles.pop(document_type, None)
+        if flush_handle is not None:
+            flush_handle.cancel()
+
+        batch = self.pending.pop(document_type, [])
+        # callers that were cancelled while waiting don't need an embedding anymore
+        batch = [ (text, future, deadline) for text, future, deadline in batch if not future.done() ]
+        if not batch:
+            return
+
+        # the latest deadline of the batch callers, None when one of them has no deadline
+        deadlines = [ deadline for _, _, deadline in batch ]
+        batch_deadline = None if None in deadlines else max(deadlines)
+
+        self.in_flight_batches += 1
+        contextvars.Context().run(asyncio.ensure_future, self.send_batch(batch, document_type, batch_deadline))
+
+    async def send_batch(self, batch: list, document_type: str = None, batch_deadline: float = None):
+        # identical texts in the same batch are embedded once
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        observe_embedding_batch(size=len(texts))
+
+        try:
+            # the provider call gets the batch deadline as its timeout
+            with deadline_scope(batch_deadline):
+                vectors = await run_provider_call(
+                    self.embedding_client.embed_many, texts=texts, document_type=document_type
+                )
+        except Exception as e:
+            self.logger.error(f"Error while embedding a batch of {len(texts)} texts: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.in_flight_batches -= 1
+
+        # same contract as `embed_text`: None when the provider call failed
+        text_vectors = dict(zip(texts, vectors)) if vectors and len(vectors) == len(texts) else {}
+
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(text_vectors.get(text))
@@ -0,0 +1,54 @@
+from .LLMInterface import LLMInterface
+import logging
+
+class EmbeddingClientPool:
+    """
+    Embedding clients by (backend, model id, embedding size): the configured one, plus the ones
+    the projects' live indexes were built with. A project is queried with the model of its live
+    index until it's rebuilt with another one, so an index can be re-embedded with a new model
+    while the old one keeps serving.
+    """
+
+    def __init__(self, llm_provider_factory, default_client: LLMInterface, default_backend: str):
+        self.llm_provider_factory = llm_provider_factory
+        self.default_client = default_client
+        self.default_backend = default_backend
+
+        self.clients = {
+            self.get_key(default_backend, default_client.embedding_model_id, default_client.embedding_size): default_client
+        }
+
+        self.logger = logging.getLogger(__name__)
+
+    def get_key(self, backend: str, model_id: str, embedding_size: int):
+        return (backend, model_id, int(embedding_size) if embedding_size is not None else None)
+
+    def get(self, backend: str = None, model_id: str = None, embedding_size: int = None):
+        """
+        Returns the client of the model (created on first use), the default one when no model is given,
+        None when the backend isn't supported.
+        """
+        if model_id is None:
+            return self.default_client
+
+        key = self.get_key(backend or self.default_backend, model_id, embedding_size)
+        if key not in self.clients:
+            client = self.llm_provider_factory.create(provider=key[0])
+            if client is None:
+                self.logger.error(f"Unsupported embedding backend: {key[0]}")
+                return None
+
+            client.set_embedding_model(model_id=model_id, embedding_size=embedding_size)
+            self.clients[key] = client
+
+        return self.clients[key]
+
+    def get_model_info(self, client: LLMInterface):
+        # what's recorded on an index version built with `client`
+        backend = next(( key[0] for key, pool_client in self.clients.items() if pool_client is client ),
+                       self.default_backend)
+        return {
+            "embedding_backend": backend,
+            "embedding_model_id": client.embedding_model_id,
+            "embedding_size": client.embedding_size,
+        }
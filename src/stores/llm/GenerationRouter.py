@@ -0,0 +1,191 @@
+from .LLMInterface import LLMInterface
+from utils import observe_generation_router_event
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+import contextvars
+import logging
+import threading
+import time
+
+class GenerationRouter(LLMInterface):
+    """
+    Generation client spread over several backends (the first one is the primary).
+
+    - hedging: when the primary hasn't answered after the hedge delay (its recent p90 latency,
+      or the configured delay until enough samples are collected), the same request is also
+      sent to the next backend and the first answer wins.
+    - failover: a backend whose circuit is open is skipped, and a backend that fails
+      hands the request to the next one.
+
+    The chat history stays in the primary's message format (the prompts and the sessions are
+    built with it), it's translated for the other backends.
+    Embedding calls are not routed, they're delegated to the primary.
+    """
+
+    MIN_LATENCY_SAMPLES = 20
+
+    def __init__(self, backends: list, hedge_enabled: bool = True,
+                       hedge_delay_seconds: float = 4.0, hedge_percentile: float = 90,
+                       latency_window: int = 200, max_workers: int = 32):
+
+        self.backends = backends
+        self.primary = backends[0]
+
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.hedge_percentile = hedge_percentile
+
+        # successful primary calls latency, for the adaptive hedge delay
+        self.latencies = deque(maxlen=latency_window)
+        self.latencies_lock = threading.Lock()
+
+        # the SDK calls are blocking, a losing request can't be cancelled and finishes in its thread
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-router")
+
+        self.logger = logging.getLogger(__name__)
+
+        self.enums = self.primary.enums
+
+    @property
+    def generation_model_id(self):
+        return self.primary.generation_model_id
+
+    @property
+    def embedding_model_id(self):
+        return self.primary.embedding_model_id
+
+    @property
+    def embedding_size(self):
+        return self.primary.embedding_size
+
+    def get_backend_name(self, client: LLMInterface):
+        governor = getattr(client, "governor", None)
+        return governor.backend if governor is not None else type(client).__name__
+
+    def is_available(self, client: LLMInterface):
+        governor = getattr(client, "governor", None)
+        return governor is None or not governor.circuit_breaker.is_open()
+
+    def get_hedge_delay(self):
+        with self.latencies_lock:
+            latencies = sorted(self.latencies)
+
+        if not self.hedge_percentile or len(latencies) < self.MIN_LATENCY_SAMPLES:
+            return self.hedge_delay_seconds
+
+        index = min(int(len(latencies) * self.hedge_percentile / 100), len(latencies) - 1)
+        return latencies[index]
+
+    def translate_message(self, message: dict, from_client: LLMInterface, to_client: LLMInterface):
+        if from_client.enums is to_client.enums:
+            return dict(message)
+
+        # roles are matched by name (SYSTEM / USER / ASSISTANT), e.g. OpenAI "assistant" <-> CoHere "CHATBOT"
+        role_name = next(
+            (role.name for role in from_client.enums if role.value == message.get("role")),
+            "USER"
+        )
+        text = message.get("content") or message.get("text") or ""
+
+        return to_client.construct_prompt(prompt=text, role=to_client.enums[role_name].value)
+
+    def translate_history(self, chat_history: list, from_client: LLMInterface, to_client: LLMInterface):
+        return [ self.translate_message(message, from_client, to_client) for message in chat_history ]
+
+    def call_backend(self, client: LLMInterface, prompt: str, chat_history: list,
+                           max_output_tokens: int = None, temperature: float = None):
+
+        backend_history = self.translate_history(chat_history, from_client=self.primary, to_client=client)
+
+        started_at = time.monotonic()
+        answer = client.generate_text(prompt=prompt, chat_history=backend_history,
+                                      max_output_tokens=max_output_tokens, temperature=temperature)
+
+        if client is self.primary and answer is not None:
+            with self.latencies_lock:
+                self.latencies.append(time.monotonic() - started_at)
+
+        return client, answer, backend_history
+
+    def generate_text(self, prompt: str, chat_history: list=[], max_output_tokens: int=None,
+                            temperature: float = None):
+
+        candidates = [ client for client in self.backends if self.is_available(client) ]
+        if not candidates:
+            # every circuit is open, the primary's governor raises the (503) error
+            candidates = [ self.primary ]
+
+        if candidates[0] is not self.primary:
+            observe_generation_router_event(backend=self.get_backend_name(candidates[0]), event="failover")
+
+        def submit(client: LLMInterface):
+            # each attempt runs in a copy of the caller's context: request deadline, trace span
+            # (a copy per attempt, a context can't be entered by two threads at once)
+            return self.executor.submit(contextvars.copy_context().run, self.call_backend, client, prompt,
+                                        chat_history, max_output_tokens, temperature)
+
+        pending = { submit(candidates[0]) }
+        next_candidate = 1
+        hedged_client, last_error = None, None
+
+        if self.hedge_enabled and next_candidate < len(candidates):
+            done, _ = wait(pending, timeout=self.get_hedge_delay())
+            if not done:
+                hedged_client = candidates[next_candidate]
+                next_candidate += 1
+                observe_generation_router_event(backend=self.get_backend_name(hedged_client), event="hedged")
+                pending.add(submit(hedged_client))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                try:
+                    client, answer, backend_history = future.result()
+                except Exception as e:
+                    self.logger.warning(f"Generation failed on a routed backend: {e}")
+                    last_error = e
+                    continue
+
+                if answer is None:
+                    continue
+
+                if client is hedged_client:
+                    observe_generation_router_event(backend=self.get_backend_name(client), event="hedge_won")
+
+                # keep the caller's history in sync, like a direct provider call would
+                # (e.g. OpenAI appends the user prompt to the history it's given)
+                added_messages = backend_history[len(chat_history):]
+                chat_history.extend(self.translate_history(added_messages, from_client=client,
+                                                            to_client=self.primary))
+                return answer
+
+            if not pending and next_candidate < len(candidates):
+                failover_client = candidates[next_candidate]
+                next_candidate += 1
+                observe_generation_router_event(backend=self.get_backend_name(failover_client), event="failover")
+                pending.add(submit(failover_client))
+
+        if last_error is not None:
+            raise last_error
+
+        return None
+
+    def set_generation_model(self, model_id: str):
+        self.primary.set_generation_model(model_id=model_id)
+
+    def set_embedding_model(self, model_id: str, embedding_size: int):
+        self.primary.set_embedding_model(model_id=model_id, embedding_size=embedding_size)
+
+    def embed_text(self, text: str, document_type: str = None):
+        return self.primary.embed_text(text=text, document_type=document_type)
+
+    def embed_many(self, texts: list, document_type: str = None):
+        return self.primary.embed_many(texts=texts, document_type=document_type)
+
+    def construct_prompt(self, prompt: str, role: str):
+        return self.primary.construct_prompt(prompt=prompt, role=role)
+
+    def get_token_counter(self):
+        # prompts are budgeted for the primary, the backends are expected to have similar context sizes
+        return self.primary.get_token_counter()
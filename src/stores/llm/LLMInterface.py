@@ -19,6 +19,14 @@ class LLMInterface(ABC):
     def embed_text(self, text: str, document_type: str = None):
         pass
 
+    @abstractmethod
+    def embed_many(self, texts: list, document_type: str = None):
+        pass
+
     @abstractmethod
     def construct_prompt(self, prompt: str, role: str):
+        pass
+
+    @abstractmethod
+    def get_token_counter(self):
         pass
\ No newline at end of file
@@ -1,11 +1,32 @@
-
 from .LLMEnums import LLMEnums
 from .providers import OpenAIProvider, CoHereProvider
+from .ProviderGovernor import ProviderGovernor
 
 class LLMProviderFactory:
     def __init__(self, config: dict):
         self.config = config
 
+        # one governor per backend, shared by the generation and embedding clients
+        # (the provider's rate limits apply to the API key, not to one client)
+        self.governors = {}
+
+    def get_governor(self, provider: str, rpm_limit: int, tpm_limit: int, max_concurrency: int):
+        if provider not in self.governors:
+            self.governors[provider] = ProviderGovernor(
+                backend=provider,
+                rpm_limit=rpm_limit,
+                tpm_limit=tpm_limit,
+                max_concurrency=max_concurrency,
+                max_retries=self.config.PROVIDER_MAX_RETRIES,
+                retry_base_delay_seconds=self.config.PROVIDER_RETRY_BASE_DELAY_SECONDS,
+                retry_max_delay_seconds=self.config.PROVIDER_RETRY_MAX_DELAY_SECONDS,
+                queue_timeout_seconds=self.config.PROVIDER_QUEUE_TIMEOUT_SECONDS,
+                circuit_failure_threshold=self.config.PROVIDER_CIRCUIT_FAILURE_THRESHOLD,
+                circuit_reset_seconds=self.config.PROVIDER_CIRCUIT_RESET_SECONDS,
+            )
+
+        return self.governors[provider]
+
     def create(self, provider: str):
         if provider == LLMEnums.OPENAI.value:
             return OpenAIProvider(
@@ -13,7 +34,13 @@ class LLMProviderFactory:
                 api_url = self.config.OPENAI_API_URL,
                 default_input_max_characters=self.config.INPUT_DAFAULT_MAX_CHARACTERS,
                 default_generation_max_output_tokens=self.config.GENERATION_DAFAULT_MAX_TOKENS,
-                default_generation_temperature=self.config.GENERATION_DAFAULT_TEMPERATURE
+                default_generation_temperature=self.config.GENERATION_DAFAULT_TEMPERATURE,
+                governor=self.get_governor(
+                    provider=provider,
+                    rpm_limit=self.config.OPENAI_RPM_LIMIT,
+                    tpm_limit=self.config.OPENAI_TPM_LIMIT,
+                    max_concurrency=self.config.OPENAI_MAX_CONCURRENCY,
+                ),
             )
 
         if provider == LLMEnums.COHERE.value:
@@ -21,7 +48,13 @@ class LLMProviderFactory:
                 api_key = self.config.COHERE_API_KEY,
                 default_input_max_characters=self.config.INPUT_DAFAULT_MAX_CHARACTERS,
                 default_generation_max_output_tokens=self.config.GENERATION_DAFAULT_MAX_TOKENS,
-                default_generation_temperature=self.config.GENERATION_DAFAULT_TEMPERATURE
+                default_generation_temperature=self.config.GENERATION_DAFAULT_TEMPERATURE,
+                governor=self.get_governor(
+                    provider=provider,
+                    rpm_limit=self.config.COHERE_RPM_LIMIT,
+                    tpm_limit=self.config.COHERE_TPM_LIMIT,
+                    max_concurrency=self.config.COHERE_MAX_CONCURRENCY,
+                ),
             )
 
-        return None
\ No newline at end of file
+        return None
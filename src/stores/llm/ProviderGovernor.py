@@ -0,0 +1,428 @@
+from utils import track_provider_call, observe_provider_retry, observe_provider_governor_state
+from utils import check_deadline, get_call_timeout, DeadlineExceededError
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import logging
+import random
+import threading
+import time
+
+class ProviderUnavailableError(Exception):
+    """
+    Raised instead of calling the provider when its circuit is open, or when the call
+    couldn't get a rate limit / concurrency slot in time.
+    """
+
+    def __init__(self, backend: str, reason: str, retry_after: float = None):
+        super().__init__(f"LLM provider {backend} unavailable: {reason}")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at most one minute of budget.
+    The balance can go negative (e.g. when the actual token usage exceeds the estimate),
+    later calls then wait until the debt is paid back.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def try_consume(self, amount: float):
+        """
+        Consume `amount` if available; otherwise returns how many seconds to wait before retrying.
+        """
+        # a single call bigger than the bucket would never fit, let it through on a full bucket
+        amount = min(amount, self.capacity)
+
+        with self.lock:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+
+            return (amount - self.tokens) / self.rate_per_second
+
+    def adjust(self, amount: float):
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit with additive increase (+1 per `limit` successful calls) and
+    multiplicative decrease (x `backoff_ratio`) on rate limiting or on a call much slower
+    than the usual latency of its operation.
+    """
+
+    # at most one decrease per cooldown, a burst of failing in-flight calls counts once
+    DECREASE_COOLDOWN_SECONDS = 1.0
+    LATENCY_EWMA_ALPHA = 0.1
+
+    def __init__(self, max_limit: int, min_limit: int = 1, backoff_ratio: float = 0.5,
+                       latency_tolerance: float = 3.0):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.last_decrease_at = 0.0
+        # {operation: EWMA of the successful calls latency}
+        self.latency_baselines = {}
+
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+
+            self.in_flight += 1
+            return True
+
+    def release(self, operation: str, latency: float = None, overloaded: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+
+            baseline = self.latency_baselines.get(operation)
+            too_slow = (
+                latency is not None and baseline is not None
+                and latency > baseline * self.latency_tolerance
+            )
+
+            if overloaded or too_slow:
+                self.decrease()
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            if latency is not None and not overloaded:
+                self.latency_baselines[operation] = latency if baseline is None else (
+                    self.LATENCY_EWMA_ALPHA * latency + (1 - self.LATENCY_EWMA_ALPHA) * baseline
+                )
+
+            self.condition.notify_all()
+
+    def decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease_at < self.DECREASE_COOLDOWN_SECONDS:
+            return
+
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.last_decrease_at = now
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures and fails fast for
+    `reset_seconds`; then lets a single probe call through (half-open) to decide whether to close.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns None when the call may go through, otherwise the seconds until the next probe.
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return None
+
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return None
+
+            return max(remaining, 1.0)
+
+    def is_open(self):
+        # read-only check (no probe is reserved), e.g. to route around an unhealthy backend
+        with self.lock:
+            return self.state == self.OPEN and time.monotonic() < self.opened_at + self.reset_seconds
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        # the probe ended without telling anything about the provider health (e.g. a 4xx)
+        with self.lock:
+            self.probe_in_flight = False
+
+
+class ProviderGovernor:
+    """
+    Every call to one LLM backend goes through its governor:
+    circuit breaker -> requests / tokens per minute buckets -> AIMD concurrency slot -> SDK call,
+    with jittered exponential backoff retries (honouring Retry-After) on 429, 5xx and connection errors.
+
+    Calls are blocking (the SDK clients are), they run in worker threads, hence the thread locks.
+    A call waiting for a slot, a rate limit or a retry holds its thread: the callers run them on
+    the dedicated provider threads (utils.run_provider_call), never on the default executor.
+    """
+
+    RATE_LIMITED = "rate_limited"
+    SERVER_ERROR = "server_error"
+    CLIENT_ERROR = "client_error"
+
+    TRANSIENT_ERROR_NAMES = ("Timeout", "Connection", "ServerError")
+    # CoHere (4.x) raises a bare CohereError for a 5xx without an error message or an unexpected
+    # transport failure, but also for its own request validation: only the former are transient
+    TRANSIENT_COHERE_MESSAGES = ("Unexpected server error", "Unexpected exception")
+
+    def __init__(self, backend: str,
+                       rpm_limit: int = 0, tpm_limit: int = 0, max_concurrency: int = 16,
+                       max_retries: int = 3,
+                       retry_base_delay_seconds: float = 0.5, retry_max_delay_seconds: float = 20,
+                       queue_timeout_seconds: float = 30,
+                       circuit_failure_threshold: int = 5, circuit_reset_seconds: float = 30):
+
+        self.backend = backend
+
+        # 0 = no limit
+        self.requests_bucket = TokenBucket(rpm_limit) if rpm_limit else None
+        self.tokens_bucket = TokenBucket(tpm_limit) if tpm_limit else None
+        self.limiter = AIMDLimiter(max_limit=max_concurrency)
+        self.circuit_breaker = CircuitBreaker(failure_threshold=circuit_failure_threshold,
+                                              reset_seconds=circuit_reset_seconds)
+
+        self.max_retries = max_retries
+        self.retry_base_delay_seconds = retry_base_delay_seconds
+        self.retry_max_delay_seconds = retry_max_delay_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        # set from a Retry-After header, every call waits until then
+        self.paused_until = 0.0
+
+        self.logger = logging.getLogger(__name__)
+
+    def call(self, func, model: str, operation: str, estimated_tokens: int = 0):
+        """
+        Run `func()` (the SDK call) under the backend limits and return its result.
+        """
+        attempt = 0
+        while True:
+            self.acquire(estimated_tokens=estimated_tokens, operation=operation)
+
+            started_at = time.monotonic()
+            try:
+                with track_provider_call(backend=self.backend, model=model, operation=operation):
+                    result = func()
+            except Exception as e:
+                latency = time.monotonic() - started_at
+                error_kind = self.classify_error(e)
+
+                self.limiter.release(operation=operation, overloaded=error_kind == self.RATE_LIMITED)
+                if error_kind == self.SERVER_ERROR:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.release_probe()
+                self.observe_state()
+
+                if error_kind == self.CLIENT_ERROR or attempt >= self.max_retries:
+                    raise
+
+                delay = self.get_retry_delay(attempt=attempt, retry_after=self.get_retry_after(e))
+                remaining = get_call_timeout()
+                if remaining is not None and delay >= remaining:
+                    # the retry couldn't finish before the request deadline
+                    raise DeadlineExceededError(operation) from e
+
+                if error_kind == self.RATE_LIMITED:
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+                observe_provider_retry(backend=self.backend, operation=operation, reason=error_kind)
+                self.logger.warning(
+                    f"{self.backend} {operation} call failed ({error_kind}, {latency:.2f}s), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.2f}s: {e}"
+                )
+
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.limiter.release(operation=operation, latency=time.monotonic() - started_at)
+            self.circuit_breaker.record_success()
+            self.observe_state()
+
+            return result
+
+    def acquire(self, estimated_tokens: int = 0, operation: str = None):
+        check_deadline(operation)
+
+        retry_after = self.circuit_breaker.allow()
+        if retry_after is not None:
+            raise ProviderUnavailableError(self.backend, reason="circuit_open", retry_after=retry_after)
+
+        # never wait for a slot past the request deadline (504) or the queue timeout (503)
+        remaining = get_call_timeout()
+        request_bound = remaining is not None and remaining < self.queue_timeout_seconds
+        deadline = time.monotonic() + (remaining if request_bound else self.queue_timeout_seconds)
+
+        # the provider asked to back off (Retry-After), then the per minute budgets
+        self.wait_until(time.monotonic() + max(self.paused_until - time.monotonic(), 0), deadline,
+                        request_bound=request_bound, reason="rate_limited")
+
+        consumed = []
+        try:
+            for bucket, amount in [(self.requests_bucket, 1), (self.tokens_bucket, estimated_tokens)]:
+                if bucket is None or not amount:
+                    continue
+
+                wait_seconds = bucket.try_consume(amount)
+                while wait_seconds > 0:
+                    self.wait_until(time.monotonic() + wait_seconds, deadline,
+                                    request_bound=request_bound, reason="rate_limited")
+                    wait_seconds = bucket.try_consume(amount)
+                consumed.append((bucket, min(amount, bucket.capacity)))
+
+            if not self.limiter.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                self.raise_slot_timeout(request_bound=request_bound, reason="concurrency_limit", retry_after=1.0)
+        except (ProviderUnavailableError, DeadlineExceededError):
+            # the call is never made, the budget it took goes back to the buckets
+            for bucket, amount in consumed:
+                bucket.adjust(-amount)
+            raise
+
+    def wait_until(self, wake_at: float, deadline: float, request_bound: bool, reason: str):
+        wait_seconds = wake_at - time.monotonic()
+        if wait_seconds <= 0:
+            return
+
+        # no point in waiting when the slot comes too late anyway
+        if wake_at > deadline:
+            self.raise_slot_timeout(request_bound=request_bound, reason=reason, retry_after=wait_seconds)
+
+        time.sleep(wait_seconds)
+
+    def raise_slot_timeout(self, request_bound: bool, reason: str, retry_after: float):
+        self.circuit_breaker.release_probe()
+
+        if request_bound:
+            raise DeadlineExceededError(f"{self.backend} provider slot")
+        raise ProviderUnavailableError(self.backend, reason=reason, retry_after=retry_after)
+
+    def settle_tokens(self, estimated_tokens: int, actual_tokens: int):
+        # charge (or refund) the difference between the reported usage and the estimate
+        if self.tokens_bucket is not None and actual_tokens:
+            self.tokens_bucket.adjust(actual_tokens - (estimated_tokens or 0))
+
+    def get_retry_delay(self, attempt: int, retry_after: float = None):
+        # "full jitter" backoff, but never sooner than what the provider asked for
+        delay = random.uniform(0, min(self.retry_max_delay_seconds, self.retry_base_delay_seconds * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, self.retry_base_delay_seconds))
+
+        return delay
+
+    def classify_error(self, error: Exception):
+        status_code = self.get_status_code(error)
+
+        if status_code == 429:
+            return self.RATE_LIMITED
+        if status_code is not None and (status_code >= 500 or status_code in (408, 409)):
+            return self.SERVER_ERROR
+        if status_code is not None:
+            return self.CLIENT_ERROR
+
+        # no HTTP status: connection errors, timeouts, or an SDK wrapped 5xx
+        error_names = [ cls.__name__ for cls in type(error).__mro__ ]
+        if isinstance(error, (TimeoutError, ConnectionError)) or any(
+            transient_name in error_name
+            for error_name in error_names
+            for transient_name in self.TRANSIENT_ERROR_NAMES
+        ):
+            return self.SERVER_ERROR
+
+        if type(error).__name__ == "CohereError" and str(error).startswith(self.TRANSIENT_COHERE_MESSAGES):
+            return self.SERVER_ERROR
+
+        return self.CLIENT_ERROR
+
+    def get_status_code(self, error: Exception):
+        # openai errors carry `status_code`, CoHere errors carry `http_status`
+        for attr in ("status_code", "http_status"):
+            status_code = getattr(error, attr, None)
+            if isinstance(status_code, int):
+                return status_code
+
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+        return status_code if isinstance(status_code, int) else None
+
+    def get_retry_after(self, error: Exception):
+        headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            return None
+
+        headers = { str(key).lower(): value for key, value in headers.items() }
+
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+
+        # Retry-After may also be an HTTP date
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def observe_state(self):
+        observe_provider_governor_state(backend=self.backend,
+                                        concurrency_limit=self.limiter.limit,
+                                        circuit_open=self.circuit_breaker.state != CircuitBreaker.CLOSED)
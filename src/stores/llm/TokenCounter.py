@@ -0,0 +1,66 @@
+import logging
+import math
+
+class TokenCounter:
+    """
+    Count / truncate text in tokens of the generation model.
+
+    tiktoken is used when the encoding can be loaded (OpenAI and most OpenAI-compatible
+    models are close enough to `cl100k_base`); otherwise it falls back to a UTF-8 byte
+    estimate (~4 bytes per token), which also holds reasonably well for Arabic text.
+    """
+
+    BYTES_PER_TOKEN = 4
+    DEFAULT_ENCODING = "cl100k_base"
+
+    def __init__(self, model_id: str = None, use_tiktoken: bool = True):
+        self.model_id = model_id
+        self.encoding = None
+        self.logger = logging.getLogger(__name__)
+
+        if use_tiktoken:
+            self.encoding = self.load_encoding(model_id=model_id)
+
+    def load_encoding(self, model_id: str = None):
+        try:
+            import tiktoken # type: ignore
+        except ImportError:
+            return None
+
+        try:
+            return tiktoken.encoding_for_model(model_id)
+        except Exception:
+            pass
+
+        try:
+            return tiktoken.get_encoding(self.DEFAULT_ENCODING)
+        except Exception as e:
+            # e.g. the encoding file can't be downloaded on an offline node
+            self.logger.warning(f"tiktoken encoding not available, estimating tokens instead: {e}")
+            return None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+
+        return math.ceil(len(text.encode("utf-8")) / self.BYTES_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0 or not text:
+            return ""
+
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return self.encoding.decode(tokens[:max_tokens])
+
+        encoded = text.encode("utf-8")
+        max_bytes = max_tokens * self.BYTES_PER_TOKEN
+        if len(encoded) <= max_bytes:
+            return text
+
+        return encoded[:max_bytes].decode("utf-8", errors="ignore")
@@ -1,6 +1,10 @@
 from ..LLMInterface import LLMInterface
-from ..LLMEnums import CoHereEnums, DocumentTypeEnum
+from ..TokenCounter import TokenCounter
+from ..ProviderGovernor import ProviderGovernor
+from ..LLMEnums import CoHereEnums, DocumentTypeEnum, LLMEnums
 import cohere # type: ignore
+from utils import observe_tokens, traced, get_call_timeout
+import copy
 import logging
 
 class CoHereProvider(LLMInterface):
@@ -8,7 +12,8 @@ class CoHereProvider(LLMInterface):
     def __init__(self, api_key: str,
                        default_input_max_characters: int=1000,
                        default_generation_max_output_tokens: int=1000,
-                       default_generation_temperature: float=0.1):
+                       default_generation_temperature: float=0.1,
+                       governor: ProviderGovernor=None):
         
         self.api_key = api_key
 
@@ -17,11 +22,15 @@ class CoHereProvider(LLMInterface):
         self.default_generation_temperature = default_generation_temperature
 
         self.generation_model_id = None
+        self.token_counter = None
 
         self.embedding_model_id = None
         self.embedding_size = None
 
-        self.client = cohere.Client(api_key=self.api_key)
+        # retries are done by the governor (with the backend wide rate limits), not by the SDK
+        self.governor = governor if governor else ProviderGovernor(backend=LLMEnums.COHERE.value)
+
+        self.client = cohere.Client(api_key=self.api_key, max_retries=0)
 
         self.logger = logging.getLogger(__name__)
 
@@ -30,10 +39,25 @@ class CoHereProvider(LLMInterface):
 
     def set_generation_model(self, model_id: str):
         self.generation_model_id = model_id
+        # CoHere only exposes its tokenizer through an API call, so tokens are estimated locally
+        self.token_counter = TokenCounter(model_id=model_id, use_tiktoken=False)
 
     def set_embedding_model(self, model_id: str, embedding_size: int):
         self.embedding_model_id = model_id
         self.embedding_size = embedding_size
+        # only used to budget the tokens per minute, an estimate is enough
+        self.embedding_token_counter = TokenCounter(model_id=model_id, use_tiktoken=False)
+
+    def get_request_client(self):
+        # the SDK only has a client wide timeout: under a request deadline a call gets a copy of the
+        # client bounded by what's left of it (evaluated per attempt), the shared client otherwise
+        timeout = get_call_timeout()
+        if timeout is None:
+            return self.client
+
+        client = copy.copy(self.client)
+        client.timeout = max(timeout, 0.001)
+        return client
 
     def process_text(self, text: str):
         return text[:self.default_input_max_characters].strip()
@@ -52,21 +76,42 @@ class CoHereProvider(LLMInterface):
         max_output_tokens = max_output_tokens if max_output_tokens else self.default_generation_max_output_tokens
         temperature = temperature if temperature else self.default_generation_temperature
 
-        response = self.client.chat(
-            model = self.generation_model_id,
-            chat_history = chat_history,
-            message = self.process_text(prompt),
-            temperature = temperature,
-            max_tokens = max_output_tokens
-        )
+        estimated_tokens = self.get_token_counter().count(
+            "\n".join([ str(message.get("text", "")) for message in chat_history ] + [ prompt ])
+        ) + max_output_tokens
+
+        with traced("llm.generate", {"llm.backend": LLMEnums.COHERE.value, "llm.model": self.generation_model_id}):
+            response = self.governor.call(
+                lambda: self.get_request_client().chat(
+                    model = self.generation_model_id,
+                    chat_history = chat_history,
+                    message = prompt.strip(),
+                    temperature = temperature,
+                    max_tokens = max_output_tokens
+                ),
+                model=self.generation_model_id,
+                operation="generate",
+                estimated_tokens=estimated_tokens,
+            )
 
         if not response or not response.text:
             self.logger.error("Error while generating text with CoHere")
             return None
+
+        self.observe_billed_units(response=response, model_id=self.generation_model_id,
+                                  estimated_tokens=estimated_tokens)
         
         return response.text
     
     def embed_text(self, text: str, document_type: str = None):
+
+        embeddings = self.embed_many(texts=[text], document_type=document_type)
+        if not embeddings:
+            return None
+
+        return embeddings[0]
+
+    def embed_many(self, texts: list, document_type: str = None):
         if not self.client:
             self.logger.error("CoHere client was not set")
             return None
@@ -79,29 +124,63 @@ class CoHereProvider(LLMInterface):
         if document_type == DocumentTypeEnum.QUERY.value:
             input_type = CoHereEnums.QUERY.value
 
-        response = self.client.embed(
-            model = self.embedding_model_id,
-            texts = [self.process_text(text)],
-            input_type = input_type,
-            embedding_types=['float'],
-        )
-
+        texts = [ self.process_text(text) for text in texts ]
+        estimated_tokens = sum(self.embedding_token_counter.count(text) for text in texts)
+
+        with traced("llm.embed", {"llm.backend": LLMEnums.COHERE.value, "llm.model": self.embedding_model_id,
+                                  "llm.batch_size": len(texts)}):
+            response = self.governor.call(
+                lambda: self.get_request_client().embed(
+                    model = self.embedding_model_id,
+                    texts = texts,
+                    input_type = input_type,
+                    embedding_types=['float'],
+                ),
+                model=self.embedding_model_id,
+                operation="embed",
+                estimated_tokens=estimated_tokens,
+            )
+
+        self.observe_billed_units(response=response, model_id=self.embedding_model_id,
+                                  estimated_tokens=estimated_tokens)
         
         try:
             float_embeddings = response.embeddings.float
             
-            if not float_embeddings or len(float_embeddings) == 0:
+            if not float_embeddings or len(float_embeddings) != len(texts):
                 self.logger.error("Empty embeddings returned from CoHere")
                 return None
                 
-            return float_embeddings[0]
+            return float_embeddings
 
         except (AttributeError, TypeError) as e:
             self.logger.error(f"Failed to parse CoHere response: {e}")
             return None
             
+    def observe_billed_units(self, response, model_id: str, estimated_tokens: int = 0):
+        # CoHere reports usage as meta = {"billed_units": {"input_tokens": .., "output_tokens": ..}}
+        meta = getattr(response, "meta", None) or {}
+        billed_units = meta.get("billed_units") or {}
+
+        input_tokens = billed_units.get("input_tokens")
+        output_tokens = billed_units.get("output_tokens")
+
+        observe_tokens(backend=LLMEnums.COHERE.value, model=model_id,
+                       input_tokens=input_tokens,
+                       output_tokens=output_tokens)
+
+        self.governor.settle_tokens(estimated_tokens=estimated_tokens,
+                                    actual_tokens=(input_tokens or 0) + (output_tokens or 0))
+
+    def get_token_counter(self):
+        if self.token_counter is None:
+            self.token_counter = TokenCounter(model_id=self.generation_model_id, use_tiktoken=False)
+        return self.token_counter
+
     def construct_prompt(self, prompt: str, role: str):
+        # generation prompts are bounded in tokens by the PromptBuilder, slicing them by
+        # characters here could cut off the user's query at the end of the prompt
         return {
             "role": role,
-            "text": self.process_text(prompt)
+            "text": prompt.strip()
         }
\ No newline at end of file
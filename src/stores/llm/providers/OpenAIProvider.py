@@ -1,6 +1,9 @@
 from ..LLMInterface import LLMInterface
-from ..LLMEnums import OpenAIEnums
-from openai import OpenAI # type: ignore
+from ..TokenCounter import TokenCounter
+from ..ProviderGovernor import ProviderGovernor
+from ..LLMEnums import OpenAIEnums, LLMEnums
+from openai import OpenAI, NOT_GIVEN # type: ignore
+from utils import observe_tokens, traced, get_call_timeout
 import logging
 
 class OpenAIProvider(LLMInterface):
@@ -8,7 +11,8 @@ class OpenAIProvider(LLMInterface):
     def __init__(self, api_key: str, api_url: str=None,
                        default_input_max_characters: int=1000,
                        default_generation_max_output_tokens: int=1000,
-                       default_generation_temperature: float=0.1):
+                       default_generation_temperature: float=0.1,
+                       governor: ProviderGovernor=None):
         
         self.api_key = api_key
         self.api_url = api_url
@@ -18,13 +22,18 @@ class OpenAIProvider(LLMInterface):
         self.default_generation_temperature = default_generation_temperature
 
         self.generation_model_id = None
+        self.token_counter = None
 
         self.embedding_model_id = None
         self.embedding_size = None
 
+        # retries are done by the governor (with the backend wide rate limits), not by the SDK
+        self.governor = governor if governor else ProviderGovernor(backend=LLMEnums.OPENAI.value)
+
         self.client = OpenAI(
             api_key = self.api_key,
             base_url = self.api_url if self.api_url and self.api_url.strip() != "" else None,
+            max_retries = 0,
         )
 
         self.logger = logging.getLogger(__name__)
@@ -33,10 +42,18 @@ class OpenAIProvider(LLMInterface):
 
     def set_generation_model(self, model_id: str):
         self.generation_model_id = model_id
+        self.token_counter = TokenCounter(model_id=model_id)
 
     def set_embedding_model(self, model_id: str, embedding_size: int):
         self.embedding_model_id = model_id
         self.embedding_size = embedding_size
+        # only used to budget the tokens per minute, an estimate is enough
+        self.embedding_token_counter = TokenCounter(model_id=model_id, use_tiktoken=False)
+
+    def get_request_timeout(self):
+        # what's left of the request deadline (evaluated per attempt), the SDK default otherwise
+        timeout = get_call_timeout()
+        return timeout if timeout is not None else NOT_GIVEN
 
     def process_text(self, text: str):
         return text[:self.default_input_max_characters].strip()
@@ -59,21 +76,47 @@ class OpenAIProvider(LLMInterface):
             self.construct_prompt(prompt=prompt, role=OpenAIEnums.USER.value)
         )
 
-        response = self.client.chat.completions.create(
-            model = self.generation_model_id,
-            messages = chat_history,
-            max_tokens = max_output_tokens,
-            temperature = temperature
-        )
+        estimated_tokens = self.get_token_counter().count(
+            "\n".join(str(message.get("content", "")) for message in chat_history)
+        ) + max_output_tokens
+
+        with traced("llm.generate", {"llm.backend": LLMEnums.OPENAI.value, "llm.model": self.generation_model_id}):
+            response = self.governor.call(
+                lambda: self.client.chat.completions.create(
+                    model = self.generation_model_id,
+                    messages = chat_history,
+                    max_tokens = max_output_tokens,
+                    temperature = temperature,
+                    timeout = self.get_request_timeout(),
+                ),
+                model=self.generation_model_id,
+                operation="generate",
+                estimated_tokens=estimated_tokens,
+            )
 
         if not response or not response.choices or len(response.choices) == 0 or not response.choices[0].message:
             self.logger.error("Error while generating text with OpenAI")
             return None
 
+        if response.usage:
+            observe_tokens(backend=LLMEnums.OPENAI.value, model=self.generation_model_id,
+                           input_tokens=response.usage.prompt_tokens,
+                           output_tokens=response.usage.completion_tokens)
+            self.governor.settle_tokens(estimated_tokens=estimated_tokens,
+                                        actual_tokens=response.usage.total_tokens)
+
         return response.choices[0].message.content
 
 
     def embed_text(self, text: str, document_type: str = None):
+
+        embeddings = self.embed_many(texts=[text], document_type=document_type)
+        if not embeddings:
+            return None
+
+        return embeddings[0]
+
+    def embed_many(self, texts: list, document_type: str = None):
         
         if not self.client:
             self.logger.error("OpenAI client was not set")
@@ -83,21 +126,45 @@ class OpenAIProvider(LLMInterface):
             self.logger.error("Embedding model for OpenAI was not set")
             return None
         
-        response = self.client.embeddings.create(
-            model = self.embedding_model_id,
-            input = text,
-        )
-
-        if not response or not response.data or len(response.data) == 0 or not response.data[0].embedding:
+        estimated_tokens = sum(self.embedding_token_counter.count(text) for text in texts)
+
+        with traced("llm.embed", {"llm.backend": LLMEnums.OPENAI.value, "llm.model": self.embedding_model_id,
+                                  "llm.batch_size": len(texts)}):
+            response = self.governor.call(
+                lambda: self.client.embeddings.create(
+                    model = self.embedding_model_id,
+                    input = texts,
+                    timeout = self.get_request_timeout(),
+                ),
+                model=self.embedding_model_id,
+                operation="embed",
+                estimated_tokens=estimated_tokens,
+            )
+
+        if not response or not response.data or len(response.data) != len(texts) or not response.data[0].embedding:
             self.logger.error("Error while embedding text with OpenAI")
             return None
 
-        return response.data[0].embedding
+        if response.usage:
+            observe_tokens(backend=LLMEnums.OPENAI.value, model=self.embedding_model_id,
+                           input_tokens=response.usage.prompt_tokens)
+            self.governor.settle_tokens(estimated_tokens=estimated_tokens,
+                                        actual_tokens=response.usage.prompt_tokens)
+
+        # the API may return the items out of order, `index` maps them back to the inputs
+        return [ item.embedding for item in sorted(response.data, key=lambda item: item.index) ]
+
+    def get_token_counter(self):
+        if self.token_counter is None:
+            self.token_counter = TokenCounter(model_id=self.generation_model_id)
+        return self.token_counter
 
     def construct_prompt(self, prompt: str, role: str):
+        # generation prompts are bounded in tokens by the PromptBuilder, slicing them by
+        # characters here could cut off the user's query at the end of the prompt
         return {
             "role": role,
-            "content": self.process_text(prompt)
+            "content": prompt.strip()
         }
     
 
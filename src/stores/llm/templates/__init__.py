@@ -1 +1,2 @@
-from .template_parser import TemplateParser
\ No newline at end of file
+from .template_parser import TemplateParser
+from .prompt_builder import PromptBuilder
\ No newline at end of file
@@ -0,0 +1,141 @@
+from .template_parser import TemplateParser
+from ..LLMInterface import LLMInterface
+from typing import List
+
+class PromptBuilder:
+    """
+    Assemble the RAG prompt within a token budget of the generation model.
+
+    The footer (user query) prompt is always kept whole; the chat history gets its own budget
+    (oldest turns dropped first, the system prompt truncated if it alone doesn't fit), always
+    leaving `min_document_tokens` to the retrieved documents, packed highest score first into
+    whatever is left.
+    """
+
+    def __init__(self, template_parser: TemplateParser, generation_client: LLMInterface,
+                       max_prompt_tokens: int = 3000,
+                       max_history_tokens: int = 1000,
+                       min_document_tokens: int = 50):
+
+        self.template_parser = template_parser
+        self.generation_client = generation_client
+        self.token_counter = generation_client.get_token_counter()
+
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_history_tokens = max_history_tokens
+        self.min_document_tokens = min_document_tokens
+
+    def get_message_text(self, message: dict):
+        # OpenAI messages carry "content", CoHere messages carry "text"
+        return message.get("content") or message.get("text") or ""
+
+    def is_system_message(self, message: dict):
+        return str(message.get("role", "")).lower() == "system"
+
+    def trim_chat_history(self, chat_history: list, max_tokens: int):
+        """
+        Keep the leading system message (if any, truncated to `max_tokens`) and the most recent
+        turns that fit in `max_tokens`.
+        """
+        if not chat_history:
+            return [], 0
+
+        head, turns = [], list(chat_history)
+        if self.is_system_message(turns[0]):
+            head, turns = [self.truncate_message(turns[0], max_tokens=max_tokens)], turns[1:]
+
+        used_tokens = sum(self.token_counter.count(self.get_message_text(m)) for m in head)
+
+        kept_turns = []
+        for message in reversed(turns):
+            message_tokens = self.token_counter.count(self.get_message_text(message))
+            if used_tokens + message_tokens > max_tokens:
+                break
+
+            kept_turns.append(message)
+            used_tokens += message_tokens
+
+        return head + kept_turns[::-1], used_tokens
+
+    def truncate_message(self, message: dict, max_tokens: int):
+        # a copy of the message with its text cut to `max_tokens`
+        text = self.get_message_text(message)
+        if self.token_counter.count(text) <= max_tokens:
+            return message
+
+        text_key = "content" if "content" in message else "text"
+        return { **message, text_key: self.token_counter.truncate(text, max_tokens=max_tokens) }
+
+    def pack_documents(self, retrieved_documents: list, max_tokens: int) -> List[str]:
+        """
+        Render the highest scoring documents until `max_tokens` is used; the last document
+        is truncated to the remaining budget if at least `min_document_tokens` are left.
+        """
+        ranked_documents = sorted(retrieved_documents, key=lambda doc: doc.score, reverse=True)
+
+        # one pass over the ranked chunks; packed documents are always a prefix of this list,
+        # so the numbering stays continuous
+        rendered_documents = self.template_parser.render_many("rag", "document_prompt", vars_list=[
+            {
+                "doc_num": indx + 1, # to start from 1
+                "chunk_text": doc.text,
+            }
+            for indx, doc in enumerate(ranked_documents)
+        ]) or []
+
+        document_prompts, used_tokens = [], 0
+        for document_prompt in rendered_documents:
+            remaining_tokens = max_tokens - used_tokens
+            if remaining_tokens < self.min_document_tokens:
+                break
+
+            document_tokens = self.token_counter.count(document_prompt)
+
+            if document_tokens > remaining_tokens:
+                document_prompts.append(
+                    self.token_counter.truncate(document_prompt, max_tokens=remaining_tokens)
+                )
+                break
+
+            document_prompts.append(document_prompt)
+            used_tokens += document_tokens
+
+        return document_prompts
+
+    def build(self, query: str, retrieved_documents: list, chat_history: list = None):
+        """
+        Returns the chat history (starting with the system prompt) and the final
+        user prompt (documents + footer).
+
+        Raises ValueError when the footer leaves less than `min_document_tokens` to the documents.
+        """
+        footer_prompt = self.template_parser.get("rag", "footer_prompt", vars={"query": query})
+        footer_tokens = self.token_counter.count(footer_prompt)
+
+        # Use provided chat_history, and make sure it starts with the system prompt
+        chat_history = list(chat_history or [])
+        if not chat_history or not self.is_system_message(chat_history[0]):
+            system_prompt = self.template_parser.get("rag", "system_prompt", vars={})
+            chat_history.insert(0,
+                self.generation_client.construct_prompt(
+                    prompt=system_prompt,
+                    role=self.generation_client.enums.SYSTEM.value,
+                )
+            )
+
+        # the history never takes the documents' minimum: an answer without any context is no answer
+        available_tokens = self.max_prompt_tokens - footer_tokens
+        if available_tokens < self.min_document_tokens:
+            raise ValueError(f"The query prompt ({footer_tokens} tokens) leaves no room for the documents "
+                             f"in the {self.max_prompt_tokens} tokens prompt budget")
+
+        # the system message is part of the history budget, it's the one message never dropped
+        history_budget = min(self.max_history_tokens, available_tokens - self.min_document_tokens)
+        chat_history, history_tokens = self.trim_chat_history(chat_history, max_tokens=history_budget)
+
+        documents_budget = available_tokens - history_tokens
+        document_prompts = self.pack_documents(retrieved_documents, max_tokens=documents_budget)
+
+        full_prompt = "\n\n".join([ "\n".join(document_prompts), footer_prompt ])
+
+        return chat_history, full_prompt
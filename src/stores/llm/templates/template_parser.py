@@ -1,43 +1,169 @@
+import importlib
+import logging
 import os
+from string import Template
 
 class TemplateParser:
+    """
+    Registry of the prompt templates under `locales/<language>/<group>.py`.
+
+    Every locale group is imported and validated once (at startup or on reload), and the
+    fallback to `default_language` is resolved at that point too, so `get` is a dict lookup
+    plus a substitution, with no filesystem access on the request path.
+    """
+
+    LOCALES_PACKAGE = "stores.llm.templates.locales"
 
     def __init__(self, language: str=None, default_language='en'):
         self.current_path = os.path.dirname(os.path.abspath(__file__))
+        self.locales_path = os.path.join(self.current_path, "locales")
         self.default_language = default_language
         self.language = None
 
+        self.logger = logging.getLogger(__name__)
+
+        # {language: {group: {key: Template}}}
+        self.locales = {}
+        # {(group, key): Template} for the current language, fallback already applied
+        self.templates = {}
+        # {file path: mtime} of the loaded locale files, used by `reload_if_changed`
+        self.files_mtime = {}
+
+        self.load_locales()
         self.set_language(language)
 
-    
+    def get_locale_files(self):
+        locale_files = {}
+
+        for language in sorted(os.listdir(self.locales_path)):
+            language_path = os.path.join(self.locales_path, language)
+            if not os.path.isdir(language_path) or language.startswith("__"):
+                continue
+
+            for file_name in sorted(os.listdir(language_path)):
+                group, ext = os.path.splitext(file_name)
+                if ext != ".py" or group.startswith("__"):
+                    continue
+
+                locale_files[(language, group)] = os.path.join(language_path, file_name)
+
+        return locale_files
+
+    def load_locales(self, reload: bool = False):
+        locales, files_mtime = {}, {}
+
+        for (language, group), file_path in self.get_locale_files().items():
+            module = importlib.import_module(f"{self.LOCALES_PACKAGE}.{language}.{group}")
+            if reload:
+                module = importlib.reload(module)
+
+            templates = {
+                key: value
+                for key, value in vars(module).items()
+                if isinstance(value, Template)
+            }
+
+            if len(templates) == 0:
+                self.logger.warning(f"No templates found in locale group: {language}/{group}")
+
+            locales.setdefault(language, {})[group] = templates
+            files_mtime[file_path] = os.path.getmtime(file_path)
+
+        if self.default_language not in locales:
+            raise ValueError(f"Default prompt language '{self.default_language}' has no templates")
+
+        self.validate_locales(locales)
+
+        self.locales = locales
+        self.files_mtime = files_mtime
+
+    def validate_locales(self, locales: dict):
+        # every translated template must use the same placeholders as the default language one,
+        # otherwise `substitute` would fail at request time
+        for language, groups in locales.items():
+            for group, templates in groups.items():
+                default_templates = locales[self.default_language].get(group, {})
+
+                for key, template in templates.items():
+                    default_template = default_templates.get(key)
+                    if default_template is None:
+                        continue
+
+                    if self.get_placeholders(template) != self.get_placeholders(default_template):
+                        raise ValueError(
+                            f"Template {language}/{group}.{key} placeholders don't match {self.default_language}/{group}.{key}"
+                        )
+
+    def get_placeholders(self, template: Template):
+        return {
+            match.group("named") or match.group("braced")
+            for match in template.pattern.finditer(template.template)
+            if match.group("named") or match.group("braced")
+        }
+
     def set_language(self, language: str):
-        if not language:
-            self.language = self.default_language
+        if not language or language not in self.locales:
+            language = self.default_language
+
+        self.language = language
+        self.templates = self.resolve_templates(language=language)
+
+    def resolve_templates(self, language: str):
+        templates = {}
+
+        for source_language in [self.default_language, language]:
+            for group, group_templates in self.locales.get(source_language, {}).items():
+                for key, template in group_templates.items():
+                    templates[(group, key)] = template
 
-        language_path = os.path.join(self.current_path, "locales", language)
-        if os.path.exists(language_path):
-            self.language = language
-        else:
-            self.language = self.default_language
+        return templates
+
+    def reload_if_changed(self):
+        """
+        Reload all locale groups when a locale file was added, removed or modified.
+        Returns True when the templates were reloaded.
+        """
+        current_files = self.get_locale_files().values()
+        current_mtime = {
+            file_path: os.path.getmtime(file_path)
+            for file_path in current_files
+        }
+
+        if current_mtime == self.files_mtime:
+            return False
+
+        try:
+            self.load_locales(reload=True)
+        except Exception as e:
+            # keep serving the last valid templates
+            self.logger.error(f"Failed to reload prompt templates: {e}")
+            self.files_mtime = current_mtime
+            return False
+
+        self.set_language(self.language)
+        self.logger.info("Prompt templates reloaded")
+        return True
+
+    def get_template(self, group: str, key: str):
+        return self.templates.get((group, key))
 
     def get(self, group: str, key: str, vars: dict={}):
         if not group or not key:
             return None
-        
-        group_path = os.path.join(self.current_path, "locales", self.language, f"{group}.py" )
-        targeted_language = self.language
-        if not os.path.exists(group_path):
-            group_path = os.path.join(self.current_path, "locales", self.default_language, f"{group}.py" )
-            targeted_language = self.default_language
-
-        if not os.path.exists(group_path):
+
+        template = self.templates.get((group, key))
+        if template is None:
             return None
-        
-        # import group module
-        module = __import__(f"stores.llm.templates.locales.{targeted_language}.{group}", fromlist=[group])
 
-        if not module:
+        return template.substitute(vars)
+
+    def render_many(self, group: str, key: str, vars_list: list):
+        """
+        Render the same template for each vars dict (e.g. one document prompt per retrieved chunk)
+        with a single template lookup.
+        """
+        template = self.templates.get((group, key))
+        if template is None:
             return None
-        
-        key_attribute = getattr(module, key)
-        return key_attribute.substitute(vars)
\ No newline at end of file
+
+        return [ template.substitute(vars) for vars in vars_list ]
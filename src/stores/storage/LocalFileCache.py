@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+class LocalFileCache:
+    """
+    Read-through cache of remote files on the local disk, so a processing node doesn't
+    download a hot file again. Bounded by size, the least recently used files are evicted.
+    The cached objects are immutable (a new upload always gets a new key), so there's no invalidation
+    besides deletes. Thread-safe: files are fetched from worker threads.
+
+    A path handed out by get_path is pinned until release: a file in use is never evicted
+    (nor removed by a delete, until it's released).
+    """
+
+    def __init__(self, cache_path: str, max_size: int):
+        self.cache_path = cache_path
+        self.max_size = max_size
+
+        # {cache file name: size}, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        # {cache file name: threading.Lock}, one download per file at a time
+        self.fetch_locks = {}
+        # {cache file name: number of handed out paths not released yet}
+        self.pins = {}
+
+        self.logger = logging.getLogger(__name__)
+
+        os.makedirs(self.cache_path, exist_ok=True)
+        self.load_entries()
+
+    def load_entries(self):
+        # files cached before a restart are kept, oldest access first
+        file_names = [
+            file_name for file_name in os.listdir(self.cache_path)
+            if not file_name.endswith(".tmp")
+        ]
+        for file_name in sorted(file_names, key=lambda name: os.path.getatime(os.path.join(self.cache_path, name))):
+            file_size = os.path.getsize(os.path.join(self.cache_path, file_name))
+            self.entries[file_name] = file_size
+            self.size += file_size
+
+        self.evict()
+
+    def get_file_name(self, key: str):
+        file_ext = os.path.splitext(key)[-1]
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + file_ext
+
+    def get_path(self, key: str, fetch):
+        """
+        Local path of `key`, fetched with `fetch(key, local_path)` on a miss (it returns False
+        when the object doesn't exist, then None is returned).
+
+        The returned path is pinned, the caller releases it once done with the file.
+        """
+        file_name = self.get_file_name(key)
+        file_path = os.path.join(self.cache_path, file_name)
+
+        with self.lock:
+            if self.pin_cached(file_name):
+                return file_path
+            fetch_lock = self.fetch_locks.setdefault(file_name, threading.Lock())
+
+        try:
+            with fetch_lock:
+                # fetched by another thread while this one was waiting
+                with self.lock:
+                    if self.pin_cached(file_name):
+                        return file_path
+
+                temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+                try:
+                    if not fetch(key, temp_path):
+                        return None
+                    os.replace(temp_path, file_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+
+                with self.lock:
+                    file_size = os.path.getsize(file_path)
+                    self.size += file_size - self.entries.pop(file_name, 0)
+                    self.entries[file_name] = file_size
+                    self.pins[file_name] = self.pins.get(file_name, 0) + 1
+                    self.evict()
+        finally:
+            with self.lock:
+                self.fetch_locks.pop(file_name, None)
+
+        return file_path
+
+    def pin_cached(self, file_name: str):
+        # under self.lock: pin a cached file, False on a miss
+        if file_name not in self.entries or not os.path.exists(os.path.join(self.cache_path, file_name)):
+            return False
+
+        self.entries.move_to_end(file_name)
+        self.pins[file_name] = self.pins.get(file_name, 0) + 1
+        return True
+
+    def release(self, key: str):
+        # the caller is done with a path returned by get_path
+        file_name = self.get_file_name(key)
+        with self.lock:
+            pins = self.pins.get(file_name, 0) - 1
+            if pins > 0:
+                self.pins[file_name] = pins
+                return
+
+            self.pins.pop(file_name, None)
+            if file_name not in self.entries:
+                # deleted while in use
+                self.remove_file(file_name)
+            self.evict()
+
+    def evict(self):
+        # least recently used first; the files in use are skipped (a single file bigger than the cache is still served)
+        for file_name in list(self.entries):
+            if self.size <= self.max_size:
+                break
+            if file_name in self.pins:
+                continue
+
+            self.size -= self.entries.pop(file_name)
+            self.remove_file(file_name)
+
+    def remove_file(self, file_name: str):
+        try:
+            os.remove(os.path.join(self.cache_path, file_name))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, key: str):
+        file_name = self.get_file_name(key)
+        with self.lock:
+            self.size -= self.entries.pop(file_name, 0)
+            if file_name not in self.pins:
+                self.remove_file(file_name)
@@ -0,0 +1,5 @@
+from enum import Enum
+
+class StorageEnums(Enum):
+    LOCAL = "LOCAL"
+    S3 = "S3"
@@ -0,0 +1,83 @@
+from abc import ABC, abstractmethod
+from typing import BinaryIO
+
+class StorageSizeExceededError(Exception):
+    pass
+
+class SizeLimitedReader:
+    """
+    File-like wrapper raising StorageSizeExceededError once more than `max_size` bytes were read
+    (declared sizes can't be trusted, the real size is checked while streaming).
+    """
+
+    def __init__(self, file_obj: BinaryIO, max_size: int = None):
+        self.file_obj = file_obj
+        self.max_size = max_size
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.file_obj.read(size)
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise StorageSizeExceededError(f"More than {self.max_size} bytes")
+        return chunk
+
+class StorageInterface(ABC):
+    """
+    Asset files storage. Objects are addressed by key (`<project_id>/<file_id>`) and are
+    immutable once written (a new upload always gets a new file id).
+    The calls are blocking, run them in a worker thread from the event loop.
+    """
+
+    @abstractmethod
+    def connect(self):
+        pass
+
+    @abstractmethod
+    def disconnect(self):
+        pass
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def get_size(self, key: str) -> int:
+        pass
+
+    @abstractmethod
+    def write_fileobj(self, key: str, file_obj: BinaryIO, max_size: int = None) -> int:
+        # stream a file-like object into `key`, returns its size, None (and nothing stored) past `max_size`
+        pass
+
+    @abstractmethod
+    def put_file(self, key: str, local_path: str, move: bool = False) -> int:
+        # store a local file, with `move` the local file is consumed (renamed when possible)
+        pass
+
+    @abstractmethod
+    def open_read(self, key: str) -> BinaryIO:
+        # streaming read, the caller closes it
+        pass
+
+    @abstractmethod
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        # bytes [start, end) only, for parsers that don't need the whole file
+        pass
+
+    @abstractmethod
+    def get_local_path(self, key: str) -> str:
+        # a local path to the file (for loaders that need one), None when it doesn't exist;
+        # a returned path is released with release_local_path once the file is read
+        pass
+
+    def release_local_path(self, key: str):
+        # the storage's own files aren't evicted, only a cache copy has to be released
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    def get_object_key(self, project_id: str, file_id: str) -> str:
+        return f"{project_id}/{file_id}"
@@ -0,0 +1,29 @@
+from .providers import LocalStorageProvider, S3StorageProvider
+from .StorageEnums import StorageEnums
+from controllers.base_controller import BaseController
+
+class StorageProviderFactory:
+    def __init__(self, config): # config is expected to be a settings object
+        self.config = config
+        self.base_controller = BaseController()
+
+    def create(self, provider: str):
+        if provider == StorageEnums.LOCAL.value:
+            return LocalStorageProvider(
+                root_path=self.base_controller.files_dir_path,
+                chunk_size=self.config.MAX_CHUNK_SIZE,
+            )
+
+        if provider == StorageEnums.S3.value:
+            return S3StorageProvider(
+                bucket=self.config.STORAGE_S3_BUCKET,
+                endpoint_url=self.config.STORAGE_S3_ENDPOINT_URL,
+                region=self.config.STORAGE_S3_REGION,
+                access_key_id=self.config.STORAGE_S3_ACCESS_KEY_ID,
+                secret_access_key=self.config.STORAGE_S3_SECRET_ACCESS_KEY,
+                key_prefix=self.config.STORAGE_S3_KEY_PREFIX,
+                cache_path=self.base_controller.get_cache_path(cache_name="files"),
+                cache_max_size=self.config.STORAGE_CACHE_MAX_SIZE * 1048576, # MB to bytes
+            )
+
+        return None
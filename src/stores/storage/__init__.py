@@ -0,0 +1,2 @@
+from .StorageProviderFactory import StorageProviderFactory
+from .StorageInterface import StorageInterface
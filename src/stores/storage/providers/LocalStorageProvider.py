@@ -0,0 +1,89 @@
+from ..StorageInterface import StorageInterface, SizeLimitedReader, StorageSizeExceededError
+from ..StorageEnums import StorageEnums
+from utils import traced
+from typing import BinaryIO
+import logging
+import os
+import shutil
+import uuid
+
+class LocalStorageProvider(StorageInterface):
+    """
+    Asset files on the local filesystem (`<root path>/<project_id>/<file_id>`), a volume
+    shared by every node (or a single node) is needed to scale out with it.
+    """
+
+    def __init__(self, root_path: str, chunk_size: int = 512000):
+        self.root_path = root_path
+        self.chunk_size = chunk_size
+
+        self.logger = logging.getLogger(__name__)
+
+    def connect(self):
+        os.makedirs(self.root_path, exist_ok=True)
+
+    def disconnect(self):
+        pass
+
+    def get_path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_path, key))
+        if os.path.commonpath([path, os.path.abspath(self.root_path)]) != os.path.abspath(self.root_path):
+            raise ValueError(f"Storage key outside of the storage root: {key}")
+        return path
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.get_path(key))
+
+    def get_size(self, key: str) -> int:
+        return os.path.getsize(self.get_path(key))
+
+    @traced("storage.write_fileobj", {"storage.backend": StorageEnums.LOCAL.value})
+    def write_fileobj(self, key: str, file_obj: BinaryIO, max_size: int = None) -> int:
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written aside and renamed once complete, a reader never sees a partial file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        reader = SizeLimitedReader(file_obj, max_size=max_size)
+        try:
+            with open(temp_path, "wb") as f:
+                while chunk := reader.read(self.chunk_size):
+                    f.write(chunk)
+            os.replace(temp_path, path)
+        except StorageSizeExceededError:
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return reader.size
+
+    @traced("storage.put_file", {"storage.backend": StorageEnums.LOCAL.value})
+    def put_file(self, key: str, local_path: str, move: bool = False) -> int:
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if move:
+            # a rename on the same filesystem, no copy
+            shutil.move(local_path, path)
+        else:
+            shutil.copyfile(local_path, path)
+
+        return os.path.getsize(path)
+
+    def open_read(self, key: str) -> BinaryIO:
+        return open(self.get_path(key), "rb")
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        with open(self.get_path(key), "rb") as f:
+            f.seek(start)
+            return f.read(max(end - start, 0))
+
+    def get_local_path(self, key: str) -> str:
+        path = self.get_path(key)
+        return path if os.path.isfile(path) else None
+
+    def delete(self, key: str):
+        path = self.get_path(key)
+        if os.path.isfile(path):
+            os.remove(path)
@@ -0,0 +1,135 @@
+from ..StorageInterface import StorageInterface, SizeLimitedReader, StorageSizeExceededError
+from ..StorageEnums import StorageEnums
+from ..LocalFileCache import LocalFileCache
+from utils import traced
+from typing import BinaryIO
+import logging
+import os
+
+class S3StorageProvider(StorageInterface):
+    """
+    Asset files in an S3 compatible bucket (AWS S3, MinIO ...), shared by every node.
+    Objects are streamed in and out (multipart uploads, no full file in memory), and the files
+    the loaders need on disk go through a local read-through cache.
+    """
+
+    def __init__(self, bucket: str, cache_path: str, cache_max_size: int,
+                       endpoint_url: str = None, region: str = None,
+                       access_key_id: str = None, secret_access_key: str = None,
+                       key_prefix: str = ""):
+
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        # the prefix is a "folder" of the bucket
+        self.key_prefix = f"{key_prefix.strip('/')}/" if key_prefix and key_prefix.strip("/") else ""
+
+        self.client = None
+        self.client_error = None
+        self.cache = LocalFileCache(cache_path=cache_path, max_size=cache_max_size)
+
+        self.logger = logging.getLogger(__name__)
+
+    def connect(self):
+        # imported lazily, boto3 is only needed with the S3 backend
+        import boto3 # type: ignore
+        from botocore.exceptions import ClientError # type: ignore
+
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=self.endpoint_url,
+            region_name=self.region,
+            aws_access_key_id=self.access_key_id,
+            aws_secret_access_key=self.secret_access_key,
+        )
+        self.client_error = ClientError
+
+        # created on first use for local setups (MinIO), an existing bucket is left as is
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            self.logger.info(f"Creating the storage bucket: {self.bucket}")
+            bucket_config = {}
+            if self.region and self.region != "us-east-1":
+                bucket_config["CreateBucketConfiguration"] = { "LocationConstraint": self.region }
+            self.client.create_bucket(Bucket=self.bucket, **bucket_config)
+
+    def disconnect(self):
+        self.client = None
+
+    def get_object_name(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def is_not_found(self, error: Exception) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.get_object_name(key))
+        except self.client_error as e:
+            if self.is_not_found(e):
+                return False
+            raise
+        return True
+
+    def get_size(self, key: str) -> int:
+        response = self.client.head_object(Bucket=self.bucket, Key=self.get_object_name(key))
+        return response["ContentLength"]
+
+    @traced("storage.write_fileobj", {"storage.backend": StorageEnums.S3.value})
+    def write_fileobj(self, key: str, file_obj: BinaryIO, max_size: int = None) -> int:
+        reader = SizeLimitedReader(file_obj, max_size=max_size)
+        try:
+            # multipart upload, aborted when the reader raises
+            self.client.upload_fileobj(reader, self.bucket, self.get_object_name(key))
+        except StorageSizeExceededError:
+            return None
+
+        return reader.size
+
+    @traced("storage.put_file", {"storage.backend": StorageEnums.S3.value})
+    def put_file(self, key: str, local_path: str, move: bool = False) -> int:
+        file_size = os.path.getsize(local_path)
+        self.client.upload_file(local_path, self.bucket, self.get_object_name(key))
+
+        if move:
+            os.remove(local_path)
+
+        return file_size
+
+    def open_read(self, key: str) -> BinaryIO:
+        response = self.client.get_object(Bucket=self.bucket, Key=self.get_object_name(key))
+        return response["Body"]
+
+    def read_range(self, key: str, start: int, end: int) -> bytes:
+        if end <= start:
+            return b""
+
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.get_object_name(key),
+            Range=f"bytes={start}-{end - 1}",
+        )
+        return response["Body"].read()
+
+    @traced("storage.download_file", {"storage.backend": StorageEnums.S3.value})
+    def download_file(self, key: str, local_path: str) -> bool:
+        try:
+            self.client.download_file(self.bucket, self.get_object_name(key), local_path)
+        except self.client_error as e:
+            if self.is_not_found(e):
+                return False
+            raise
+        return True
+
+    def get_local_path(self, key: str) -> str:
+        return self.cache.get_path(key, fetch=self.download_file)
+
+    def release_local_path(self, key: str):
+        self.cache.release(key)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.get_object_name(key))
+        self.cache.delete(key)
@@ -0,0 +1,2 @@
+from .LocalStorageProvider import LocalStorageProvider
+from .S3StorageProvider import S3StorageProvider
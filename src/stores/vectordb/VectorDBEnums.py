@@ -5,4 +5,9 @@ class VectorDBEnums(Enum):
 
 class DistanceMethodEnums(Enum):
     COSINE = "cosine"
-    DOT = "dot"
\ No newline at end of file
+    DOT = "dot"
+
+class PayloadFieldEnums(Enum):
+    # filterable point fields (payload indexed)
+    ASSET_ID = "metadata.asset_id"
+    PAGE = "metadata.page"
@@ -28,6 +28,20 @@ class VectorDBInterface(ABC):
     def delete_collection(self, collection_name: str):
         pass
 
+    @abstractmethod
+    def get_alias_target(self, alias_name: str):
+        # name of the collection behind an alias, None when it isn't an alias
+        pass
+
+    @abstractmethod
+    def swap_alias(self, alias_name: str, collection_name: str):
+        # point the alias to the collection, atomically for the searches
+        pass
+
+    @abstractmethod
+    def count_points(self, collection_name: str) -> int:
+        pass
+
     @abstractmethod
     def create_collection(self, collection_name: str, 
                                 embedding_size: int,
@@ -47,6 +61,23 @@ class VectorDBInterface(ABC):
         pass
 
     @abstractmethod
-    def search_by_vector(self, collection_name: str, vector: list, limit: int) -> List[RetrievedDocumentSchema]:
+    def scroll_points(self, collection_name: str, batch_size: int = 256):
+        # every point of the collection, by batches of [(id, vector, payload)]
+        pass
+
+    @abstractmethod
+    def delete_by_filter(self, collection_name: str, filters: dict):
+        # remove the points matching the filters (same format as the search filters)
+        pass
+
+    @abstractmethod
+    def search_by_vector(self, collection_name: str, vector: list, limit: int,
+                               filters: dict = None) -> List[RetrievedDocumentSchema]:
+        # filters: {"asset_ids": [str], "point_ids": [str], "page_from": int, "page_to": int}, every key optional
+        # (point_ids: points matched besides the assets' ones, only used with asset_ids)
+        pass
+
+    @abstractmethod
+    def search_many(self, collection_name: str, vectors: list, limits: list,
+                          filters: dict = None) -> List[List[RetrievedDocumentSchema]]:
         pass
-    
\ No newline at end of file
@@ -1,7 +1,9 @@
 from qdrant_client import models, QdrantClient # type: ignore
 from ..VectorDBInterface import VectorDBInterface
-from ..VectorDBEnums import DistanceMethodEnums
+from ..VectorDBEnums import DistanceMethodEnums, VectorDBEnums, PayloadFieldEnums
+from utils import traced, set_span_attributes, get_call_timeout
 import logging
+import math
 from schemas import RetrievedDocumentSchema
 from typing import List
 
@@ -20,6 +22,12 @@ class QdrantDBProvider(VectorDBInterface):
 
         self.logger = logging.getLogger(__name__)
 
+    def get_request_timeout(self):
+        # what's left of the request deadline, in whole seconds as the client expects
+        # (ignored by the local mode, the controller bounds the call instead)
+        timeout = get_call_timeout()
+        return max(int(math.ceil(timeout)), 1) if timeout is not None else None
+
     def connect(self):
         self.client = QdrantClient(path=self.db_path)
 
@@ -27,18 +35,55 @@ class QdrantDBProvider(VectorDBInterface):
         self.client = None
 
     def is_collection_existed(self, collection_name: str) -> bool:
-        return self.client.collection_exists(collection_name=collection_name)
+        # a project's collection name is an alias of its live index version
+        return (self.client.collection_exists(collection_name=collection_name)
+                or self.get_alias_target(collection_name) is not None)
+
+    def get_alias_target(self, alias_name: str):
+        for alias in self.client.get_aliases().aliases:
+            if alias.alias_name == alias_name:
+                return alias.collection_name
+        return None
+
+    @traced("qdrant.swap_alias", {"db.system": VectorDBEnums.QDRANT.value})
+    def swap_alias(self, alias_name: str, collection_name: str):
+        operations = []
+        if self.get_alias_target(alias_name) is not None:
+            operations.append(models.DeleteAliasOperation(
+                delete_alias=models.DeleteAlias(alias_name=alias_name)
+            ))
+        elif self.client.collection_exists(collection_name=alias_name):
+            # a collection built before index versions holds the name, it has to go first
+            # (the only swap that isn't atomic for the alias users)
+            self.logger.warning(f"Replacing unversioned collection {alias_name} by an alias to {collection_name}")
+            self.client.delete_collection(collection_name=alias_name)
+
+        operations.append(models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias_name)
+        ))
+
+        # deleting and creating the alias in one request switches the searches at once
+        return self.client.update_collection_aliases(change_aliases_operations=operations)
+
+    @traced("qdrant.count_points", {"db.system": VectorDBEnums.QDRANT.value})
+    def count_points(self, collection_name: str) -> int:
+        return self.client.count(collection_name=collection_name, exact=True).count
     
     def list_all_collections(self) -> List:
         return self.client.get_collections()
     
+    @traced("qdrant.get_collection_info", {"db.system": VectorDBEnums.QDRANT.value})
     def get_collection_info(self, collection_name: str) -> dict:
         return self.client.get_collection(collection_name=collection_name)
     
+    @traced("qdrant.delete_collection", {"db.system": VectorDBEnums.QDRANT.value})
     def delete_collection(self, collection_name: str):
-        if self.is_collection_existed(collection_name):
+        # an alias goes with the collection it points to
+        collection_name = self.get_alias_target(collection_name) or collection_name
+        if self.client.collection_exists(collection_name=collection_name):
             return self.client.delete_collection(collection_name=collection_name)
         
+    @traced("qdrant.create_collection", {"db.system": VectorDBEnums.QDRANT.value})
     def create_collection(self, collection_name: str, 
                                 embedding_size: int,
                                 do_reset: bool = False):
@@ -54,10 +99,56 @@ class QdrantDBProvider(VectorDBInterface):
                 )
             )
 
+            # filtered searches stay fast as the collection grows
+            self.create_payload_indexes(collection_name=collection_name)
+
             return True
         
         return False
     
+    def create_payload_indexes(self, collection_name: str):
+        # only a Qdrant server uses them: the local (path) mode accepts the call and ignores it,
+        # a filtered search there scans the collection's points (as it ignores the search timeout)
+        payload_indexes = {
+            PayloadFieldEnums.ASSET_ID.value: models.PayloadSchemaType.KEYWORD,
+            PayloadFieldEnums.PAGE.value: models.PayloadSchemaType.INTEGER,
+        }
+
+        for field_name, field_schema in payload_indexes.items():
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+
+    def get_search_filter(self, filters: dict = None):
+        # compile the search filters into a qdrant filter, None when nothing is filtered
+        if not filters:
+            return None
+
+        conditions = []
+        if filters.get("asset_ids") is not None:
+            asset_condition = models.FieldCondition(
+                key=PayloadFieldEnums.ASSET_ID.value,
+                match=models.MatchAny(any=list(filters["asset_ids"])),
+            )
+            if filters.get("point_ids"):
+                # or one of the points the assets' near-duplicate chunks are indexed under
+                asset_condition = models.Filter(should=[
+                    asset_condition,
+                    models.HasIdCondition(has_id=list(filters["point_ids"])),
+                ])
+            conditions.append(asset_condition)
+
+        if filters.get("page_from") is not None or filters.get("page_to") is not None:
+            conditions.append(models.FieldCondition(
+                key=PayloadFieldEnums.PAGE.value,
+                range=models.Range(gte=filters.get("page_from"), lte=filters.get("page_to")),
+            ))
+
+        return models.Filter(must=conditions) if conditions else None
+
+    @traced("qdrant.insert_one", {"db.system": VectorDBEnums.QDRANT.value})
     def insert_one(self, collection_name: str, text: str, vector: list,
                          metadata: dict = None, 
                          record_id: str = None):
@@ -85,6 +176,7 @@ class QdrantDBProvider(VectorDBInterface):
 
         return True
     
+    @traced("qdrant.insert_many", {"db.system": VectorDBEnums.QDRANT.value})
     def insert_many(self, collection_name: str, texts: list, 
                           vectors: list, metadata: list = None, 
                           record_ids: list = None, batch_size: int = 50):
@@ -126,13 +218,50 @@ class QdrantDBProvider(VectorDBInterface):
 
         return True
         
-    def search_by_vector(self, collection_name: str, vector: list, limit: int = 5):
+    def scroll_points(self, collection_name: str, batch_size: int = 256):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                yield [ (point.id, point.vector, point.payload) for point in points ]
+
+            if offset is None:
+                break
+
+    @traced("qdrant.delete_by_filter", {"db.system": VectorDBEnums.QDRANT.value})
+    def delete_by_filter(self, collection_name: str, filters: dict):
+        search_filter = self.get_search_filter(filters)
+        if search_filter is None:
+            # never wipe a whole collection by accident, delete_collection is there for that
+            raise ValueError("delete_by_filter needs at least one filter condition")
+
+        if not self.is_collection_existed(collection_name):
+            return False
+
+        self.client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(filter=search_filter),
+        )
+
+        return True
+
+    @traced("qdrant.search_by_vector", {"db.system": VectorDBEnums.QDRANT.value})
+    def search_by_vector(self, collection_name: str, vector: list, limit: int = 5, filters: dict = None):
 
         results = self.client.search(
             collection_name=collection_name,
             query_vector=vector,
-            limit=limit
+            query_filter=self.get_search_filter(filters),
+            limit=limit,
+            timeout=self.get_request_timeout(),
         )
+        set_span_attributes(**{"db.collection": collection_name, "db.results_count": len(results or [])})
 
         if not results or len(results) == 0:
             self.logger.warning(f"No results found for collection: {collection_name}")
@@ -142,7 +271,42 @@ class QdrantDBProvider(VectorDBInterface):
         return [
             RetrievedDocumentSchema(**{
                 "text" : result.payload["text"],
-                "score" : result.score
+                "score" : result.score,
+                "metadata" : result.payload.get("metadata"),
             })
             for result in results
-        ]
\ No newline at end of file
+        ]
+
+    @traced("qdrant.search_many", {"db.system": VectorDBEnums.QDRANT.value})
+    def search_many(self, collection_name: str, vectors: list, limits: list, filters: dict = None):
+        """
+        Run all the searches (with the same filters) in one `search_batch` round trip.
+        Returns one (possibly empty) list of documents per vector, in the same order.
+        """
+        search_filter = self.get_search_filter(filters)
+        batch_results = self.client.search_batch(
+            collection_name=collection_name,
+            requests=[
+                models.SearchRequest(
+                    vector=vector,
+                    filter=search_filter,
+                    limit=limit,
+                    with_payload=True,
+                )
+                for vector, limit in zip(vectors, limits)
+            ],
+            timeout=self.get_request_timeout(),
+        )
+        set_span_attributes(**{"db.collection": collection_name, "db.batch_size": len(vectors)})
+
+        return [
+            [
+                RetrievedDocumentSchema(**{
+                    "text" : result.payload["text"],
+                    "score" : result.score,
+                    "metadata" : result.payload.get("metadata"),
+                })
+                for result in (results or [])
+            ]
+            for results in batch_results
+        ]
@@ -0,0 +1,58 @@
+from controllers import DataController
+from concurrent.futures import ThreadPoolExecutor
+import io
+import tempfile
+import zipfile
+
+
+class MemoryStorage:
+
+    def __init__(self):
+        self.files = {}
+
+    def get_object_key(self, project_id: str, file_id: str):
+        return f"{project_id}/{file_id}"
+
+    def exists(self, key: str):
+        return key in self.files
+
+    def write_fileobj(self, key: str, file_obj, max_size: int = None):
+        self.files[key] = file_obj.read()
+        return len(self.files[key])
+
+
+def make_upload(members: dict, max_size: int):
+    # an upload as starlette hands it over: a SpooledTemporaryFile, rolled over to disk past max_size
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+
+    upload = tempfile.SpooledTemporaryFile(max_size=max_size)
+    upload.write(buffer.getvalue())
+    upload.seek(0)
+    return upload
+
+
+def test_archive_members_are_saved_concurrently():
+    members = { f"doc_{i}.txt": f"content {i} ".encode() * 200 for i in range(8) }
+    storage = MemoryStorage()
+    data_controller = DataController(storage_client=storage)
+
+    for max_size in (0, 1024 * 1024):
+        with make_upload(members, max_size=max_size) as upload:
+            archive, archive_file = data_controller.open_archive(upload)
+            try:
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    saved = list(executor.map(
+                        lambda member: data_controller.save_archive_member(
+                            archive=archive, member=member, project_id="p", max_size=1024 * 1024),
+                        data_controller.get_archive_members(archive),
+                    ))
+            finally:
+                archive.close()
+                archive_file.close()
+
+        assert all(is_saved for is_saved, _, _, _ in saved)
+        assert sorted(storage.files.values()) == sorted(members.values())
+        storage.files.clear()
@@ -0,0 +1,47 @@
+from stores.llm.providers.CoHereProvider import CoHereProvider
+from utils.deadline import _deadline
+import time
+
+
+def test_request_client_is_bounded_by_the_request_deadline():
+    provider = CoHereProvider(api_key="test")
+    assert provider.get_request_client() is provider.client
+
+    token = _deadline.set(time.monotonic() + 3)
+    try:
+        request_client = provider.get_request_client()
+    finally:
+        _deadline.reset(token)
+
+    assert request_client is not provider.client
+    assert 0 < request_client.timeout <= 3
+    # the shared client keeps the SDK default
+    assert provider.client.timeout > 3
+
+
+def test_only_transient_cohere_errors_are_retried():
+    from cohere.error import CohereError, CohereConnectionError, CohereAPIError
+    from stores.llm.ProviderGovernor import ProviderGovernor
+
+    governor = ProviderGovernor(backend="COHERE")
+
+    assert governor.classify_error(CohereConnectionError("reset by peer")) == governor.SERVER_ERROR
+    assert governor.classify_error(CohereError(message="Unexpected server error (status 502): {}")) == governor.SERVER_ERROR
+    assert governor.classify_error(CohereError("Unexpected exception (ChunkedEncodingError): ...")) == governor.SERVER_ERROR
+    assert governor.classify_error(CohereError(message="id must not be empty")) == governor.CLIENT_ERROR
+    assert governor.classify_error(CohereAPIError(message="invalid model", http_status=400)) == governor.CLIENT_ERROR
+
+
+def test_a_slot_timeout_gives_the_rate_limit_budget_back():
+    from stores.llm.ProviderGovernor import ProviderGovernor, ProviderUnavailableError
+    import pytest
+
+    governor = ProviderGovernor(backend="COHERE", rpm_limit=60, tpm_limit=1000, max_concurrency=1,
+                                queue_timeout_seconds=0.05)
+    governor.acquire(estimated_tokens=100)
+
+    with pytest.raises(ProviderUnavailableError):
+        governor.acquire(estimated_tokens=100)
+
+    assert governor.requests_bucket.tokens == pytest.approx(59, abs=0.1)
+    assert governor.tokens_bucket.tokens == pytest.approx(900, abs=1)
@@ -0,0 +1,62 @@
+from stores.llm.EmbeddingBatcher import EmbeddingBatcher
+from utils import DeadlineExceededError
+from utils.deadline import _deadline, get_deadline
+import asyncio
+import time
+
+
+class SlowEmbeddingClient:
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.deadlines = []
+
+    def embed_many(self, texts: list, document_type: str = None):
+        self.deadlines.append(get_deadline())
+        time.sleep(self.seconds)
+        return [ [float(len(text))] for text in texts ]
+
+
+def with_deadline(seconds, coroutine_function, *args):
+    # run the coroutine in a task of its own, as the deadline middleware runs a request handler
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        return asyncio.ensure_future(coroutine_function(*args))
+    finally:
+        _deadline.reset(token)
+
+
+def test_batch_runs_under_the_latest_caller_deadline():
+
+    async def scenario():
+        client = SlowEmbeddingClient(seconds=0.2)
+        batcher = EmbeddingBatcher(client, max_wait_ms=5)
+
+        started_at = time.monotonic()
+        short = with_deadline(0.05, batcher.embed, "a")
+        long = with_deadline(5, batcher.embed, "bb")
+        results = await asyncio.gather(short, long, return_exceptions=True)
+        return started_at, client.deadlines, results
+
+    started_at, deadlines, (short_result, long_result) = asyncio.run(scenario())
+
+    assert len(deadlines) == 1
+    assert deadlines[0] - started_at > 4
+    # the short caller gives up on its own deadline, the other one still gets its vector
+    assert isinstance(short_result, DeadlineExceededError)
+    assert long_result == [2.0]
+
+
+def test_batch_without_deadline_when_a_caller_has_none():
+
+    async def scenario():
+        client = SlowEmbeddingClient(seconds=0)
+        batcher = EmbeddingBatcher(client, max_wait_ms=5)
+
+        results = await asyncio.gather(with_deadline(5, batcher.embed, "a"), batcher.embed("bb"))
+        return client.deadlines, results
+
+    deadlines, results = asyncio.run(scenario())
+
+    assert deadlines == [None]
+    assert results == [[1.0], [2.0]]
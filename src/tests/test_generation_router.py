@@ -0,0 +1,32 @@
+from stores.llm.GenerationRouter import GenerationRouter
+from utils.deadline import _deadline, get_deadline
+import time
+
+
+class RecordingClient:
+
+    enums = None
+    generation_model_id = "recording"
+
+    def __init__(self):
+        self.deadlines = []
+
+    def generate_text(self, prompt: str, chat_history: list = [], max_output_tokens: int = None,
+                            temperature: float = None):
+        self.deadlines.append(get_deadline())
+        return "answer"
+
+
+def test_routed_calls_see_the_request_deadline():
+    primary, fallback = RecordingClient(), RecordingClient()
+    router = GenerationRouter(backends=[primary, fallback], hedge_enabled=False)
+
+    deadline = time.monotonic() + 10
+    token = _deadline.set(deadline)
+    try:
+        answer = router.generate_text(prompt="question", chat_history=[])
+    finally:
+        _deadline.reset(token)
+
+    assert answer == "answer"
+    assert primary.deadlines == [deadline]
@@ -0,0 +1,48 @@
+from stores.storage.LocalFileCache import LocalFileCache
+import os
+
+
+def fetch(key, local_path):
+    if key.startswith("missing"):
+        return False
+    with open(local_path, "wb") as f:
+        f.write(b"x" * 10)
+    return True
+
+
+def test_a_file_in_use_is_not_evicted_until_released(tmp_path):
+    cache = LocalFileCache(cache_path=str(tmp_path), max_size=15)
+
+    first_path = cache.get_path("first.txt", fetch)
+    second_path = cache.get_path("second.txt", fetch)
+
+    # over the size, but both files are in use
+    assert os.path.exists(first_path) and os.path.exists(second_path)
+
+    cache.release("first.txt")
+    assert not os.path.exists(first_path)
+    assert os.path.exists(second_path)
+
+    cache.release("second.txt")
+    assert os.path.exists(second_path)
+    assert cache.size == 10
+
+
+def test_a_file_deleted_in_use_is_removed_once_released(tmp_path):
+    cache = LocalFileCache(cache_path=str(tmp_path), max_size=100)
+
+    file_path = cache.get_path("file.txt", fetch)
+    cache.delete("file.txt")
+    assert os.path.exists(file_path)
+
+    cache.release("file.txt")
+    assert not os.path.exists(file_path)
+    assert cache.size == 0
+
+
+def test_a_failed_fetch_leaves_no_fetch_lock(tmp_path):
+    cache = LocalFileCache(cache_path=str(tmp_path), max_size=100)
+
+    assert cache.get_path("missing.txt", fetch) is None
+    assert cache.fetch_locks == {}
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,51 @@
+from stores.llm.templates import PromptBuilder
+from stores.llm.TokenCounter import TokenCounter
+from schemas import RetrievedDocumentSchema
+from types import SimpleNamespace
+import pytest
+
+
+class StubTemplateParser:
+
+    def get(self, group: str, key: str, vars: dict={}):
+        return {"footer_prompt": f"Question: {vars.get('query')}", "system_prompt": "You answer."}[key]
+
+    def render_many(self, group: str, key: str, vars_list: list):
+        return [ f"Document {v['doc_num']}: {v['chunk_text']}" for v in vars_list ]
+
+
+class StubGenerationClient:
+    enums = SimpleNamespace(SYSTEM=SimpleNamespace(value="system"))
+
+    def get_token_counter(self):
+        # 4 bytes per token
+        return TokenCounter(use_tiktoken=False)
+
+    def construct_prompt(self, prompt: str, role: str):
+        return {"role": role, "content": prompt}
+
+
+def get_builder(**budget):
+    return PromptBuilder(template_parser=StubTemplateParser(), generation_client=StubGenerationClient(), **budget)
+
+
+def test_a_large_system_message_leaves_the_documents_their_minimum():
+    builder = get_builder(max_prompt_tokens=100, max_history_tokens=100, min_document_tokens=20)
+    documents = [ RetrievedDocumentSchema(text="lease notice " * 20, score=0.9) ]
+
+    chat_history, full_prompt = builder.build(
+        query="notice?", retrieved_documents=documents,
+        chat_history=[ {"role": "system", "content": "x" * 1000} ],
+    )
+
+    history_tokens = builder.token_counter.count(chat_history[0]["content"])
+    assert 0 < history_tokens <= 100 - builder.token_counter.count("Question: notice?") - 20
+    assert full_prompt.startswith("Document 1: lease notice")
+    assert builder.token_counter.count(full_prompt) <= 100
+
+
+def test_a_query_leaving_no_room_for_documents_fails():
+    builder = get_builder(max_prompt_tokens=100, max_history_tokens=50, min_document_tokens=20)
+
+    with pytest.raises(ValueError):
+        builder.build(query="q" * 400, retrieved_documents=[ RetrievedDocumentSchema(text="a", score=1.0) ])
@@ -0,0 +1,23 @@
+from utils import setup_provider_threads, shutdown_provider_threads, run_provider_call
+from utils.deadline import _deadline, get_deadline
+import asyncio
+import threading
+
+
+def test_provider_calls_run_on_their_own_threads_with_the_caller_context():
+
+    def call():
+        return threading.current_thread().name, get_deadline()
+
+    async def scenario():
+        _deadline.set(123.0)
+        return await run_provider_call(call)
+
+    setup_provider_threads(max_workers=2)
+    try:
+        thread_name, deadline = asyncio.run(scenario())
+    finally:
+        shutdown_provider_threads()
+
+    assert thread_name.startswith("llm-provider")
+    assert deadline == 123.0
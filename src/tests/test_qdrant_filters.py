@@ -0,0 +1,31 @@
+from stores.vectordb.providers.QdrantDBProvider import QdrantDBProvider
+import uuid
+
+
+def test_asset_filter_matches_the_points_of_the_assets_duplicates(tmp_path):
+    provider = QdrantDBProvider(db_path=str(tmp_path / "qdrant"), distance_method="cosine")
+    provider.connect()
+    provider.create_collection(collection_name="collection_test", embedding_size=2)
+
+    point_ids = [ str(uuid.uuid4()) for _ in range(3) ]
+    provider.insert_many(
+        collection_name="collection_test",
+        texts=[ "a", "shared", "c" ],
+        vectors=[ [1.0, 0.0], [0.9, 0.1], [0.8, 0.2] ],
+        metadata=[ {"asset_id": "a1", "page": 0}, {"asset_id": "a2", "page": 1}, {"asset_id": "a3", "page": 0} ],
+        record_ids=point_ids,
+    )
+
+    def search(filters):
+        results = provider.search_by_vector(collection_name="collection_test", vector=[1.0, 0.0],
+                                            limit=5, filters=filters) or []
+        return sorted(result.text for result in results)
+
+    # a1 also holds a near-duplicate of a2's canonical chunk
+    assert search({"asset_ids": ["a1"]}) == ["a"]
+    assert search({"asset_ids": ["a1"], "point_ids": [point_ids[1]]}) == ["a", "shared"]
+    assert search({"asset_ids": ["a1"], "point_ids": [point_ids[1]], "page_to": 0}) == ["a"]
+
+    # deleting an asset's points leaves the canonical chunks of its duplicates in place
+    provider.delete_by_filter(collection_name="collection_test", filters={"asset_ids": ["a1"]})
+    assert search(None) == ["c", "shared"]
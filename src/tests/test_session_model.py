@@ -0,0 +1,36 @@
+from models import SessionModel
+from utils.ttl_cache import TTLCache
+from bson import ObjectId
+import asyncio
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def test_cached_sessions_follow_the_writes_of_other_workers():
+
+    async def scenario():
+        db_client = mongomock_motor.AsyncMongoMockClient()["test"]
+        project_id = ObjectId()
+
+        # two workers: one database, a session cache each
+        worker_a = await SessionModel.create_instance(db_client, session_cache=TTLCache())
+        worker_b = await SessionModel.create_instance(db_client, session_cache=TTLCache())
+
+        session = await worker_a.insert_session_in_db(project_id=project_id, messages=[{ "role": "user" }])
+        cached = await worker_a.get_session_from_db(session.session_id, project_id=project_id)
+
+        await asyncio.sleep(0.01)
+        await worker_b.append_session_messages(session.session_id, messages=[{ "role": "assistant" }])
+        appended = await worker_a.get_session_from_db(session.session_id, project_id=project_id)
+
+        await worker_b.delete_session_from_db(session.session_id)
+        deleted = await worker_a.get_session_from_db(session.session_id, project_id=project_id)
+
+        return cached, appended, deleted
+
+    cached, appended, deleted = asyncio.run(scenario())
+
+    assert len(cached.session_messages) == 1
+    assert len(appended.session_messages) == 2
+    assert deleted is None
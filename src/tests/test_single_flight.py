@@ -0,0 +1,64 @@
+from utils import SingleFlight, DeadlineExceededError
+from utils.deadline import _deadline, get_remaining_seconds
+import asyncio
+import time
+import pytest
+
+
+def with_deadline(seconds, coroutine_function, *args):
+    # run the coroutine in a task of its own, as the deadline middleware runs a request handler
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        return asyncio.ensure_future(coroutine_function(*args))
+    finally:
+        _deadline.reset(token)
+
+
+def test_shared_call_does_not_inherit_the_leader_deadline():
+
+    async def scenario():
+        single_flight = SingleFlight()
+        started = asyncio.Event()
+        seen_remaining = []
+
+        async def call():
+            seen_remaining.append(get_remaining_seconds())
+            started.set()
+            await asyncio.sleep(0.2)
+            return "answer"
+
+        leader = with_deadline(0.05, single_flight.do, "key", "test", call)
+        await started.wait()
+        follower = with_deadline(5, single_flight.do, "key", "test", call)
+
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        return seen_remaining, results
+
+    seen_remaining, (leader_result, follower_result) = asyncio.run(scenario())
+
+    assert seen_remaining == [None]
+    # the leader gives up on its own deadline, the follower still gets the shared answer
+    assert isinstance(leader_result, DeadlineExceededError)
+    assert follower_result == "answer"
+
+
+def test_shared_call_is_cancelled_once_every_caller_gave_up():
+
+    async def scenario():
+        single_flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(DeadlineExceededError):
+            await with_deadline(0.05, single_flight.do, "key", "test", call)
+
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return len(single_flight)
+
+    assert asyncio.run(scenario()) == 0
@@ -1 +1,13 @@
-from .metrics import setup_metrics
\ No newline at end of file
+from .metrics import setup_metrics, mark_worker_dead, track_latency, track_stage, track_provider_call, track_db_operation
+from .metrics import observe_chunks, observe_tokens, observe_single_flight, observe_embedding_batch
+from .metrics import observe_chunks_persisted, observe_chunks_deduplicated, observe_index_rebuild
+from .metrics import observe_dependency_health, observe_warmup_step
+from .metrics import observe_admission_queue, observe_admission_wait, observe_admission_shed
+from .metrics import observe_provider_retry, observe_provider_governor_state, observe_generation_router_event
+from .tracing import setup_tracing, traced, set_span_attributes, get_trace_id
+from .single_flight import SingleFlight
+from .deadline import setup_deadlines, DeadlineExceededError, check_deadline, wait_for_deadline, get_call_timeout
+from .deadline import get_deadline, deadline_scope
+from .admission import setup_admission, AdmissionRejectedError
+from .provider_threads import setup_provider_threads, shutdown_provider_threads, run_provider_call
+from .health import HealthChecker
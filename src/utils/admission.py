@@ -0,0 +1,283 @@
+from fastapi import FastAPI # type: ignore
+from starlette.routing import Match # type: ignore
+from starlette.types import ASGIApp, Receive, Scope, Send # type: ignore
+from collections import deque
+from .metrics import observe_admission_queue, observe_admission_wait, observe_admission_shed
+from enums import ResponseSignal
+import asyncio
+import itertools
+import json
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# route classes, a lower priority value is served first
+INTERACTIVE_ROUTE_CLASS = "interactive"
+BULK_ROUTE_CLASS = "bulk"
+
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised when a request is shed instead of being queued (or kept queued) for a slot.
+    """
+
+    def __init__(self, route_class: str, reason: str, retry_after: float):
+        super().__init__(f"Request shed by admission control ({route_class}): {reason}")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RoutePool:
+    """
+    Concurrency pool of a route class with its own queue of waiting requests.
+    """
+
+    def __init__(self, name: str, priority: int, max_concurrency: int, max_queue_wait_seconds: float):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue_wait_seconds = max_queue_wait_seconds
+
+        self.in_flight = 0
+        # [Waiter] in arrival order
+        self.waiters = deque()
+        # after a queued request timed out, new ones are shed right away while the queue is still standing
+        self.overloaded_until = 0.0
+
+
+class Waiter:
+
+    def __init__(self, pool: RoutePool, project_id: str, sequence: int, future: asyncio.Future):
+        self.pool = pool
+        self.project_id = project_id
+        self.sequence = sequence
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Admit requests into a fixed number of worker slots shared by all the route classes.
+
+    - every route class has its own pool (bulk ingestion gets a small share, so it can't take
+      the slots, nor the provider quota, the interactive requests need)
+    - freed slots go to the waiting requests by class priority (interactive first), then to the
+      project with the fewest requests in flight, then in arrival order
+    - a project can't hold more than `project_max_concurrency` slots at once
+    - a request is shed (503) when it waited longer than its class max queue wait; for the next
+      max queue wait, new requests of that class are shed right away while its queue isn't empty
+
+    Not thread-safe on purpose, it's meant to be used from the event loop only.
+    """
+
+    def __init__(self, pools: list, max_concurrency: int, project_max_concurrency: int = None):
+        self.pools = { pool.name: pool for pool in pools }
+        self.max_concurrency = max_concurrency
+        self.project_max_concurrency = project_max_concurrency
+
+        self.in_flight = 0
+        # {project_id: requests in flight}
+        self.project_in_flight = {}
+        self.sequence = itertools.count()
+
+    def get_retry_after(self, pool: RoutePool):
+        return max(math.ceil(pool.max_queue_wait_seconds), 1)
+
+    def can_admit(self, pool: RoutePool, project_id: str):
+        if self.in_flight >= self.max_concurrency or pool.in_flight >= pool.max_concurrency:
+            return False
+
+        if project_id is not None and self.project_max_concurrency:
+            return self.project_in_flight.get(project_id, 0) < self.project_max_concurrency
+
+        return True
+
+    async def acquire(self, route_class: str, project_id: str = None):
+        pool = self.pools[route_class]
+
+        # the queue is standing: a new request would wait too long as well, fail fast
+        if pool.waiters and time.monotonic() < pool.overloaded_until:
+            observe_admission_shed(route_class=pool.name, reason="overloaded")
+            raise AdmissionRejectedError(pool.name, "overloaded", self.get_retry_after(pool))
+
+        waiter = Waiter(pool, project_id, next(self.sequence), asyncio.get_running_loop().create_future())
+        pool.waiters.append(waiter)
+        self.dispatch()
+
+        try:
+            if not waiter.future.done():
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=pool.max_queue_wait_seconds)
+        except asyncio.TimeoutError:
+            self.abandon(waiter)
+            pool.overloaded_until = time.monotonic() + pool.max_queue_wait_seconds
+            observe_admission_wait(route_class=pool.name, result="shed", seconds=time.monotonic() - waiter.enqueued_at)
+            observe_admission_shed(route_class=pool.name, reason="queue_timeout")
+            raise AdmissionRejectedError(pool.name, "queue_timeout", self.get_retry_after(pool))
+        except asyncio.CancelledError:
+            # deadline expired or client disconnected while queued
+            self.abandon(waiter)
+            raise
+
+        observe_admission_wait(route_class=pool.name, result="admitted", seconds=time.monotonic() - waiter.enqueued_at)
+
+    def abandon(self, waiter: Waiter):
+        if waiter.future.done() and not waiter.future.cancelled():
+            # the slot was granted in the meantime, hand it over
+            self.release(waiter.pool.name, waiter.project_id)
+            return
+
+        waiter.future.cancel()
+        if waiter in waiter.pool.waiters:
+            waiter.pool.waiters.remove(waiter)
+            self.observe_queues()
+
+    def release(self, route_class: str, project_id: str = None):
+        pool = self.pools[route_class]
+        pool.in_flight -= 1
+        self.in_flight -= 1
+
+        if project_id is not None:
+            self.project_in_flight[project_id] -= 1
+            if self.project_in_flight[project_id] <= 0:
+                del self.project_in_flight[project_id]
+
+        self.dispatch()
+
+    def next_waiter(self):
+        # a lower priority class only gets a slot no higher priority waiter can take
+        # (its pool is full or its project is at quota)
+        for pool in sorted(self.pools.values(), key=lambda pool: pool.priority):
+            eligible = [ waiter for waiter in pool.waiters if self.can_admit(pool, waiter.project_id) ]
+            if eligible:
+                return min(eligible, key=lambda waiter: (
+                    self.project_in_flight.get(waiter.project_id, 0), waiter.sequence
+                ))
+
+        return None
+
+    def dispatch(self):
+        while self.in_flight < self.max_concurrency:
+            waiter = self.next_waiter()
+            if waiter is None:
+                break
+
+            waiter.pool.waiters.remove(waiter)
+            waiter.pool.in_flight += 1
+            self.in_flight += 1
+            if waiter.project_id is not None:
+                self.project_in_flight[waiter.project_id] = self.project_in_flight.get(waiter.project_id, 0) + 1
+
+            waiter.future.set_result(True)
+
+        self.observe_queues()
+
+    def observe_queues(self):
+        for pool in self.pools.values():
+            observe_admission_queue(route_class=pool.name, depth=len(pool.waiters), in_flight=pool.in_flight)
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware holding an admission slot for the whole request (response included).
+    Requests whose path isn't in a route class (health check, metrics, collection info ...) bypass it.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController, route_classes: dict):
+        self.app = app
+        self.controller = controller
+        # [(path prefix, route class)], longest prefix first
+        self.route_prefixes = sorted(
+            ( (prefix, route_class) for route_class, prefixes in route_classes.items() for prefix in prefixes ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def get_route_class(self, scope: Scope):
+        for prefix, route_class in self.route_prefixes:
+            if scope["path"].startswith(prefix):
+                return route_class
+        return None
+
+    def get_project_id(self, scope: Scope):
+        # resolved from the matched route path params, requests without one share no project quota
+        routes = getattr(getattr(scope.get("app"), "router", None), "routes", [])
+        for route in routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return child_scope.get("path_params", {}).get("project_id")
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route_class = self.get_route_class(scope)
+        if route_class is None:
+            return await self.app(scope, receive, send)
+
+        project_id = self.get_project_id(scope)
+
+        try:
+            await self.controller.acquire(route_class, project_id)
+        except AdmissionRejectedError as e:
+            logger.warning(f"{e}: {scope['method']} {scope['path']}")
+            return await self.send_overloaded_response(send, e)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class, project_id)
+
+    async def send_overloaded_response(self, send: Send, error: AdmissionRejectedError):
+        body = json.dumps({
+            "signal": ResponseSignal.SERVICE_OVERLOADED.value,
+            "reason": error.reason,
+        }).encode("utf-8")
+
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(error.retry_after).encode("latin-1")),
+            ],
+        })
+        await send({ "type": "http.response.body", "body": body })
+
+
+def setup_admission(app: FastAPI, enabled: bool, max_concurrency: int, project_max_concurrency: int,
+                    interactive_paths: list, interactive_max_concurrency: int, interactive_max_queue_wait_seconds: float,
+                    bulk_paths: list, bulk_max_concurrency: int, bulk_max_queue_wait_seconds: float):
+    """
+    Add the admission control middleware (interactive requests go ahead of the bulk ones).
+    """
+    if not enabled:
+        return None
+
+    controller = AdmissionController(
+        pools=[
+            RoutePool(INTERACTIVE_ROUTE_CLASS, priority=0, max_concurrency=interactive_max_concurrency,
+                      max_queue_wait_seconds=interactive_max_queue_wait_seconds),
+            RoutePool(BULK_ROUTE_CLASS, priority=1, max_concurrency=bulk_max_concurrency,
+                      max_queue_wait_seconds=bulk_max_queue_wait_seconds),
+        ],
+        max_concurrency=max_concurrency,
+        project_max_concurrency=project_max_concurrency,
+    )
+
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=controller,
+        route_classes={
+            INTERACTIVE_ROUTE_CLASS: interactive_paths,
+            BULK_ROUTE_CLASS: bulk_paths,
+        },
+    )
+    app.admission_controller = controller
+
+    return controller
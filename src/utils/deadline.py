@@ -0,0 +1,251 @@
+from fastapi import FastAPI # type: ignore
+from starlette.types import ASGIApp, Message, Receive, Scope, Send # type: ignore
+from contextvars import ContextVar
+from .metrics import observe_request_cancelled
+from enums import ResponseSignal
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import time
+import pymongo # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# header a client can send to shorten its own deadline (seconds)
+REQUEST_TIMEOUT_HEADER = b"x-request-timeout"
+
+# absolute deadline (time.monotonic()) of the request being served, None when it has none
+_deadline: ContextVar = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """
+    Raised when the request deadline expired (or is too close to start the next call).
+    """
+
+    def __init__(self, operation: str = None):
+        super().__init__(f"Request deadline exceeded{f' before {operation}' if operation else ''}")
+        self.operation = operation
+
+
+def get_deadline():
+    return _deadline.get()
+
+@contextlib.contextmanager
+def deadline_scope(deadline: float = None):
+    # run a block under another absolute deadline (time.monotonic()), None: without deadline
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def get_remaining_seconds():
+    """
+    Seconds left before the request deadline, None when the request has no deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+
+    return deadline - time.monotonic()
+
+def get_call_timeout(default: float = None):
+    # timeout to give a client call: what's left of the deadline (or `default` without a deadline)
+    remaining = get_remaining_seconds()
+    if remaining is None:
+        return default
+
+    return remaining if default is None else min(remaining, default)
+
+def check_deadline(operation: str = None):
+    remaining = get_remaining_seconds()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceededError(operation)
+
+async def wait_for_deadline(awaitable, operation: str = None):
+    """
+    Await `awaitable` within the remaining request deadline; on expiry it's cancelled
+    and DeadlineExceededError is raised.
+    """
+    remaining = get_remaining_seconds()
+    if remaining is None:
+        return await awaitable
+
+    if remaining <= 0:
+        # don't leave a never awaited coroutine behind
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceededError(operation)
+
+    try:
+        return await asyncio.wait_for(awaitable, timeout=remaining)
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError(operation)
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware giving every request a deadline: the configured timeout, or the
+    shorter one sent by the client in the `X-Request-Timeout` header.
+
+    - the deadline is exposed through a context variable to the code serving the request
+      (controller awaits, provider and vector db calls) and as a pymongo timeout to every MongoDB call
+    - the handler is cancelled when the deadline expires (504) or when the client disconnects
+
+    Cancelling only stops what runs on the event loop (the awaits, the MongoDB calls, the calls still
+    queued for a thread). A blocking provider or vector db call already running in a thread can't be
+    interrupted: it runs until it ends or hits its own timeout (the remaining deadline it was given when
+    it started) and its result is dropped. Past the deadline, that thread makes no retry and starts no
+    other provider call (check_deadline), a disconnect alone doesn't stop it.
+    """
+
+    def __init__(self, app: ASGIApp, timeout_seconds: float, excluded_paths: list = None):
+        self.app = app
+        self.timeout_seconds = timeout_seconds
+        self.excluded_paths = tuple(excluded_paths or [])
+
+    def get_timeout(self, scope: Scope):
+        """
+        Seconds until the request deadline, None when the request has no deadline.
+        """
+        timeout_seconds = self.timeout_seconds or None
+
+        client_timeout = self.get_header(scope, REQUEST_TIMEOUT_HEADER)
+        if client_timeout is not None:
+            try:
+                client_timeout = float(client_timeout)
+            except ValueError:
+                client_timeout = None
+
+        # a client can only shorten its deadline
+        if client_timeout is not None and math.isfinite(client_timeout):
+            timeout_seconds = client_timeout if timeout_seconds is None else min(timeout_seconds, client_timeout)
+
+        return timeout_seconds
+
+    def get_header(self, scope: Scope, header_name: bytes):
+        for name, value in scope.get("headers", []):
+            if name == header_name:
+                return value.decode("latin-1")
+        return None
+
+    def has_body(self, scope: Scope):
+        content_length = self.get_header(scope, b"content-length")
+        return self.get_header(scope, b"transfer-encoding") is not None or (
+            content_length is not None and content_length.strip() not in ("", "0")
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+
+        if scope["type"] != "http" or scope["path"].startswith(self.excluded_paths):
+            return await self.app(scope, receive, send)
+
+        timeout_seconds = self.get_timeout(scope)
+        if timeout_seconds is None:
+            return await self.app(scope, receive, send)
+
+        if timeout_seconds <= 0:
+            observe_request_cancelled(scope, reason="deadline")
+            return await self.send_timeout_response(send)
+
+        response_started = False
+        body_received = False
+        disconnected = asyncio.Event()
+        # messages read by the disconnect watcher, handed to the app when it asks for them
+        pending_messages = asyncio.Queue()
+        disconnect_watcher = None
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                await pending_messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        async def receive_wrapper():
+            nonlocal body_received, disconnect_watcher
+            if body_received:
+                return await pending_messages.get()
+
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                # the body is fully read (no read-ahead of uploads), from now on watch for a disconnect
+                body_received = True
+                disconnect_watcher = asyncio.create_task(watch_disconnect())
+            return message
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        if not self.has_body(scope):
+            # nothing to read for the app, the watcher can start right away
+            body_received = True
+            disconnect_watcher = asyncio.create_task(watch_disconnect())
+
+        # the handler task copies the current context: request deadline + pymongo client side timeout
+        deadline_token = _deadline.set(time.monotonic() + timeout_seconds)
+        try:
+            with pymongo.timeout(timeout_seconds):
+                app_task = asyncio.create_task(self.app(scope, receive_wrapper, send_wrapper))
+        finally:
+            _deadline.reset(deadline_token)
+
+        disconnect_task = asyncio.create_task(disconnected.wait())
+
+        try:
+            done, _ = await asyncio.wait({app_task, disconnect_task}, timeout=timeout_seconds,
+                                         return_when=asyncio.FIRST_COMPLETED)
+
+            if app_task in done:
+                return app_task.result()
+
+            app_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await app_task
+
+            if disconnect_task in done:
+                # nobody is waiting for the answer anymore
+                observe_request_cancelled(scope, reason="disconnect")
+                logger.info(f"Client disconnected, request cancelled: {scope['method']} {scope['path']}")
+                return
+
+            observe_request_cancelled(scope, reason="deadline")
+            if not response_started:
+                await self.send_timeout_response(send)
+
+        finally:
+            disconnect_task.cancel()
+            if disconnect_watcher is not None:
+                disconnect_watcher.cancel()
+            if not app_task.done():
+                app_task.cancel()
+
+    async def send_timeout_response(self, send: Send):
+        body = json.dumps({ "signal": ResponseSignal.REQUEST_TIMEOUT.value }).encode("utf-8")
+
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({ "type": "http.response.body", "body": body })
+
+
+def setup_deadlines(app: FastAPI, timeout_seconds: float, excluded_paths: list = None):
+    """
+    Add the per-request deadline middleware (timeout_seconds = 0 disables the configured deadline,
+    a client can still send X-Request-Timeout).
+    """
+    app.add_middleware(DeadlineMiddleware, timeout_seconds=timeout_seconds, excluded_paths=excluded_paths)
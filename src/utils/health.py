@@ -0,0 +1,139 @@
+from datetime import datetime, timezone
+from .metrics import observe_dependency_health, observe_warmup_step
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HealthChecker:
+    """
+    Readiness of the worker, so the liveness / readiness probes never touch a dependency themselves:
+
+    - the startup warm-up (pools opened, hot collections loaded, a first embedding ...) runs in the background,
+      the worker is live meanwhile but not ready
+    - the dependencies are then checked every `interval_seconds` by the same background task,
+      the probes only read the last results
+    - ready = warm-up done, every critical dependency passed its last check, and that check is recent
+      (a stuck checker makes the worker unready instead of serving an old status)
+    """
+
+    def __init__(self, checks: dict, interval_seconds: float, timeout_seconds: float, critical: list = None):
+        # {dependency: async check, raises when the dependency is down}
+        self.checks = checks
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.critical = set(critical if critical is not None else checks)
+
+        # {dependency: last check result}
+        self.dependencies = {
+            name: { "healthy": False, "critical": name in self.critical, "checked_at": None,
+                    "latency_ms": None, "error": "not checked yet" }
+            for name in checks
+        }
+        self.checked_at = None
+
+        self.warmup_status = "pending"
+        # {step: result}
+        self.warmup_steps = {}
+        self.is_shutting_down = False
+
+        self.task = None
+
+    async def run_check(self, name: str, check):
+        started_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), timeout=self.timeout_seconds)
+            error = None
+        except asyncio.TimeoutError:
+            error = f"no answer within {self.timeout_seconds}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        self.dependencies[name] = {
+            "healthy": error is None,
+            "critical": name in self.critical,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "latency_ms": round((time.perf_counter() - started_at) * 1000, 1),
+            "error": error,
+        }
+        observe_dependency_health(dependency=name, is_healthy=error is None)
+
+        if error is not None:
+            logger.warning(f"Health check of {name} failed: {error}")
+
+    async def check_all(self):
+        await asyncio.gather(*[ self.run_check(name, check) for name, check in self.checks.items() ])
+        self.checked_at = time.monotonic()
+
+    async def warm_up(self, steps: dict, timeout_seconds: float):
+        """
+        Run the warm-up steps (`{step: async callable}`, in order). A failed step is recorded and logged,
+        it doesn't hold the worker back: the dependency checks decide the readiness.
+        """
+        self.warmup_status = "running"
+        warmup_started_at = time.perf_counter()
+
+        for name, step in steps.items():
+            started_at = time.perf_counter()
+            try:
+                detail = await asyncio.wait_for(step(), timeout=timeout_seconds)
+                result = { "ok": True, "detail": detail, "error": None }
+            except asyncio.TimeoutError:
+                result = { "ok": False, "detail": None, "error": f"not done within {timeout_seconds}s" }
+            except Exception as e:
+                result = { "ok": False, "detail": None, "error": str(e) or type(e).__name__ }
+
+            result["seconds"] = round(time.perf_counter() - started_at, 3)
+            self.warmup_steps[name] = result
+            observe_warmup_step(step=name, is_ok=result["ok"], seconds=result["seconds"])
+
+            if not result["ok"]:
+                logger.warning(f"Warm-up step {name} failed: {result['error']}")
+
+        self.warmup_status = "done"
+        logger.info(f"Warm-up done in {time.perf_counter() - warmup_started_at:.2f}s")
+
+    async def run(self, warmup_steps: dict, warmup_timeout_seconds: float):
+        await self.warm_up(warmup_steps, timeout_seconds=warmup_timeout_seconds)
+
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.error(f"Health checks failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self, warmup_steps: dict, warmup_timeout_seconds: float):
+        self.task = asyncio.create_task(self.run(warmup_steps, warmup_timeout_seconds))
+        return self.task
+
+    async def stop(self):
+        # not ready from now on: the load balancer stops sending requests while the worker drains
+        self.is_shutting_down = True
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def is_status_fresh(self):
+        # a few missed rounds are tolerated (a slow check), not a stuck checker
+        return self.checked_at is not None and \
+            time.monotonic() - self.checked_at <= 3 * self.interval_seconds + self.timeout_seconds
+
+    def is_ready(self):
+        if self.is_shutting_down or self.warmup_status != "done" or not self.is_status_fresh():
+            return False
+
+        return all(self.dependencies[name]["healthy"] for name in self.critical)
+
+    def get_status(self):
+        return {
+            "ready": self.is_ready(),
+            "warmup": {
+                "status": self.warmup_status,
+                "steps": self.warmup_steps,
+            },
+            "dependencies": self.dependencies,
+        }
+
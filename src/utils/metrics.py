@@ -1,36 +1,418 @@
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from fastapi import FastAPI, Request, Response  # type: ignore
-from starlette.middleware.base import BaseHTTPMiddleware # type: ignore
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry, REGISTRY, multiprocess
+from fastapi import FastAPI, Response  # type: ignore
+from starlette.routing import Match # type: ignore
+from starlette.types import ASGIApp, Message, Receive, Scope, Send # type: ignore
+import functools
+import inspect
+import os
 import time
 
+# prometheus_client switches to multiprocess mode when this env var is set
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+UNMATCHED_ROUTE = "<unmatched>"
+
+SIZE_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
 # Define metrics
 REQUEST_COUNT = Counter('http_requests_total', 'Total HTTP Requests', ['method', 'endpoint', 'status'])
 REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP Request Latency', ['method', 'endpoint'])
+REQUEST_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP Requests currently being served', ['method', 'endpoint'],
+    multiprocess_mode='livesum'
+)
+REQUEST_SIZE = Histogram(
+    'http_request_size_bytes', 'HTTP Request body size', ['method', 'endpoint'], buckets=SIZE_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'HTTP Response body size', ['method', 'endpoint'], buckets=SIZE_BUCKETS
+)
+
+REQUEST_CANCELLED = Counter(
+    'http_requests_cancelled_total', 'Requests cancelled before completion', ['method', 'endpoint', 'reason']
+)
+
+# admission control metrics (one series per route class, e.g. interactive, bulk)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'admission_queue_depth', 'Requests waiting for an admission slot', ['route_class'],
+    multiprocess_mode='livesum'
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight', 'Requests holding an admission slot', ['route_class'],
+    multiprocess_mode='livesum'
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    'admission_queue_wait_seconds', 'Time spent waiting for an admission slot', ['route_class', 'result'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+ADMISSION_SHED = Counter(
+    'admission_shed_total', 'Requests shed by admission control', ['route_class', 'reason']
+)
+
+# RAG pipeline metrics (one series per pipeline stage, e.g. query_embedding, vector_search, generation)
+RAG_STAGE_LATENCY = Histogram(
+    'rag_stage_duration_seconds', 'RAG pipeline stage latency', ['pipeline', 'stage', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+RAG_CHUNKS = Histogram(
+    'rag_chunks_count', 'Number of chunks handled per pipeline call', ['pipeline'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+
+# provider metrics (llm / embedding backends)
+PROVIDER_CALL_LATENCY = Histogram(
+    'llm_provider_call_duration_seconds', 'LLM provider call latency', ['backend', 'model', 'operation', 'status'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+PROVIDER_CALL_COUNT = Counter(
+    'llm_provider_calls_total', 'Total LLM provider calls', ['backend', 'model', 'operation', 'status']
+)
+PROVIDER_RETRIES = Counter(
+    'llm_provider_retries_total', 'LLM provider calls retried by the governor', ['backend', 'operation', 'reason']
+)
+PROVIDER_CONCURRENCY_LIMIT = Gauge(
+    'llm_provider_concurrency_limit', 'Current adaptive (AIMD) concurrency limit', ['backend'],
+    multiprocess_mode='livemax'
+)
+PROVIDER_CIRCUIT_OPEN = Gauge(
+    'llm_provider_circuit_open', '1 while the provider circuit breaker is open', ['backend'],
+    multiprocess_mode='livemax'
+)
+GENERATION_ROUTER_EVENTS = Counter(
+    'llm_generation_router_events_total', 'Hedged / failover generation requests', ['backend', 'event']
+)
+PROVIDER_TOKENS = Counter(
+    'llm_provider_tokens_total', 'Tokens consumed by LLM provider calls', ['backend', 'model', 'kind']
+)
+
+# embedding micro-batching: texts sent per multi-input provider call
+EMBEDDING_BATCH_SIZE = Histogram(
+    'embedding_batch_size', 'Number of texts sent in one batched embedding call',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+# single-flight: calls answered by an identical call that was already in flight
+SINGLE_FLIGHT_CALLS = Counter(
+    'single_flight_calls_total', 'Calls made through the single-flight layer', ['operation', 'result']
+)
+
+# chunk persistence (fast path): chunks written / rejected by the bulk inserts
+CHUNKS_PERSISTED = Counter(
+    'rag_chunks_persisted_total', 'Chunks written to MongoDB by the bulk insert path', ['result']
+)
+CHUNKS_DEDUPLICATED = Counter(
+    'rag_chunks_deduplicated_total', 'Chunks checked for near-duplicates at ingest', ['result']
+)
+
+# blue-green index rebuilds
+INDEX_REBUILDS = Counter(
+    'rag_index_rebuilds_total', 'Project index rebuilds by outcome', ['result']
+)
+INDEX_REBUILD_DURATION = Histogram(
+    'rag_index_rebuild_duration_seconds', 'Time to build and verify a project index version', ['result'],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+)
+
+# worker health: last background check of each dependency, startup warm-up steps
+DEPENDENCY_UP = Gauge(
+    'dependency_up', '1 while the dependency passed its last health check', ['dependency'],
+    multiprocess_mode='livemin'
+)
+WARMUP_STEP_DURATION = Histogram(
+    'warmup_step_duration_seconds', 'Startup warm-up step duration', ['step', 'result'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+# mongodb model operations
+DB_OPERATION_LATENCY = Histogram(
+    'mongodb_operation_duration_seconds', 'MongoDB model operation latency', ['collection', 'operation', 'status'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+class _MetricsState:
+    enabled: bool = True
+
+metrics_state = _MetricsState()
+
+
+class _NoopTimer:
+    """
+    Shared do-nothing timer returned while metrics are disabled,
+    so instrumented code pays for one attribute lookup and nothing else.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer:
+
+    def __init__(self, histogram: Histogram, counter: Counter = None, labels: dict = None):
+        self.histogram = histogram
+        self.counter = counter
+        self.labels = labels or {}
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        status = "error" if exc_type else "success"
+
+        self.histogram.labels(status=status, **self.labels).observe(duration)
+        if self.counter is not None:
+            self.counter.labels(status=status, **self.labels).inc()
+
+        return False
+
+
+class track_latency:
+    """
+    Time a block of code (or a sync/async function) into `histogram`.
+
+    Usable both as a context manager:
+        with track_latency(RAG_STAGE_LATENCY, pipeline="answer", stage="generation"):
+            ...
+
+    and as a decorator:
+        @track_latency(DB_OPERATION_LATENCY, collection="chunks", operation="insert_many")
+        async def insert_many_chunk_records_in_db(...): ...
+
+    A `status` label ("success" / "error") is added automatically.
+    """
+
+    def __init__(self, histogram: Histogram, counter: Counter = None, **labels):
+        self.histogram = histogram
+        self.counter = counter
+        self.labels = labels
+        self._timers = []
+
+    def timer(self):
+        if not metrics_state.enabled:
+            return _NOOP_TIMER
+        return _Timer(self.histogram, self.counter, self.labels)
+
+    def __enter__(self):
+        timer = self.timer()
+        self._timers.append(timer)
+        return timer.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._timers.pop().__exit__(exc_type, exc, tb)
+
+    def __call__(self, func):
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self.timer():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.timer():
+                return func(*args, **kwargs)
+        return wrapper
+
 
-class PrometheusMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+def track_stage(pipeline: str, stage: str):
+    return track_latency(RAG_STAGE_LATENCY, pipeline=pipeline, stage=stage)
 
-        start_time = time.time()
+def track_provider_call(backend: str, model: str, operation: str):
+    return track_latency(PROVIDER_CALL_LATENCY, PROVIDER_CALL_COUNT,
+                         backend=backend, model=model or "unset", operation=operation)
 
-        # Process the request
-        response = await call_next(request)
+def track_db_operation(collection: str, operation: str):
+    return track_latency(DB_OPERATION_LATENCY, collection=collection, operation=operation)
 
-        # Record metrics after request is processed
-        duration = time.time() - start_time
-        endpoint = request.url.path
+def observe_chunks(pipeline: str, count: int):
+    if metrics_state.enabled:
+        RAG_CHUNKS.labels(pipeline=pipeline).observe(count)
 
-        REQUEST_LATENCY.labels(method=request.method, endpoint=endpoint).observe(duration)
-        REQUEST_COUNT.labels(method=request.method, endpoint=endpoint, status=response.status_code).inc()
+def observe_chunks_persisted(inserted: int, failed: int):
+    if metrics_state.enabled:
+        CHUNKS_PERSISTED.labels(result="inserted").inc(inserted)
+        CHUNKS_PERSISTED.labels(result="failed").inc(failed)
 
-        return response
-    
-def setup_metrics(app: FastAPI):
+def observe_chunks_deduplicated(checked: int, duplicates: int):
+    if metrics_state.enabled:
+        CHUNKS_DEDUPLICATED.labels(result="duplicate").inc(duplicates)
+        CHUNKS_DEDUPLICATED.labels(result="canonical").inc(checked - duplicates)
+
+def observe_index_rebuild(result: str, seconds: float):
+    if metrics_state.enabled:
+        INDEX_REBUILDS.labels(result=result).inc()
+        INDEX_REBUILD_DURATION.labels(result=result).observe(seconds)
+
+def observe_dependency_health(dependency: str, is_healthy: bool):
+    if metrics_state.enabled:
+        DEPENDENCY_UP.labels(dependency=dependency).set(1 if is_healthy else 0)
+
+def observe_warmup_step(step: str, is_ok: bool, seconds: float):
+    if metrics_state.enabled:
+        WARMUP_STEP_DURATION.labels(step=step, result="ok" if is_ok else "failed").observe(seconds)
+
+def observe_request_cancelled(scope: Scope, reason: str):
+    if metrics_state.enabled:
+        REQUEST_CANCELLED.labels(method=scope["method"], endpoint=get_route_template(scope), reason=reason).inc()
+
+def observe_admission_queue(route_class: str, depth: int, in_flight: int):
+    if metrics_state.enabled:
+        ADMISSION_QUEUE_DEPTH.labels(route_class=route_class).set(depth)
+        ADMISSION_IN_FLIGHT.labels(route_class=route_class).set(in_flight)
+
+def observe_admission_wait(route_class: str, result: str, seconds: float):
+    if metrics_state.enabled:
+        ADMISSION_QUEUE_WAIT.labels(route_class=route_class, result=result).observe(seconds)
+
+def observe_admission_shed(route_class: str, reason: str):
+    if metrics_state.enabled:
+        ADMISSION_SHED.labels(route_class=route_class, reason=reason).inc()
+
+def observe_provider_retry(backend: str, operation: str, reason: str):
+    if metrics_state.enabled:
+        PROVIDER_RETRIES.labels(backend=backend, operation=operation, reason=reason).inc()
+
+def observe_provider_governor_state(backend: str, concurrency_limit: float, circuit_open: bool):
+    if metrics_state.enabled:
+        PROVIDER_CONCURRENCY_LIMIT.labels(backend=backend).set(concurrency_limit)
+        PROVIDER_CIRCUIT_OPEN.labels(backend=backend).set(1 if circuit_open else 0)
+
+def observe_generation_router_event(backend: str, event: str):
+    if metrics_state.enabled:
+        GENERATION_ROUTER_EVENTS.labels(backend=backend, event=event).inc()
+
+def observe_embedding_batch(size: int):
+    if metrics_state.enabled:
+        EMBEDDING_BATCH_SIZE.observe(size)
+
+def observe_single_flight(operation: str, coalesced: bool):
+    if metrics_state.enabled:
+        SINGLE_FLIGHT_CALLS.labels(operation=operation, result="coalesced" if coalesced else "executed").inc()
+
+def observe_tokens(backend: str, model: str, input_tokens: int = None, output_tokens: int = None):
+    if not metrics_state.enabled:
+        return
+
+    if input_tokens:
+        PROVIDER_TOKENS.labels(backend=backend, model=model or "unset", kind="input").inc(input_tokens)
+    if output_tokens:
+        PROVIDER_TOKENS.labels(backend=backend, model=model or "unset", kind="output").inc(output_tokens)
+
+
+class PrometheusMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware), so streaming responses are
+    passed through untouched and there's no extra task per request.
+
+    Requests are labelled by route template (e.g. `/api/v1/nlp/index/search/{project_id}`)
+    instead of the raw path, which keeps the number of series bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        endpoint = get_route_template(scope)
+        status_code = 500
+        request_size = 0
+        response_size = 0
+
+        async def receive_wrapper():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = REQUEST_IN_PROGRESS.labels(method=method, endpoint=endpoint)
+        in_progress.inc()
+        start_time = time.perf_counter()
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            # Record metrics after request is processed
+            duration = time.perf_counter() - start_time
+            in_progress.dec()
+
+            REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(duration)
+            REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status_code).inc()
+            REQUEST_SIZE.labels(method=method, endpoint=endpoint).observe(request_size)
+            RESPONSE_SIZE.labels(method=method, endpoint=endpoint).observe(response_size)
+
+
+def get_route_template(scope: Scope) -> str:
+    """
+    Resolve the path template of the route that will handle this request.
+    Unknown paths collapse into a single label so 404 scans can't grow the registry.
+    """
+    app = scope.get("app")
+    routes = getattr(getattr(app, "router", None), "routes", [])
+
+    partial_match = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial_match is None:
+            partial_match = route.path
+
+    return partial_match or UNMATCHED_ROUTE
+
+
+def get_metrics_registry():
+    """
+    In multiprocess mode (uvicorn/gunicorn with several workers), each worker writes
+    its samples to PROMETHEUS_MULTIPROC_DIR, and a scrape aggregates all of them.
+    """
+    if not os.environ.get(MULTIPROC_DIR_ENV):
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_worker_dead():
+    # drop the live gauges of this worker from the aggregated view on shutdown
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def setup_metrics(app: FastAPI, enabled: bool = True):
     """
     Setup Prometheus metrics middleware and endpoint
     """
+    metrics_state.enabled = enabled
+    if not enabled:
+        return
+
     # Add Prometheus middleware
     app.add_middleware(PrometheusMiddleware)
 
     @app.get("/metrics", include_in_schema=False)
     def metrics():
-        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
\ No newline at end of file
+        return Response(generate_latest(get_metrics_registry()), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+
+# LLM provider calls are blocking and may wait a long time before even starting (governor slot,
+# rate limits, retry backoff): they get threads of their own, the default executor is left to
+# the short blocking calls (vector db, storage, parsing, health checks)
+_executor = None
+
+
+def setup_provider_threads(max_workers: int):
+    global _executor
+    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-provider")
+    return _executor
+
+def shutdown_provider_threads():
+    global _executor
+    if _executor is not None:
+        # a call still running in a thread can't be interrupted, only the queued ones are dropped
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def run_provider_call(func, *args, **kwargs):
+    """
+    `asyncio.to_thread` for the calls reaching an LLM provider: same context propagation
+    (request deadline, trace span), but on the provider threads (the default executor until they're set up).
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(_executor, call)
@@ -0,0 +1,85 @@
+from .metrics import observe_single_flight
+from .deadline import DeadlineExceededError, get_remaining_seconds
+import asyncio
+import contextvars
+import hashlib
+import json
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls: while a call for a key is in flight, later
+    callers with the same key await its result instead of starting their own.
+    Nothing is cached, the key is released as soon as the call finishes (or fails).
+    Not thread-safe on purpose, it's meant to be used from the event loop only.
+
+    The shared call runs outside of any request (no request deadline): each caller waits for it
+    within its own deadline, and the call is cancelled once every caller gave up.
+    """
+
+    def __init__(self):
+        # {key: asyncio.Future}
+        self.in_flight = {}
+        # {key: callers waiting for the call}
+        self.waiters = {}
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        return " ".join(str(text).split()).casefold()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        # parts may hold long prompts or whole chat histories, the key is kept short
+        raw_key = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    async def do(self, key: str, operation: str, func, *args, **kwargs):
+        """
+        Await `func(*args, **kwargs)` (a coroutine function), or the identical call already in flight,
+        within the caller's request deadline (DeadlineExceededError on expiry).
+        """
+        future = self.in_flight.get(key)
+        if future is not None:
+            observe_single_flight(operation=operation, coalesced=True)
+        else:
+            observe_single_flight(operation=operation, coalesced=False)
+
+            # started from an empty context: the call doesn't inherit the deadline of the caller starting it
+            future = contextvars.Context().run(asyncio.ensure_future, func(*args, **kwargs))
+            self.in_flight[key] = future
+            self.waiters[key] = 0
+            future.add_done_callback(lambda done_future: self.release(key, done_future))
+
+        return await self.wait(key, future, operation)
+
+    async def wait(self, key: str, future: asyncio.Future, operation: str):
+        remaining = get_remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceededError(operation)
+
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            # shield: a caller giving up must not cancel the call the others are waiting for
+            return await asyncio.wait_for(asyncio.shield(future), timeout=remaining)
+        except asyncio.TimeoutError:
+            if future.done():
+                # the call itself timed out
+                raise
+            raise DeadlineExceededError(operation)
+        finally:
+            if self.in_flight.get(key) is future:
+                self.waiters[key] -= 1
+                if self.waiters[key] <= 0 and not future.done():
+                    # nobody is waiting for the result anymore
+                    future.cancel()
+
+    def release(self, key: str, future: asyncio.Future):
+        if self.in_flight.get(key) is future:
+            self.in_flight.pop(key, None)
+            self.waiters.pop(key, None)
+
+        # mark the exception as retrieved, every waiter may have been cancelled already
+        if not future.cancelled():
+            future.exception()
+
+    def __len__(self):
+        return len(self.in_flight)
@@ -0,0 +1,218 @@
+from opentelemetry import trace, propagate # type: ignore
+from opentelemetry.sdk.resources import Resource # type: ignore
+from opentelemetry.sdk.trace import TracerProvider # type: ignore
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter # type: ignore
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased # type: ignore
+from opentelemetry.trace import SpanKind, Status, StatusCode # type: ignore
+from fastapi import FastAPI # type: ignore
+from starlette.types import ASGIApp, Message, Receive, Scope, Send # type: ignore
+from .metrics import get_route_template
+import functools
+import inspect
+import logging
+import os
+
+TRACE_ID_HEADER = b"x-trace-id"
+
+tracer = trace.get_tracer("legal-rag-chatbot")
+
+
+class traced:
+    """
+    Open a span around a block of code (or a sync/async function).
+
+    Usable both as a context manager:
+        with traced("rag.answer.generation", {"llm.model": model_id}):
+            ...
+
+    and as a decorator:
+        @traced("mongodb.insert_many_chunk_records_in_db")
+        async def insert_many_chunk_records_in_db(...): ...
+
+    Exceptions are recorded on the span and re-raised. While no tracer provider is
+    configured (TRACING_ENABLED=false) the OpenTelemetry API hands out non-recording spans.
+    """
+
+    def __init__(self, name: str, attributes: dict = None, kind: SpanKind = SpanKind.INTERNAL):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self._spans = []
+
+    def span(self):
+        return tracer.start_as_current_span(self.name, kind=self.kind, attributes=self.attributes)
+
+    def __enter__(self):
+        span = self.span()
+        self._spans.append(span)
+        return span.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._spans.pop().__exit__(exc_type, exc, tb)
+
+    def __call__(self, func):
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self.span():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.span():
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def set_span_attributes(**attributes):
+    # attach attributes only known at call time (model ids, result counts, ...) to the current span
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({ k: v for k, v in attributes.items() if v is not None })
+
+
+def get_trace_id() -> str:
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None
+    return format(span_context.trace_id, "032x")
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware that opens the server span of each HTTP request.
+    An incoming W3C `traceparent` header is honoured, and the trace id is
+    returned in the `X-Trace-Id` response header so a slow request can be looked up.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = { k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", []) }
+        endpoint = get_route_template(scope)
+
+        with tracer.start_as_current_span(
+            f"{scope['method']} {endpoint}",
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={
+                "http.request.method": scope["method"],
+                "http.route": endpoint,
+                "url.path": scope["path"],
+            },
+        ) as span:
+            trace_id = get_trace_id()
+
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    span.set_attribute("http.response.status_code", status_code)
+                    if status_code >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+
+                    if trace_id:
+                        message["headers"] = list(message.get("headers", [])) + [(TRACE_ID_HEADER, trace_id.encode())]
+
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+
+class FileSpanExporter(ConsoleSpanExporter):
+    """
+    Write finished spans as JSON lines to a local file, so traces can be
+    inspected without running a collector.
+    """
+
+    def __init__(self, file_path: str, service_name: str = None):
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        self.file = open(file_path, "a", encoding="utf-8")
+
+        super().__init__(
+            service_name=service_name,
+            out=self.file,
+            formatter=lambda span: span.to_json(indent=None) + os.linesep,
+        )
+
+    def shutdown(self):
+        self.file.close()
+
+
+def create_span_exporter(exporter: str, file_path: str = None, otlp_endpoint: str = None,
+                         service_name: str = None):
+
+    if exporter == "otlp":
+        # imported lazily, the http exporter is only needed when a collector is configured
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter # type: ignore
+        return OTLPSpanExporter(endpoint=otlp_endpoint) if otlp_endpoint else OTLPSpanExporter()
+
+    if exporter == "console":
+        return ConsoleSpanExporter(service_name=service_name)
+
+    return FileSpanExporter(file_path=file_path, service_name=service_name)
+
+
+class TraceContextFormatter(logging.Formatter):
+    """
+    Wrap an existing handler formatter and append the current `trace_id` / `span_id`,
+    so log lines emitted while serving a request can be joined with its trace.
+    """
+
+    def __init__(self, formatter: logging.Formatter = None):
+        super().__init__()
+        self.formatter = formatter or logging.Formatter("%(levelname)s:     %(name)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = self.formatter.format(record)
+
+        span_context = trace.get_current_span().get_span_context()
+        if not span_context.is_valid:
+            return message
+
+        return f"{message} [trace_id={span_context.trace_id:032x} span_id={span_context.span_id:016x}]"
+
+
+def setup_log_correlation(logger_names: list = ("", "uvicorn", "uvicorn.access")):
+
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO)
+
+    for logger_name in logger_names:
+        for handler in logging.getLogger(logger_name).handlers:
+            if not isinstance(handler.formatter, TraceContextFormatter):
+                handler.setFormatter(TraceContextFormatter(handler.formatter))
+
+
+def setup_tracing(app: FastAPI, enabled: bool = False, service_name: str = None,
+                  sample_ratio: float = 1.0, exporter: str = "file",
+                  file_path: str = None, otlp_endpoint: str = None):
+    """
+    Setup the tracer provider (parent based ratio sampling), the span exporter,
+    the HTTP tracing middleware and trace-id log correlation
+    """
+    if not enabled:
+        return None
+
+    provider = TracerProvider(
+        resource=Resource.create({ "service.name": service_name or "legal-rag-chatbot" }),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    provider.add_span_processor(
+        BatchSpanProcessor(
+            create_span_exporter(exporter=exporter, file_path=file_path,
+                                 otlp_endpoint=otlp_endpoint, service_name=service_name)
+        )
+    )
+    trace.set_tracer_provider(provider)
+
+    app.add_middleware(TracingMiddleware)
+    setup_log_correlation()
+
+    return provider
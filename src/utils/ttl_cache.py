@@ -0,0 +1,47 @@
+from collections import OrderedDict
+import time
+
+class TTLCache:
+    """
+    Small in-process LRU cache whose entries expire after `ttl_seconds`.
+    Not thread-safe on purpose, it's meant to be used from the event loop only.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.items = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self.items.get(key)
+        if item is None:
+            return default
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self.items[key]
+            return default
+
+        self.items.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl_seconds: float = None):
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+
+        self.items[key] = (time.monotonic() + ttl_seconds, value)
+        self.items.move_to_end(key)
+
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def delete(self, key):
+        self.items.pop(key, None)
+
+    def clear(self):
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return self.get(key) is not None